@@ -0,0 +1,111 @@
+# benchmarks/bench_approx.py
+"""
+Benchmark: speed-up vs. accuracy of approximate aggregates (src/approximate.py)
+at several sampling rates, for BERNOULLI and SYSTEM sampling.
+
+Builds a scaled copy of order_details (every line repeated --scale times, with
+quantities jittered) in a scratch schema through the admin connection from
+.env, runs each query exactly and sampled, and reports the median time, the
+relative error of every estimate and whether the interval covered the exact
+value. The schema is dropped afterwards unless --keep is given.
+
+Usage:
+    python benchmarks/bench_approx.py [--scale 500] [--rates 0.5,1,5,10] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src import approximate, database  # noqa: E402
+
+SCHEMA = "bench_approx"
+
+QUERIES = {
+    "totals": "SELECT COUNT(*) AS lines, SUM(quantity) AS units, AVG(unit_price) AS avg_price FROM order_details",
+    "by product": (
+        "SELECT product_id, SUM(quantity * unit_price) AS revenue FROM order_details "
+        "GROUP BY product_id ORDER BY product_id"
+    ),
+}
+
+
+def build(conn, scale):
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    conn.execute(text(f"""
+        CREATE TABLE {SCHEMA}.order_details AS
+        SELECT od.order_id + rep * 100000 AS order_id, od.product_id, od.unit_price,
+               (od.quantity + (random() * 10)::int) AS quantity, od.discount
+        FROM public.order_details od CROSS JOIN generate_series(1, :scale) AS rep
+    """), {"scale": scale})
+    conn.execute(text(f"ANALYZE {SCHEMA}.order_details"))
+    return conn.execute(text(f"SELECT COUNT(*) FROM {SCHEMA}.order_details")).scalar()
+
+
+def timed(conn, sql, repeat):
+    times, rows = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = conn.execute(text(sql)).mappings().all()
+        times.append((time.perf_counter() - t0) * 1e3)
+    return statistics.median(times), rows
+
+
+def compare(exact, sampled_rows, intervals, key):
+    """(max relative error, fraction of intervals covering the exact value) over all groups."""
+    by_key = {tuple(r[k] for k in key): r for r in sampled_rows}
+    errors, covered, total = [], 0, 0
+    for row in exact:
+        sampled = by_key.get(tuple(row[k] for k in key))
+        for col, (low, high) in intervals.items():
+            total += 1
+            if sampled is None:  # group missing from the sample
+                errors.append(1.0)
+                continue
+            truth = float(row[col])
+            errors.append(abs(float(sampled[col]) - truth) / abs(truth) if truth else 0.0)
+            covered += float(sampled[low]) <= truth <= float(sampled[high])
+    return max(errors), covered / total
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, default=500)
+    ap.add_argument("--rates", default="0.5,1,5,10")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--keep", action="store_true")
+    args = ap.parse_args()
+    rates = [float(r) for r in args.rates.split(",")]
+
+    with database.admin_engine.connect() as conn:
+        rows = build(conn, args.scale)
+        conn.commit()
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        print(f"order_details: {rows} rows")
+        try:
+            for name, sql in QUERIES.items():
+                key = [c for c in ("product_id",) if c in sql]
+                exact_ms, exact = timed(conn, sql, args.repeat)
+                print(f"\n{name}: exact {exact_ms:.1f} ms")
+                print(f"{'method':<10} {'rate':>6} {'ms':>8} {'speed-up':>9} {'max err':>8} {'covered':>8}")
+                for method in ("BERNOULLI", "SYSTEM"):
+                    for rate in rates:
+                        approx = approximate.rewrite(sql, percent=rate, method=method, row_estimates={"order_details": rows})
+                        ms, sampled = timed(conn, approx.sql, args.repeat)
+                        err, coverage = compare(exact, sampled, approx.intervals, key)
+                        print(f"{method.lower():<10} {rate:>5}% {ms:>8.1f} {exact_ms / ms:>8.1f}x {err:>7.2%} {coverage:>7.0%}")
+        finally:
+            conn.rollback()
+            if not args.keep:
+                conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+                conn.commit()
+
+
+if __name__ == "__main__":
+    main()
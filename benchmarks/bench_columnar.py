@@ -0,0 +1,59 @@
+# benchmarks/bench_columnar.py
+"""
+Benchmark: retained memory and JSON payload size of a query result as a list
+of dicts vs. the columnar shape (column header + per-column arrays).
+
+Runs against the readonly database from .env; order lines are repeated with
+generate_series to reach the requested row count.
+
+Usage:
+    python benchmarks/bench_columnar.py [--rows 10000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from src import database  # noqa: E402
+
+SQL = """
+SELECT od.order_id, od.product_id, od.unit_price, od.quantity, od.discount
+FROM order_details od CROSS JOIN generate_series(1, 20) AS rep
+ORDER BY rep, od.order_id, od.product_id
+"""
+
+
+def measure(label, columnar, rows):
+    database.cache_clear()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = database.run_readonly(SQL, row_limit=rows, columnar=columnar)
+    elapsed_ms = (time.perf_counter() - t0) * 1e3
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    body = result.to_json() if columnar else jsonable_encoder(result)
+    payload = len(json.dumps(body, separators=(",", ":")).encode("utf-8"))
+    print(f"{label:<10} rows={len(result):>6} {elapsed_ms:>8.1f} ms {retained / 1024:>9.0f} KiB retained {payload / 1024:>8.0f} KiB JSON")
+    return retained, payload
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10000)
+    args = ap.parse_args()
+
+    database.run_readonly("SELECT 1")  # warm the pool outside the measurement
+    mem_rows, json_rows = measure("rows", False, args.rows)
+    mem_cols, json_cols = measure("columnar", True, args.rows)
+    print(f"memory: {mem_rows / mem_cols:.1f}x smaller, payload: {json_rows / json_cols:.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_example_store.py
+"""
+Microbenchmark: few-shot retrieval latency as the example corpus grows.
+
+Builds synthetic corpora of 1k, 5k and 20k examples (the real corpus file
+first, then generated variations) and times ExampleStore.top_k per question.
+
+Usage:
+    python benchmarks/bench_example_store.py [--iterations 2000] [--k 3]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.example_store import FEW_SHOT_PATH, ExampleStore, load_examples  # noqa: E402
+
+QUESTIONS = [
+    "What are the top 5 customers by total sales amount?",
+    "How many orders did each employee handle in 1997?",
+    "Which products in the Beverages category are discontinued?",
+    "Average freight per shipper by month",
+]
+_SUBJECTS = ["customers", "orders", "products", "employees", "shippers", "categories", "order lines", "suppliers"]
+_MEASURES = ["total sales", "order count", "average freight", "quantity sold", "revenue", "discount", "unit price"]
+_GROUPS = ["country", "city", "month", "year", "category", "employee", "shipper", "product"]
+_FILTERS = ["in 1997", "in Germany", "last quarter", "above average", "for discontinued items", "", "in France"]
+
+
+def synthetic_corpus(n: int) -> list[dict]:
+    rng = random.Random(42)
+    examples = load_examples(FEW_SHOT_PATH)
+    while len(examples) < n:
+        s, m, g, f = rng.choice(_SUBJECTS), rng.choice(_MEASURES), rng.choice(_GROUPS), rng.choice(_FILTERS)
+        top = rng.choice(["", f"top {rng.randint(3, 20)} "])
+        q = f"Show {top}{s} by {m} per {g} {f}".strip()
+        examples.append({"q": q, "sql": f"SELECT /* {len(examples)} */ 1"})
+    return examples[:n]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iterations", type=int, default=2000)
+    ap.add_argument("--k", type=int, default=3)
+    args = ap.parse_args()
+
+    for n in (1_000, 5_000, 20_000):
+        t0 = time.perf_counter()
+        store = ExampleStore(synthetic_corpus(n))
+        build_ms = (time.perf_counter() - t0) * 1e3
+        for q in QUESTIONS:
+            store.top_k(q, args.k)  # warm-up
+        t0 = time.perf_counter()
+        for i in range(args.iterations):
+            store.top_k(QUESTIONS[i % len(QUESTIONS)], args.k)
+        us = (time.perf_counter() - t0) / args.iterations * 1e6
+        print(f"examples={n:>6}  build {build_ms:>8.1f} ms  top_{args.k} {us:>8.1f} us/question")
+
+
+if __name__ == "__main__":
+    main()
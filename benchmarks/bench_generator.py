@@ -0,0 +1,113 @@
+# benchmarks/bench_generator.py
+"""
+Microbenchmark: per-request client-side cost of building a Gemini call.
+
+Compares the old per-call work in generate_sql (configure the SDK, rebuild the
+few-shot list and examples string, render the whole prompt, construct a model
+handle) with the long-lived GeminiGenerator (prompt concat + cached handle), both
+with the same fixed examples. Example retrieval (src/example_store.py) is work the
+legacy path never did, so it is timed on its own rather than folded into either.
+No network calls are made; generate_content is never invoked.
+
+Usage:
+    python benchmarks/bench_generator.py [--iterations 20000] [--fake-sdk]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.example_store import FEW_SHOT_K, FEW_SHOT_PATH, get_example_store, load_examples, render_example  # noqa: E402
+from src.text2sql_engine import PROMPT_TEMPLATE, SCHEMA_HINT, GeminiGenerator  # noqa: E402
+
+QUESTION = "What are the top 5 customers by total sales amount?"
+MODEL = "models/gemini-1.5-flash-002"
+# the fixed examples every prompt used to inline (the head of the corpus file)
+LEGACY_FEW_SHOTS = load_examples(FEW_SHOT_PATH)[:7]
+
+
+def _fake_genai():
+    class GenerativeModel:
+        def __init__(self, name):
+            self.model_name = name
+
+    return types.SimpleNamespace(configure=lambda **kw: None, GenerativeModel=GenerativeModel)
+
+
+class _FixedExamples:
+    """Stands in for the ExampleStore: always the legacy examples, no retrieval."""
+
+    def __init__(self, examples):
+        self._block = "\n\n".join(render_example(ex) for ex in examples)
+
+    def render(self, question, k=FEW_SHOT_K):
+        return self._block
+
+
+def legacy_request(genai):
+    """What generate_sql did on every real-path call before GeminiGenerator."""
+    genai.configure(api_key="bench-key")
+    shots = [dict(ex) for ex in LEGACY_FEW_SHOTS]  # list literal rebuilt per call
+    examples = "\n\n".join([f"Q: {ex['q']}\nSQL: {ex['sql'].strip()}" for ex in shots])
+    prompt = PROMPT_TEMPLATE.format(schema_hint=SCHEMA_HINT, examples=examples, question=QUESTION)
+    model = genai.GenerativeModel(MODEL)
+    return prompt, model
+
+
+def generator_request(gen):
+    return gen.prompt(QUESTION), gen.model(MODEL)
+
+
+def measure(label, fn, iterations):
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    cpu_us = (time.perf_counter() - t0) / iterations * 1e6
+
+    # transient allocation: peak traced memory above baseline during one request
+    tracemalloc.start()
+    sample = max(1, iterations // 20)
+    peak_total = 0
+    for _ in range(sample):
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - base
+    tracemalloc.stop()
+    alloc_bytes = peak_total / sample
+
+    print(f"{label:<18} {cpu_us:>10.2f} us/req {alloc_bytes:>10.0f} B peak alloc/req")
+    return cpu_us
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iterations", type=int, default=20000)
+    ap.add_argument("--fake-sdk", action="store_true", help="use a stand-in SDK instead of google.generativeai")
+    args = ap.parse_args()
+
+    if args.fake_sdk:
+        genai = _fake_genai()
+    else:
+        import google.generativeai as genai
+
+    gen = GeminiGenerator("bench-key", MODEL, genai=genai, examples=_FixedExamples(LEGACY_FEW_SHOTS))
+    store = get_example_store()
+    print(f"iterations={args.iterations} sdk={'fake' if args.fake_sdk else 'google.generativeai'}")
+    assert gen.prompt(QUESTION) == legacy_request(genai)[0], "fixed-example prompts must match the legacy prompt"
+    retrieved = GeminiGenerator("bench-key", MODEL, genai=genai, examples=store).prompt(QUESTION)
+    print(f"prompt chars: fixed examples {len(gen.prompt(QUESTION))}, retrieved examples {len(retrieved)}")
+    old = measure("legacy per-call", lambda: legacy_request(genai), args.iterations)
+    new = measure("GeminiGenerator", lambda: generator_request(gen), args.iterations)
+    print(f"prompt building speed-up: {old / new:.1f}x")
+    measure("example retrieval", lambda: store.render(QUESTION, FEW_SHOT_K), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
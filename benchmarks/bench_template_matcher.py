@@ -0,0 +1,89 @@
+# benchmarks/bench_template_matcher.py
+"""
+Benchmark: stub template lookup, linear if-chain vs compiled TemplateMatcher.
+
+Builds template sets of 10, 1k and 10k entries (the shipped templates plus
+synthetic ones of the same shape) and times lookups for questions that hit an
+early template, a late template, and nothing at all.
+
+Usage:
+    python benchmarks/bench_template_matcher.py [--lookups 2000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.template_matcher import TemplateMatcher  # noqa: E402
+from src.text2sql_engine import STUB_TEMPLATES_PATH  # noqa: E402
+
+METRICS = ["revenue", "freight", "quantity", "discount", "orders", "price", "margin", "units"]
+DIMS = ["region", "city", "shipper", "employee", "category", "supplier", "quarter", "week"]
+
+
+def load_templates(n: int) -> list[dict]:
+    with open(STUB_TEMPLATES_PATH, encoding="utf-8") as f:
+        base = json.load(f)
+    rnd = random.Random(7)
+    out = list(base)
+    i = 0
+    while len(out) < n:
+        m, d = rnd.choice(METRICS), rnd.choice(DIMS)
+        out.append({
+            "match": [[f"{m} by {d} #{i}"], [f"kpi{i}", d]],
+            "sql": f"SELECT {i} AS template_id",
+        })
+        i += 1
+    return out[:n]
+
+
+def if_chain(templates: list[dict]):
+    """Equivalent of the original _stub_generate: test every clause in order."""
+    def lookup(question: str):
+        q = question.lower().strip()
+        for tpl in templates:
+            for clause in tpl["match"]:
+                if all(p in q for p in clause):
+                    return tpl["sql"]
+        return None
+    return lookup
+
+
+def time_lookups(fn, questions, lookups):
+    t0 = time.perf_counter()
+    for i in range(lookups):
+        fn(questions[i % len(questions)])
+    return (time.perf_counter() - t0) / lookups * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lookups", type=int, default=2000)
+    args = ap.parse_args()
+
+    print(f"{'templates':>9} {'case':<6} {'if-chain us':>12} {'matcher us':>11} {'build ms':>9}")
+    for n in (10, 1_000, 10_000):
+        templates = load_templates(n)
+        last = templates[-1]["match"][0][0]
+        cases = {
+            "early": ["List customers by name, please"],
+            "late": [f"Show me {last} for last year"],
+            "miss": ["How many widgets did we sell on Mars?"],
+        }
+        t0 = time.perf_counter()
+        matcher = TemplateMatcher(templates)
+        build_ms = (time.perf_counter() - t0) * 1e3
+        chain = if_chain(templates)
+        for case, questions in cases.items():
+            assert chain(questions[0]) == matcher.match(questions[0])
+            chain_us = time_lookups(chain, questions, args.lookups)
+            match_us = time_lookups(matcher.match, questions, args.lookups)
+            print(f"{n:>9} {case:<6} {chain_us:>12.2f} {match_us:>11.2f} {build_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
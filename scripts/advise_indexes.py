@@ -0,0 +1,40 @@
+"""
+Recommend indexes for the recorded workload (see src/index_advisor.py).
+
+    python scripts/advise_indexes.py --log logs/workload.jsonl [--log more.jsonl] [--out indexes.sql]
+
+The workload logs are written by the API when WORKLOAD_LOG_PATH is set. Run this
+against a copy of production (same data volume): the advisor needs the table owner
+and, without the hypopg extension, briefly builds each candidate inside a rolled
+back transaction. Nothing is created; review the script and apply it with psql.
+"""
+import argparse
+
+from sqlalchemy import create_engine
+from dotenv import load_dotenv
+from src import index_advisor
+from src.utils import require_env
+
+load_dotenv()
+url = require_env("DATABASE_URL")
+engine = create_engine(url, pool_pre_ping=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", action="append", required=True, help="workload log (JSON lines); repeatable")
+    parser.add_argument("--out", help="write the DDL script here instead of stdout")
+    parser.add_argument("--max-indexes", type=int, default=index_advisor.MAX_INDEXES)
+    args = parser.parse_args()
+
+    entries = index_advisor.load_workload(args.log)
+    with engine.connect() as c:
+        advice = index_advisor.advise(c, entries, max_indexes=args.max_indexes)
+        c.rollback()
+    script = index_advisor.render_ddl(advice)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(script)
+        print(f"✅ {len(advice.recommendations)} index(es) for {len(advice.queries)} query shapes written to {args.out}.")
+    else:
+        print(script, end="")
@@ -0,0 +1,59 @@
+"""
+Install statement-level triggers that pg_notify('table_changes', <table>) on
+INSERT/UPDATE/DELETE/TRUNCATE of every table in the public schema. API workers
+started with QUERY_CACHE_LISTEN=1 listen on that channel and drop cached
+results for the changed table immediately (see src/table_changes.py).
+
+Re-run after adding tables. Pass --drop to remove the triggers again.
+"""
+import sys
+
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+from src.utils import require_env
+
+load_dotenv()
+url = require_env("DATABASE_URL")
+engine = create_engine(url, pool_pre_ping=True)
+
+FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM pg_notify('table_changes', TG_TABLE_NAME);
+  RETURN NULL;
+END$$;
+"""
+
+TABLES_SQL = """
+SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+ORDER BY c.relname
+"""
+
+
+def install(conn, tables):
+    conn.execute(text(FUNCTION_SQL))
+    for t in tables:
+        conn.execute(text(f'DROP TRIGGER IF EXISTS table_change_notify ON "{t}"'))
+        conn.execute(text(
+            f'CREATE TRIGGER table_change_notify AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{t}" '
+            "FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change()"
+        ))
+
+
+def drop(conn, tables):
+    for t in tables:
+        conn.execute(text(f'DROP TRIGGER IF EXISTS table_change_notify ON "{t}"'))
+    conn.execute(text("DROP FUNCTION IF EXISTS notify_table_change()"))
+
+
+if __name__ == "__main__":
+    with engine.begin() as c:
+        tables = [r[0] for r in c.execute(text(TABLES_SQL))]
+        if "--drop" in sys.argv:
+            drop(c, tables)
+            print(f"✅ Change triggers removed from {len(tables)} tables.")
+        else:
+            install(c, tables)
+            print(f"✅ Change triggers installed on {len(tables)} tables: {', '.join(tables)}")
@@ -0,0 +1,33 @@
+"""
+Create and refresh the sales rollups (see src/rollups.py).
+
+    python scripts/setup_rollups.py            # install (idempotent) + refresh
+    python scripts/setup_rollups.py --refresh  # refresh only: new orders, or a rebuild if dirty
+    python scripts/setup_rollups.py --full     # rebuild from scratch
+    python scripts/setup_rollups.py --drop     # remove rollups and their triggers
+
+Run --refresh from cron (or after loads): queries fall back to the base tables
+whenever the rollups are behind, so the interval only decides how often they help.
+"""
+import sys
+
+from sqlalchemy import create_engine
+from dotenv import load_dotenv
+from src import rollups
+from src.utils import require_env
+
+load_dotenv()
+url = require_env("DATABASE_URL")
+engine = create_engine(url, pool_pre_ping=True)
+
+
+if __name__ == "__main__":
+    with engine.begin() as c:
+        if "--drop" in sys.argv:
+            rollups.drop(c)
+            print("✅ Rollups removed.")
+            sys.exit(0)
+        if "--refresh" not in sys.argv:
+            rollups.install(c)
+        result = rollups.refresh(c, full="--full" in sys.argv)
+    print(f"✅ Rollups {', '.join(r.name for r in rollups.ROLLUPS)}: {result['mode']} refresh, watermark order_id {result['watermark']}.")
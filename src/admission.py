@@ -0,0 +1,185 @@
+# src/admission.py
+"""
+Admission: Cost-based pre-flight for generated SQL.
+
+Before a query runs (on a result cache miss), a plain EXPLAIN (no ANALYZE, so
+nothing executes) gives the planner's total cost and row estimates. The plan
+comes from the plan cache in src/database.py; read_plan() turns it into an Estimate:
+
+- above ADMISSION_MAX_COST (or ADMISSION_MAX_ROWS rows in any plan node) the
+  query is rejected up front with an AdmissionError, instead of burning up to
+  statement_timeout of database CPU;
+- otherwise it is classified into a tier (cheap / medium / heavy by cost) and
+  waits for a slot of that tier, so a few heavy queries cannot crowd out
+  the cheap ones. A query that waits longer than ADMISSION_QUEUE_SECONDS is
+  rejected as busy.
+
+Slots are per process: threading semaphores for the sync functions and one
+asyncio semaphore set per event loop for the async ones.
+"""
+import asyncio
+import copy
+import json
+import math
+import os
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import NamedTuple
+
+ENABLED = os.getenv("ADMISSION_CONTROL", "1") == "1"
+MAX_COST = float(os.getenv("ADMISSION_MAX_COST", "1000000"))   # planner cost units; 0 = no ceiling
+MAX_ROWS = int(os.getenv("ADMISSION_MAX_ROWS", "0"))            # largest node row estimate; 0 = no ceiling
+QUEUE_SECONDS = float(os.getenv("ADMISSION_QUEUE_SECONDS", "10"))
+
+# (tier, cost below which a query belongs to it, concurrent queries of that tier)
+TIERS: list[tuple[str, float, int]] = [
+    ("cheap", float(os.getenv("ADMISSION_CHEAP_COST", "1000")), int(os.getenv("ADMISSION_CHEAP_CONCURRENCY", "32"))),
+    ("medium", float(os.getenv("ADMISSION_MEDIUM_COST", "100000")), int(os.getenv("ADMISSION_MEDIUM_CONCURRENCY", "8"))),
+    ("heavy", math.inf, int(os.getenv("ADMISSION_HEAVY_CONCURRENCY", "2"))),
+]
+
+
+class AdmissionError(ValueError):
+    """The query was refused before running (too expensive, or its tier stayed full)."""
+
+
+class Estimate(NamedTuple):
+    cost: float      # total cost of the top plan node
+    rows: int        # rows the statement is expected to return
+    max_rows: int    # largest row estimate of any node (e.g. a cross join under an aggregate)
+    tier: str
+
+
+_stats_lock = threading.Lock()
+_stats: dict = {"estimates": 0, "rejected": 0, "busy": 0, "tiers": {}}
+_sync_gates: dict[str, threading.BoundedSemaphore] = {}
+_async_gates: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def classify(cost: float) -> str:
+    for name, below, _ in TIERS:
+        if cost < below:
+            return name
+    return TIERS[-1][0]
+
+
+def _limit(tier: str) -> int:
+    return next(n for name, _, n in TIERS if name == tier)
+
+
+def _max_rows(node: dict) -> int:
+    return max([int(node.get("Plan Rows", 0))] + [_max_rows(child) for child in node.get("Plans", ())])
+
+
+def read_plan(res) -> Estimate:
+    """Estimate from the result of EXPLAIN (FORMAT JSON) (asyncpg returns it as text)."""
+    if isinstance(res, str):
+        res = json.loads(res)
+    plan = res[0]["Plan"]
+    cost = float(plan.get("Total Cost", 0.0))
+    with _stats_lock:
+        _stats["estimates"] += 1
+    return Estimate(cost, int(plan.get("Plan Rows", 0)), _max_rows(plan), classify(cost))
+
+
+def check(est: Estimate) -> None:
+    """Raise AdmissionError if the estimate is over a hard ceiling."""
+    reason = None
+    if MAX_COST > 0 and est.cost > MAX_COST:
+        reason = f"estimated cost {est.cost:,.0f} exceeds the limit of {MAX_COST:,.0f}"
+    elif MAX_ROWS > 0 and est.max_rows > MAX_ROWS:
+        reason = f"an estimated {est.max_rows:,} intermediate rows exceed the limit of {MAX_ROWS:,}"
+    if reason is None:
+        return
+    with _stats_lock:
+        _stats["rejected"] += 1
+    raise AdmissionError(
+        f"Query rejected before running: {reason} (largest step ~{est.max_rows:,} rows). "
+        "Add filters or join conditions, or aggregate instead of listing rows."
+    )
+
+
+def _record(tier: str, waited: float, admitted: bool) -> None:
+    with _stats_lock:
+        t = _stats["tiers"].setdefault(tier, {"admitted": 0, "running": 0, "wait_ms_total": 0.0})
+        if admitted:
+            t["admitted"] += 1
+            t["running"] += 1
+            t["wait_ms_total"] += waited * 1000
+        else:
+            _stats["busy"] += 1
+
+
+def _release(tier: str) -> None:
+    with _stats_lock:
+        _stats["tiers"][tier]["running"] -= 1
+
+
+def _busy(est: Estimate) -> AdmissionError:
+    return AdmissionError(
+        f"Too many {est.tier} queries are running (limit {_limit(est.tier)}); "
+        f"waited {QUEUE_SECONDS:g}s for a slot. Try again shortly."
+    )
+
+
+@contextmanager
+def admit(est: Estimate | None):
+    """Hold a slot of the estimate's tier while the query runs; None (control disabled) admits at once."""
+    if est is None:
+        yield
+        return
+    check(est)
+    with _stats_lock:
+        gate = _sync_gates.get(est.tier)
+        if gate is None:
+            gate = _sync_gates[est.tier] = threading.BoundedSemaphore(_limit(est.tier))
+    t0 = time.perf_counter()
+    if not gate.acquire(timeout=QUEUE_SECONDS):
+        _record(est.tier, 0.0, False)
+        raise _busy(est)
+    _record(est.tier, time.perf_counter() - t0, True)
+    try:
+        yield
+    finally:
+        gate.release()
+        _release(est.tier)
+
+
+@asynccontextmanager
+async def admit_async(est: Estimate | None):
+    """Async twin of admit (slots are per event loop)."""
+    if est is None:
+        yield
+        return
+    check(est)
+    gates = _async_gates.setdefault(asyncio.get_running_loop(), {})
+    gate = gates.get(est.tier)
+    if gate is None:
+        gate = gates[est.tier] = asyncio.Semaphore(_limit(est.tier))
+    t0 = time.perf_counter()
+    try:
+        await asyncio.wait_for(gate.acquire(), QUEUE_SECONDS)
+    except asyncio.TimeoutError:
+        _record(est.tier, 0.0, False)
+        raise _busy(est) from None
+    _record(est.tier, time.perf_counter() - t0, True)
+    try:
+        yield
+    finally:
+        gate.release()
+        _release(est.tier)
+
+
+def admission_stats() -> dict:
+    with _stats_lock:
+        stats = copy.deepcopy(_stats)
+    stats["enabled"] = ENABLED
+    stats["max_cost"] = MAX_COST
+    stats["tiers_config"] = [
+        {"tier": n, "below_cost": b if math.isfinite(b) else None, "concurrency": c} for n, b, c in TIERS
+    ]
+    return stats
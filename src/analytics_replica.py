@@ -0,0 +1,439 @@
+# src/analytics_replica.py
+"""
+Analytics Replica: An in-process DuckDB copy of the tables for aggregate queries.
+
+With ANALYTICS_REPLICA=duckdb (and the duckdb package installed), src/database.py
+sends aggregate/GROUP BY SELECTs whose tables are all in the snapshot here,
+translated to DuckDB SQL by sqlglot. Everything else, and anything DuckDB
+rejects, runs on Postgres.
+
+The snapshot is refreshed every ANALYTICS_REFRESH_SECONDS on a background
+thread, from one REPEATABLE READ transaction so the tables agree with each other:
+
+- unchanged tables (same insert/update/delete counters in pg_stat_user_tables)
+  are not read at all;
+- tables that only had inserts and have an integer leading primary key column
+  get the rows above the stored key. If those are not exactly the inserted
+  rows (e.g. a line added to an old order), the table is reloaded instead;
+- anything else (updates, deletes, new columns) reloads the table.
+
+Changes are applied in one DuckDB transaction. Queries keep reading the
+previous snapshot until it commits (MVCC), so a refresh never blocks them.
+Queries are not routed before the first load finishes or when the snapshot is
+older than ANALYTICS_MAX_STALENESS_SECONDS. A standby's counters never move, so
+when the source is in recovery nothing is refreshed and nothing is routed.
+
+After the first load DuckDB's file and network access is switched off and its
+configuration locked. Queries with table functions, or functions Postgres does
+not have (read_text, read_csv, ...), are never routed.
+"""
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple
+
+from sqlglot import exp
+from sqlglot.errors import ErrorLevel, SqlglotError, UnsupportedError
+from sqlglot.optimizer.annotate_types import annotate_types
+from sqlglot.optimizer.qualify import qualify
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from src.columnar import ColumnarResult
+from src.query_validator import SelectAnalysis
+
+logger = logging.getLogger(__name__)
+
+KIND = os.getenv("ANALYTICS_REPLICA", "")  # "" = off, "duckdb"
+PATH = os.getenv("ANALYTICS_DB_PATH", ":memory:")
+REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "60"))
+MAX_STALENESS_SECONDS = float(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "300"))
+THREADS = int(os.getenv("ANALYTICS_THREADS", "4"))
+CONCURRENCY = int(os.getenv("ANALYTICS_CONCURRENCY", "4"))
+_FETCH_ROWS = 10000
+_UNROUTABLE_MAX = 1024
+
+_TABLES_SQL = """
+SELECT c.table_name, c.column_name, c.data_type, c.numeric_precision, c.numeric_scale
+FROM information_schema.columns c
+JOIN information_schema.tables t ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+WHERE c.table_schema = current_schema() AND t.table_type = 'BASE TABLE'
+ORDER BY c.table_name, c.ordinal_position
+"""
+# first primary key column of each table
+_KEYS_SQL = """
+SELECT c.relname, a.attname
+FROM pg_constraint k
+JOIN pg_class c ON c.oid = k.conrelid
+JOIN pg_attribute a ON a.attrelid = k.conrelid AND a.attnum = k.conkey[1]
+WHERE k.contype = 'p' AND c.relnamespace = current_schema()::regnamespace
+"""
+_RECOVERY_SQL = "SELECT pg_is_in_recovery()"
+_COUNTERS_SQL = """
+SELECT relname, n_tup_ins, n_tup_upd + n_tup_del
+FROM pg_stat_user_tables
+WHERE schemaname = current_schema()
+"""
+_TYPES = {
+    "smallint": "SMALLINT", "integer": "INTEGER", "bigint": "BIGINT",
+    "real": "REAL", "double precision": "DOUBLE", "boolean": "BOOLEAN",
+    "text": "VARCHAR", "character varying": "VARCHAR", "character": "VARCHAR",
+    "date": "DATE", "timestamp without time zone": "TIMESTAMP", "timestamp with time zone": "TIMESTAMPTZ",
+    "time without time zone": "TIME", "bytea": "BLOB", "uuid": "UUID",
+}
+_INTEGER_TYPES = {"SMALLINT", "INTEGER", "BIGINT"}
+_FUNCTIONS_SQL = "SELECT DISTINCT lower(proname) FROM pg_proc"
+# result column type OIDs (cursor.description) -> the DuckDB type to cast that column to
+_RESULT_TYPES = {
+    16: "BOOLEAN", 20: "BIGINT", 21: "SMALLINT", 23: "INTEGER", 700: "REAL", 701: "DOUBLE",
+    1700: "DECIMAL(38,10)", 25: "VARCHAR", 1042: "VARCHAR", 1043: "VARCHAR",
+    1082: "DATE", 1083: "TIME", 1114: "TIMESTAMP", 1184: "TIMESTAMPTZ",
+}
+# typed sqlglot functions that read files in DuckDB (read_csv, read_parquet, ...)
+_FILE_FUNCTIONS = tuple(
+    c for n, c in vars(exp).items() if n.startswith("Read") and isinstance(c, type) and issubclass(c, exp.Func)
+)
+
+
+class TableState(NamedTuple):
+    columns: tuple[tuple[str, str], ...]  # (name, DuckDB type)
+    key: str | None                       # integer leading primary key column (appends)
+    inserts: int                          # pg_stat_user_tables n_tup_ins when loaded
+    changes: int                          # n_tup_upd + n_tup_del when loaded
+    max_key: int | None
+    rows: int
+
+
+def _duckdb_type(data_type: str, precision: int | None, scale: int | None) -> str | None:
+    if data_type == "numeric":
+        # DuckDB decimals stop at 38 digits; unconstrained numeric becomes DOUBLE
+        return f"DECIMAL({precision},{scale or 0})" if precision and precision <= 38 else "DOUBLE"
+    return _TYPES.get(data_type)
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def to_duckdb(
+    tree: exp.Expression, schema: dict[str, dict[str, str]] | None = None,
+    columns: list[tuple[str, str]] | None = None,
+) -> str:
+    """
+    Translate a validated Postgres SELECT to DuckDB SQL.
+    Args:
+        tree (exp.Expression): The query (not modified).
+        schema (dict): table -> column -> Postgres type. Types every operand, so that
+            integer `/` stays integer division (DuckDB's `/` is float division).
+        columns (list[tuple[str, str]]): Postgres' result columns (name, DuckDB type);
+            the output is cast and renamed to match them.
+    Raises:
+        SqlglotError: If it cannot be translated faithfully.
+    """
+    tree = tree.copy()
+    if schema is not None:
+        tree = qualify(tree, dialect="postgres", schema=schema, quote_identifiers=False, identify=False)
+        annotate_types(tree, schema=schema, dialect="postgres")
+        for div in tree.find_all(exp.Div):
+            if any(side.type is None or side.type.is_type(exp.DataType.Type.UNKNOWN) for side in (div.this, div.expression)):
+                raise UnsupportedError(f"cannot tell whether {div.sql(dialect='postgres')} divides integers")
+    for dt in tree.find_all(exp.DataType):
+        # ::numeric is exact in Postgres; DuckDB's bare DECIMAL is DECIMAL(18,3)
+        if dt.this == exp.DataType.Type.DECIMAL and not dt.expressions:
+            dt.replace(exp.DataType.build("DECIMAL(38,10)"))
+    sql = tree.sql(dialect="duckdb", unsupported_level=ErrorLevel.RAISE)
+    if columns is None:
+        return sql
+    # AVG is a float and DATE_TRUNC of a date a naive timestamp in DuckDB; Postgres says numeric / timestamptz
+    outputs = ", ".join(f"CAST(_q.c{i} AS {t}) AS {_ident(name)}" for i, (name, t) in enumerate(columns))
+    return f"SELECT {outputs} FROM ({sql}) AS _q({', '.join(f'c{i}' for i in range(len(columns)))})"
+
+
+def is_aggregate(tree: exp.Expression) -> bool:
+    """True for queries that aggregate (GROUP BY or an aggregate function)."""
+    return any(tree.find_all(exp.Group, exp.AggFunc))
+
+
+class DuckDBReplica:
+    def __init__(self, path: str = ":memory:", threads: int = 4, concurrency: int = 4):
+        """
+        Args:
+            path (str): DuckDB database file, or ":memory:".
+            threads (int): DuckDB worker threads (shared by all queries).
+            concurrency (int): Queries run at once; more wait.
+        """
+        try:
+            import duckdb
+        except ImportError:
+            raise RuntimeError("ANALYTICS_REPLICA=duckdb needs the duckdb package (pip install duckdb)") from None
+        self._duckdb = duckdb
+        self._db = duckdb.connect(path)
+        self._db.execute(f"SET threads = {int(threads)}")
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._tables: dict[str, TableState] = {}
+        self._pg_functions: frozenset[str] = frozenset()
+        self._pg_schema: dict[str, dict[str, str]] = {}
+        self._engine = None
+        self._sql: dict[str, str | None] = {}  # Postgres sql -> DuckDB sql (None: cannot translate/run)
+        self.refreshed_at = 0.0
+        self.standby = False  # the source is a standby: its change counters cannot be trusted
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._stats = {"routed": 0, "fallbacks": 0, "refreshes": 0, "refresh_errors": 0,
+                       "appended": 0, "reloaded": 0, "unchanged": 0}
+        self.last_error = ""
+
+    # ---------- snapshot ----------
+    def refresh(self, engine) -> dict[str, str]:
+        """
+        Bring the snapshot up to date with Postgres (one transaction on each side).
+        Returns what happened per table: loaded, appended, reloaded, unchanged or dropped.
+        """
+        self._engine = engine
+        with self._refreshing:
+            with engine.connect() as pg:
+                pg = pg.execution_options(isolation_level="REPEATABLE READ")
+                with pg.begin():
+                    return self._refresh(pg)
+
+    def _refresh(self, pg) -> dict[str, str]:
+        standby = bool(pg.execute(text(_RECOVERY_SQL)).scalar())
+        if standby != self.standby:
+            if standby:
+                logger.warning("analytics replica source is a standby; queries stay on Postgres")
+            with self._lock:
+                self.standby = standby
+        if standby:
+            return {}
+        counters = {r[0]: (int(r[1]), int(r[2])) for r in pg.execute(text(_COUNTERS_SQL))}
+        pg_functions = frozenset(pg.execute(text(_FUNCTIONS_SQL)).scalars())
+        keys = dict(pg.execute(text(_KEYS_SQL)).all())
+        columns: dict[str, list[tuple[str, str | None]]] = {}
+        pg_schema: dict[str, dict[str, str]] = {}
+        for table, col, data_type, precision, scale in pg.execute(text(_TABLES_SQL)):
+            columns.setdefault(table, []).append((col, _duckdb_type(data_type, precision, scale)))
+            pg_schema.setdefault(table, {})[col] = data_type
+
+        done: dict[str, str] = {}
+        states = dict(self._tables)
+        cur = self._db.cursor()
+        cur.execute("BEGIN TRANSACTION")
+        try:
+            for table in set(states) - set(columns):
+                cur.execute(f"DROP TABLE IF EXISTS {_ident(table)}")
+                del states[table]
+                done[table] = "dropped"
+            for table, cols in columns.items():
+                if any(t is None for _, t in cols):
+                    # a type DuckDB cannot hold: queries on this table stay on Postgres
+                    if table in states:
+                        cur.execute(f"DROP TABLE IF EXISTS {_ident(table)}")
+                        del states[table]
+                        done[table] = "dropped"
+                    continue
+                spec = tuple(cols)  # type: ignore[arg-type]
+                key = keys.get(table)
+                key = key if key and dict(spec).get(key) in _INTEGER_TYPES else None
+                inserts, changes = counters.get(table, (0, 0))
+                old = states.get(table)
+                if old is not None and old.columns == spec and (old.inserts, old.changes) == (inserts, changes):
+                    done[table] = "unchanged"
+                    continue
+                if old is not None and old.columns == spec and old.key and old.changes == changes and inserts > old.inserts:
+                    added, max_key = self._copy(cur, pg, table, spec, old.key, old.max_key)
+                    if added == inserts - old.inserts:
+                        states[table] = old._replace(inserts=inserts, max_key=max_key, rows=old.rows + added)
+                        done[table] = "appended"
+                        continue
+                    cur.execute(f"DELETE FROM {_ident(table)}")  # missed or aborted inserts: reload
+                elif old is not None and old.columns == spec:
+                    cur.execute(f"DELETE FROM {_ident(table)}")
+                else:
+                    cur.execute(f"DROP TABLE IF EXISTS {_ident(table)}")
+                    cur.execute(f"CREATE TABLE {_ident(table)} ({', '.join(f'{_ident(c)} {t}' for c, t in spec)})")
+                rows, max_key = self._copy(cur, pg, table, spec, key, None)
+                states[table] = TableState(spec, key, inserts, changes, max_key, rows)
+                done[table] = "reloaded" if old is not None else "loaded"
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        finally:
+            cur.close()
+        if not self.refreshed_at:
+            # timestamptz results in the session time zone of Postgres
+            self._db.execute("SET TimeZone = ?", [pg.execute(text("SELECT current_setting('TimeZone')")).scalar()])
+            # loaded: from here on queries may only read the snapshot (not files, URLs or settings)
+            self._db.execute("SET enable_external_access = false")
+            self._db.execute("SET lock_configuration = true")
+        with self._lock:
+            self._pg_functions = pg_functions
+            self._pg_schema = pg_schema
+            self._tables = states
+            self.refreshed_at = time.time()
+            self._stats["refreshes"] += 1
+            for what in done.values():
+                if what in ("appended", "unchanged"):
+                    self._stats[what] += 1
+                elif what in ("loaded", "reloaded"):
+                    self._stats["reloaded"] += 1
+        return done
+
+    def _copy(self, cur, pg, table: str, spec, key: str | None, above: int | None) -> tuple[int, int | None]:
+        """Copy the rows of table (only key > above when above is given) into DuckDB. Returns (rows, max key)."""
+        import pandas as pd
+
+        names = [c for c, _ in spec]
+        sql = f"SELECT {', '.join(_ident(c) for c in names)} FROM {_ident(table)}"
+        if key is not None and above is not None:
+            sql += f" WHERE {_ident(key)} > :above"
+        result = pg.execution_options(stream_results=True, yield_per=_FETCH_ROWS).execute(
+            text(sql), {"above": above} if above is not None else {}
+        )
+        count, max_key = 0, above
+        key_at = names.index(key) if key in names else None
+        for batch in result.partitions(_FETCH_ROWS):
+            values = list(zip(*batch))
+            # object columns keep None as NULL (a float column would turn it into NaN)
+            frame = pd.DataFrame({n: pd.Series(v, dtype=object) for n, v in zip(names, values)})
+            cur.register("_batch", frame)
+            cur.execute(f"INSERT INTO {_ident(table)} SELECT * FROM _batch")
+            cur.unregister("_batch")
+            count += len(batch)
+            if key_at is not None:
+                top = max((k for k in values[key_at] if k is not None), default=None)
+                if top is not None and (max_key is None or top > max_key):
+                    max_key = top
+        return count, max_key
+
+    def start(self, engine, every: float = REFRESH_SECONDS) -> None:
+        """Load the snapshot and keep refreshing it every `every` seconds on a daemon thread."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.refresh(engine)
+                    self.last_error = ""
+                except Exception as e:
+                    logger.warning("analytics replica refresh failed: %s", e)
+                    self.last_error = str(e).splitlines()[0]
+                    with self._lock:
+                        self._stats["refresh_errors"] += 1
+                self._stop.wait(every)
+
+        self._thread = threading.Thread(target=run, daemon=True, name="analytics-refresh")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ---------- queries ----------
+    def tables(self) -> frozenset[str]:
+        with self._lock:
+            return frozenset(self._tables)
+
+    def eligible(self, analysis: SelectAnalysis, max_staleness: float = MAX_STALENESS_SECONDS) -> bool:
+        """True if the query aggregates, reads only snapshot tables and the snapshot is recent enough."""
+        if self.standby or not self.refreshed_at or time.time() - self.refreshed_at > max_staleness:
+            return False
+        if self._sql.get(analysis.sql, "") is None or not analysis.tables:
+            return False
+        return analysis.tables <= self.tables() and is_aggregate(analysis.tree) and self._plain(analysis.tree)
+
+    def _plain(self, tree: exp.Expression) -> bool:
+        """No table functions, and only functions that Postgres has too."""
+        if any(not isinstance(t.this, exp.Identifier) for t in tree.find_all(exp.Table)):
+            return False
+        if any(tree.find_all(exp.Unnest, exp.Lateral, *_FILE_FUNCTIONS)):
+            return False
+        return all(f.name.lower() in self._pg_functions for f in tree.find_all(exp.Anonymous))
+
+    def run(self, analysis: SelectAnalysis, columnar: bool, timeout_s: float) -> list[dict] | ColumnarResult | None:
+        """
+        Run the query on the snapshot. Returns None if DuckDB cannot run it (the
+        caller falls back to Postgres); raises TimeoutError after timeout_s.
+        """
+        sql = self._sql.get(analysis.sql, "")
+        if sql == "":
+            try:
+                sql = to_duckdb(analysis.tree, self._pg_schema, self._result_columns(analysis.sql))
+            except (SqlglotError, DBAPIError, KeyError) as e:
+                return self._unroutable(analysis.sql, e)
+        if sql is None:
+            return None
+        with self._slots:
+            cur = self._db.cursor()
+            timer = threading.Timer(timeout_s, cur.interrupt)
+            timer.start()
+            try:
+                cur.execute(sql)
+                names = [d[0] for d in cur.description]
+                rows = cur.fetchall()
+            except self._duckdb.InterruptException:
+                raise TimeoutError(f"Query exceeded {timeout_s:g}s on the analytics replica") from None
+            except self._duckdb.Error as e:
+                # e.g. a Postgres-only function: Postgres answers this shape from now on
+                return self._unroutable(analysis.sql, e)
+            finally:
+                timer.cancel()
+                cur.close()
+        with self._lock:
+            self._sql[analysis.sql] = sql
+            self._stats["routed"] += 1
+        if columnar:
+            return ColumnarResult.from_rows(names, rows)
+        return [dict(zip(names, r)) for r in rows]
+
+    def _result_columns(self, pg_sql: str) -> list[tuple[str, str]]:
+        """Names and (DuckDB) types of the columns Postgres returns for the query; planned, not run."""
+        with self._engine.connect() as pg:
+            description = pg.execute(text(f"SELECT * FROM ({pg_sql}) AS _q LIMIT 0")).cursor.description
+        return [(d[0], _RESULT_TYPES[d[1]]) for d in description]
+
+    def _unroutable(self, pg_sql: str, e: Exception) -> None:
+        logger.info("analytics replica cannot run query, using Postgres: %s", str(e).splitlines()[0])
+        with self._lock:
+            if len(self._sql) >= _UNROUTABLE_MAX:
+                self._sql.clear()
+            self._sql[pg_sql] = None
+            self._stats["fallbacks"] += 1
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "engine": "duckdb",
+                **self._stats,
+                "tables": len(self._tables),
+                "rows": sum(s.rows for s in self._tables.values()),
+                "standby": self.standby,
+                "snapshot_age_seconds": round(time.time() - self.refreshed_at, 1) if self.refreshed_at else None,
+                "last_error": self.last_error,
+            }
+
+
+def make_replica(
+    kind: str = KIND, path: str = PATH, threads: int = THREADS, concurrency: int = CONCURRENCY,
+) -> DuckDBReplica | None:
+    """
+    Args:
+        kind (str): "" / "off" (no analytics replica) or "duckdb".
+    Raises:
+        ValueError: Unknown kind.
+        RuntimeError: duckdb is not installed.
+    """
+    kind = (kind or "").strip().lower()
+    if kind in ("", "off", "none", "0"):
+        return None
+    if kind == "duckdb":
+        return DuckDBReplica(path, threads, concurrency)
+    raise ValueError(f"Unknown ANALYTICS_REPLICA: {kind!r} (expected duckdb or empty)")
@@ -1,13 +1,29 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from src.text2sql_engine import generate_sql
+from src.text2sql_engine import generate_sql_async
 from src.query_validator import sanitize_select
-from src.database import run_readonly
-from typing import Optional
+from src.question_cache import normalize_question
+from src.database import run_readonly_async, explain_sql_async, stream_readonly_async, STREAM_FETCH_SIZE, cache_stats, pool_stats, plan_cache_stats, analytics_stats
+from src.schema_pruner import PRUNING_STATS
+from src.admission import admission_stats
+from src.rollups import rollup_stats
+from src.pagination import Page, first_page_async, next_page_async
+from src.columnar import ColumnarResult
+from src import approximate
+from typing import AsyncIterator, Literal, Optional
+import asyncio
+import json
+import os
 import time
 from datetime import datetime, timezone
 
+# Batch knobs: questions answered at once (keep at or below the async pool size) and max batch length
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "4"))
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "500"))
+
 app = FastAPI(
     title="Text2SQL Analytics API",
     description="Convert natural language questions to SQL queries and execute them",
@@ -28,7 +44,7 @@ def root():
     return {
         "message": "Text2SQL Analytics API", 
         "version": "1.0.0",
-        "endpoints": ["/health", "/ask", "/explain"]
+        "endpoints": ["/health", "/stats", "/ask", "/ask/next", "/ask/batch", "/explain"]
     }
 
 @app.get("/health")
@@ -38,40 +54,233 @@ def health():
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
+@app.get("/stats")
+def stats():
+    return {
+        "query_cache": cache_stats(),
+        "schema_pruning": dict(PRUNING_STATS),
+        "pool": pool_stats(),
+        "admission": admission_stats(),
+        "plan_cache": plan_cache_stats(),
+        "rollups": rollup_stats(),
+        "analytics": analytics_stats(),
+    }
+
 class AskBody(BaseModel):
     question: str = Field(..., min_length=1, description="Natural language question to convert to SQL")
     row_limit: int | None = Field(None, ge=1, le=10000, description="Maximum number of rows to return (1-10000)")
+    stream: bool = Field(False, description="Stream rows as NDJSON from a server-side cursor")
+    format: Literal["rows", "columnar"] = Field("rows", description="rows: one object per row; columnar: column header plus per-column arrays")
+    page_size: int | None = Field(None, ge=1, le=10000, description="Return the first page of this many rows plus a token for POST /ask/next")
+    approximate: bool = Field(False, description="Answer aggregates from a table sample, with confidence intervals")
+
+def _ndjson(obj) -> str:
+    return json.dumps(obj, default=jsonable_encoder, separators=(",", ":")) + "\n"
+
+async def _ndjson_rows(head: dict, first: dict | None, rows: AsyncIterator[dict], start_time: float):
+    """
+    NDJSON body: a header line ({"question", "sql"}), one line per row, then a
+    trailer with row_count and timing (or an error, if the stream breaks).
+    Lines are flushed in chunks of STREAM_FETCH_SIZE rows.
+    """
+    yield _ndjson(head)
+    row_count = 0
+    chunk: list[str] = []
+    try:
+        if first is not None:
+            chunk.append(_ndjson(first))
+            row_count = 1
+        async for row in rows:
+            chunk.append(_ndjson(row))
+            row_count += 1
+            if len(chunk) >= STREAM_FETCH_SIZE:
+                yield "".join(chunk)
+                chunk = []
+    except Exception as e:
+        yield "".join(chunk) + _ndjson({"error": str(e), "row_count": row_count})
+        return
+    finally:
+        await rows.aclose()
+    execution_time_ms = round((time.time() - start_time) * 1000, 2)
+    yield "".join(chunk) + _ndjson({"row_count": row_count, "execution_time_ms": execution_time_ms})
+
+def _page_info(page: Page) -> dict:
+    return {
+        "size": page.size,
+        "has_more": page.has_more,
+        "next_token": page.next_token,
+        "estimated_total_rows": page.estimated_total_rows,
+        "pageable": True,
+    }
+
+async def _ask_page(
+    question: str, sql: str, safe_sql: str, size: int, row_limit: int, columnar: bool, start_time: float
+) -> dict:
+    """
+    First page of a paginated /ask; all pages together stop at row_limit. Queries
+    without a total order (see src/pagination.py) return their first `size` rows with "pageable": false.
+    """
+    page = await first_page_async(sql, size, columnar, row_limit)
+    if page is not None:
+        rows, info = page.rows, _page_info(page)
+    else:
+        rows = await run_readonly_async(safe_sql, row_limit=min(size + 1, row_limit))
+        info = {"size": size, "has_more": len(rows) > size, "next_token": None, "estimated_total_rows": None, "pageable": False}
+        rows = rows[:size]
+        if columnar:
+            rows = ColumnarResult.from_rows(list(rows[0]) if rows else [], [tuple(r.values()) for r in rows])
+    return {
+        "question": question,
+        "sql": safe_sql,
+        "rows": rows.to_json() if columnar else rows,
+        "execution_time_ms": round((time.time() - start_time) * 1000, 2),
+        "row_count": len(rows),
+        "page": info,
+    }
 
 @app.post("/ask")
-def ask(body: AskBody):
+async def ask(body: AskBody):
     try:
         start_time = time.time()
         
-        sql = generate_sql(body.question)
+        sql = await generate_sql_async(body.question)
         safe_sql = sanitize_select(sql, row_limit=body.row_limit or 1000)
-        rows = run_readonly(safe_sql, row_limit=body.row_limit or 1000)
+
+        if body.approximate and (body.page_size or body.stream):
+            raise ValueError("approximate=true cannot be combined with stream or page_size")
+        if body.page_size:
+            if body.stream:
+                raise ValueError("stream=true and page_size cannot be combined")
+            return await _ask_page(
+                body.question, sql, safe_sql, body.page_size, body.row_limit or 1000, body.format == "columnar", start_time
+            )
+
+        if body.stream:
+            if body.format == "columnar":
+                raise ValueError("stream=true returns rows; use format='rows'")
+            rows_iter = stream_readonly_async(safe_sql, row_limit=body.row_limit or 1000)
+            # pull the first row here so query errors still surface as a 400
+            try:
+                first = await anext(rows_iter, None)
+            except Exception:
+                await rows_iter.aclose()
+                raise
+            head = {"question": body.question, "sql": safe_sql}
+            return StreamingResponse(_ndjson_rows(head, first, rows_iter, start_time), media_type="application/x-ndjson")
+
+        columnar = body.format == "columnar"
+        approx = None
+        if body.approximate:
+            try:
+                approx = await asyncio.to_thread(approximate.rewrite, safe_sql, row_limit=body.row_limit or 1000)
+                safe_sql = approx.sql
+            except approximate.NotApproximable as e:
+                # answered exactly; say why
+                approx = {"applied": False, "reason": str(e)}
+        rows = await run_readonly_async(safe_sql, row_limit=body.row_limit or 1000, columnar=columnar)
         
         execution_time_ms = round((time.time() - start_time) * 1000, 2)
         
-        return {
+        result = {
             "question": body.question,
             "sql": safe_sql,
-            "rows": rows,
+            # columnar: {"columns": [...], "data": [[...], ...]} instead of one object per row
+            "rows": rows.to_json() if columnar else rows,
             "execution_time_ms": execution_time_ms,
             "row_count": len(rows)
         }
+        if approx is not None:
+            result["approximate"] = approx if isinstance(approx, dict) else {"applied": True, **approx.describe()}
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class AskNextBody(BaseModel):
+    token: str = Field(..., min_length=1, description="next_token from the previous page")
+    format: Literal["rows", "columnar"] = Field("rows", description="rows: one object per row; columnar: column header plus per-column arrays")
+
+@app.post("/ask/next")
+async def ask_next(body: AskNextBody):
+    """Next page of a paginated /ask: runs the same SQL from after the previous page's last row."""
+    try:
+        start_time = time.time()
+        columnar = body.format == "columnar"
+        page = await next_page_async(body.token, columnar)
+        return {
+            "sql": page.sql,
+            "rows": page.rows.to_json() if columnar else page.rows,
+            "execution_time_ms": round((time.time() - start_time) * 1000, 2),
+            "row_count": len(page.rows),
+            "page": _page_info(page),
+        }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+class AskBatchBody(BaseModel):
+    questions: list[str] = Field(..., min_length=1, max_length=ASK_BATCH_MAX_QUESTIONS, description="Natural language questions")
+    row_limit: int | None = Field(None, ge=1, le=10000, description="Maximum number of rows per question (1-10000)")
+
+@app.post("/ask/batch")
+async def ask_batch(body: AskBatchBody):
+    """
+    Answer many questions in one request. Questions that normalize to the same
+    text are answered once, and questions that resolve to the same SQL share
+    one execution. At most ASK_BATCH_CONCURRENCY generations and queries run at
+    a time. Every item has sql, rows, row_count and error (None on success).
+    """
+    start_time = time.time()
+    row_limit = body.row_limit or 1000
+    gate = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+    executions: dict[str, asyncio.Task] = {}
+
+    async def execute(safe_sql: str) -> list[dict]:
+        async with gate:
+            return await run_readonly_async(safe_sql, row_limit=row_limit)
+
+    def batch_item(sql: str | None, rows: list[dict], error: str | None = None) -> dict:
+        # one shape for every item; sql is None when no SQL was produced
+        return {"sql": sql, "rows": rows, "row_count": len(rows), "error": error}
+
+    async def answer(question: str) -> dict:
+        if not question.strip():
+            return batch_item(None, [], "Question must not be empty")
+        safe_sql = None
+        try:
+            # the gate is released before waiting on a (possibly shared) execution
+            async with gate:
+                sql = await generate_sql_async(question)
+                safe_sql = sanitize_select(sql, row_limit=row_limit)
+            task = executions.get(safe_sql)
+            if task is None:
+                task = executions[safe_sql] = asyncio.ensure_future(execute(safe_sql))
+            return batch_item(safe_sql, await task)
+        except Exception as e:
+            return batch_item(safe_sql, [], str(e))
+
+    answers: dict[str, asyncio.Task] = {}
+    for question in body.questions:
+        norm = normalize_question(question)
+        if norm not in answers:
+            answers[norm] = asyncio.ensure_future(answer(question))
+    await asyncio.gather(*answers.values())
+
+    items = [{"question": q, **answers[normalize_question(q)].result()} for q in body.questions]
+    return {
+        "items": items,
+        "unique_questions": len(answers),
+        "error_count": sum(1 for item in items if item["error"]),
+        "execution_time_ms": round((time.time() - start_time) * 1000, 2),
+    }
+
 class ExplainBody(BaseModel):
     sql: str = Field(..., min_length=1, description="SQL query to explain")
     row_limit: Optional[int] = Field(50, ge=1, le=1000, description="Row limit for explain query")
+    mode: Literal["estimate", "analyze"] = Field("analyze", description="estimate: plan only, cached, nothing runs; analyze: run the query for actual timings")
 
 @app.post("/explain")
-def explain(body: ExplainBody):
+async def explain(body: ExplainBody):
     try:
-        from src.database import explain_sql
-        result = explain_sql(body.sql, row_limit=body.row_limit or 50)
+        result = await explain_sql_async(body.sql, row_limit=body.row_limit or 50, mode=body.mode)
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,215 @@
+# src/approximate.py
+"""
+Approximate: Answer aggregate queries from a random sample of the largest table.
+
+rewrite() adds TABLESAMPLE to the largest table of an aggregate SELECT (one with
+at least APPROX_MIN_ROWS estimated rows) and scales the aggregates back up:
+
+- COUNT(*) / COUNT(x) -> COUNT / f and SUM(x) -> SUM(x) / f, where f is the
+  sample fraction (the Horvitz-Thompson estimate);
+- AVG(x) is already unbiased.
+
+Each aggregate in the select list gets <name>_low / <name>_high columns: a
+confidence interval (APPROX_CONFIDENCE, 95% by default). Under Bernoulli
+sampling the variance of a scaled SUM is (1 - f) / f^2 * SUM(x^2). For AVG
+it is (1 - f) * var(x) / n.
+
+BERNOULLI (default) samples rows, so the intervals hold, but it still reads
+every page. SYSTEM samples pages and reads only f of the table, which is
+much faster. Rows on one page are correlated (lines of the same order), so
+the intervals come out too narrow.
+REPEATABLE(APPROX_SEED) keeps a query's answer stable, so it can be cached.
+
+Not approximated (NotApproximable): MIN/MAX, DISTINCT aggregates, HAVING,
+outer joins, subqueries, window functions, and tables below APPROX_MIN_ROWS.
+Groups that no sampled row falls into are missing from the answer.
+"""
+import os
+from decimal import Decimal
+from statistics import NormalDist
+from typing import NamedTuple
+
+from sqlglot import exp
+
+from src.query_validator import analyze_select
+from src.schema_catalog import get_catalog
+
+SAMPLE_PERCENT = float(os.getenv("APPROX_SAMPLE_PERCENT", "5"))
+MIN_ROWS = int(os.getenv("APPROX_MIN_ROWS", "100000"))  # smaller tables are answered exactly
+METHOD = os.getenv("APPROX_SAMPLE_METHOD", "bernoulli").upper()  # BERNOULLI or SYSTEM
+CONFIDENCE = float(os.getenv("APPROX_CONFIDENCE", "0.95"))
+SEED = int(os.getenv("APPROX_SEED", "42"))
+
+_SCALED = (exp.Count, exp.Sum, exp.Avg)
+_WRAPPERS = (exp.Round, exp.Cast, exp.Paren)
+
+
+class NotApproximable(ValueError):
+    """The query has to run exactly (the message says why)."""
+
+
+class Approximation(NamedTuple):
+    sql: str
+    table: str                             # sampled table
+    percent: float
+    method: str
+    confidence: float
+    intervals: dict[str, tuple[str, str]]  # output column -> (low column, high column)
+
+    def describe(self) -> dict:
+        return {
+            "sampled_table": self.table, "sample_percent": self.percent, "method": self.method.lower(),
+            "confidence": self.confidence, "intervals": {k: list(v) for k, v in self.intervals.items()},
+        }
+
+
+def _core(node: exp.Expression) -> exp.Expression:
+    """The aggregate under ROUND(...) / CAST(...) / parentheses."""
+    while isinstance(node, _WRAPPERS):
+        node = node.this
+    return node
+
+
+def _num(value: Decimal | float) -> exp.Expression:
+    return exp.Literal.number(format(Decimal(str(value)).normalize(), "f"))
+
+
+def _scaled(agg: exp.Expression, f: exp.Expression, exact: bool = False) -> exp.Expression:
+    """The aggregate scaled up to the whole table; counts are rounded unless exact."""
+    if isinstance(agg, exp.Avg):
+        return agg.copy()
+    total = exp.Div(this=exp.Cast(this=agg.copy(), to=exp.DataType.build("NUMERIC")), expression=f.copy(), typed=True)
+    if isinstance(agg, exp.Count) and not exact:
+        return exp.Cast(this=exp.Round(this=total), to=exp.DataType.build("BIGINT"))
+    return total
+
+
+def _half_width(agg: exp.Expression, f: exp.Expression, keep: exp.Expression, z: exp.Expression) -> exp.Expression:
+    """z * standard error of the scaled aggregate, as SQL."""
+    if isinstance(agg, exp.Count):
+        # variance of a scaled count: (1 - f) / f^2 * n
+        n = agg.copy()
+        err = exp.Div(this=exp.Sqrt(this=exp.Mul(this=keep.copy(), expression=n)), expression=f.copy(), typed=True)
+    elif isinstance(agg, exp.Sum):
+        x = agg.this
+        # squared in double precision: smallint * smallint overflows
+        value = exp.Cast(this=x.copy(), to=exp.DataType.build("DOUBLE"))
+        squares = exp.Sum(this=exp.Mul(this=value, expression=value.copy()))
+        err = exp.Div(this=exp.Sqrt(this=exp.Mul(this=keep.copy(), expression=squares)), expression=f.copy(), typed=True)
+    else:
+        # AVG: sqrt((1 - f) * var_pop(x) / n)
+        x = agg.this
+        variance = exp.Anonymous(this="VAR_POP", expressions=[x.copy()])
+        n = exp.Count(this=x.copy())
+        err = exp.Sqrt(this=exp.Div(
+            this=exp.Mul(this=keep.copy(), expression=variance),
+            expression=exp.func("NULLIF", n, exp.Literal.number(0)), typed=True,
+        ))
+    return exp.Mul(this=z.copy(), expression=err)
+
+
+def _bound(item: exp.Expression, agg: exp.Expression, estimate: exp.Expression, err: exp.Expression, sign: int) -> exp.Expression:
+    """The select item with its aggregate replaced by estimate -/+ err (keeps ROUND/CAST around it)."""
+    err = exp.Cast(this=err.copy(), to=exp.DataType.build("NUMERIC"))
+    bound = (exp.Sub if sign < 0 else exp.Add)(this=exp.paren(estimate.copy()), expression=err)
+    if isinstance(agg, exp.Count):
+        bound = exp.Cast(this=exp.Round(this=bound), to=exp.DataType.build("BIGINT"))
+    return _swap(item, bound)
+
+
+def _swap(item: exp.Expression, replacement: exp.Expression) -> exp.Expression:
+    """A copy of the select item with its aggregate replaced."""
+    copy = item.copy()
+    core = _core(copy)
+    if core is copy:
+        return replacement
+    core.replace(replacement)
+    return copy
+
+
+def _output_name(item: exp.Expression) -> str:
+    if isinstance(item, exp.Alias):
+        return item.alias
+    # Postgres names an unaliased column after its outermost function, looking through casts
+    while isinstance(item, (exp.Cast, exp.Paren)):
+        item = item.this
+    return item.key
+
+
+def rewrite(
+    sql: str, percent: float | None = None, method: str | None = None,
+    min_rows: int | None = None, row_estimates: dict[str, int] | None = None, row_limit: int = 1000,
+) -> Approximation:
+    """
+    Sampled version of an aggregate SELECT.
+    Args:
+        sql (str): A validated SELECT (see src/query_validator.py).
+        percent (float): Sample size in percent of the table (APPROX_SAMPLE_PERCENT).
+        method (str): "BERNOULLI" or "SYSTEM" (APPROX_SAMPLE_METHOD).
+        min_rows (int): Only tables with at least this many estimated rows are sampled (APPROX_MIN_ROWS).
+        row_estimates (dict[str, int]): Rows per table; defaults to the schema catalog.
+        row_limit (int): The caller's row cap (as given to sanitize_select / run_readonly).
+    Raises:
+        NotApproximable: If the query must run exactly.
+    """
+    percent = SAMPLE_PERCENT if percent is None else percent
+    method = (method or METHOD).upper()
+    min_rows = MIN_ROWS if min_rows is None else min_rows
+    if not 0 < percent < 100:
+        raise NotApproximable("sample percent must be between 0 and 100")
+    if method not in ("BERNOULLI", "SYSTEM"):
+        raise NotApproximable(f"unknown sampling method {method!r}")
+
+    tree = analyze_select(sql, row_limit).tree.copy()
+    if not isinstance(tree, exp.Select) or tree.args.get("with_") or tree.args.get("distinct"):
+        raise NotApproximable("only a single SELECT without WITH or DISTINCT can be sampled")
+    if tree.args.get("having"):
+        raise NotApproximable("HAVING would filter on estimates")
+    if any(tree.find_all(exp.Window)) or any(s is not tree for s in tree.find_all(exp.Select)):
+        raise NotApproximable("window functions and subqueries are answered exactly")
+    aggregates = list(tree.find_all(exp.AggFunc))
+    if not aggregates:
+        raise NotApproximable("not an aggregate query")
+    for agg in aggregates:
+        if not isinstance(agg, _SCALED) or isinstance(agg.this, exp.Distinct):
+            raise NotApproximable(f"{agg.key.upper()} cannot be estimated from a sample")
+    for join in tree.args.get("joins") or ():
+        if join.side or join.kind not in ("", "INNER", "CROSS"):
+            raise NotApproximable("outer joins are answered exactly")
+
+    sources = [tree.args["from_"].this] + [j.this for j in tree.args.get("joins") or ()]
+    if not all(isinstance(s, exp.Table) and isinstance(s.this, exp.Identifier) for s in sources):
+        raise NotApproximable("table functions are answered exactly")
+    estimates = row_estimates if row_estimates is not None else {
+        name: t.row_estimate for name, t in get_catalog().tables.items()
+    }
+    largest = max(sources, key=lambda s: estimates.get(s.name, 0))
+    if estimates.get(largest.name, 0) < min_rows:
+        raise NotApproximable(f"{largest.name} has fewer than {min_rows} rows; exact is cheap")
+    largest.set("sample", exp.TableSample(
+        method=exp.var(method), percent=_num(percent), seed=exp.Literal.number(SEED),
+    ))
+
+    fraction = Decimal(str(percent)) / 100
+    f = _num(fraction)
+    keep = _num(1 - fraction)
+    z = _num(round(NormalDist().inv_cdf(0.5 + CONFIDENCE / 2), 4))
+    items: list[exp.Expression] = []
+    intervals: dict[str, tuple[str, str]] = {}
+    for item in tree.expressions:
+        name = _output_name(item)
+        core = _core(item.unalias())
+        if isinstance(core, _SCALED):
+            estimate = _scaled(core, f)
+            err = _half_width(core, f, keep, z)
+            body = item.unalias()
+            low = _bound(body, core, estimate, err, -1)
+            high = _bound(body, core, estimate, err, +1)
+            items += [exp.alias_(_swap(body, estimate), name), exp.alias_(low, f"{name}_low"), exp.alias_(high, f"{name}_high")]
+            intervals[name] = (f"{name}_low", f"{name}_high")
+        else:
+            # other expressions: scale each SUM/COUNT inside, unrounded (ratios of sums stay the same)
+            scaled = item.copy().transform(lambda n: _scaled(n, f, exact=True) if isinstance(n, (exp.Count, exp.Sum)) else n)
+            items.append(scaled)
+    tree.set("expressions", items)
+    return Approximation(tree.sql(dialect="postgres"), largest.name, percent, method, CONFIDENCE, intervals)
@@ -0,0 +1,301 @@
+# src/cache_backends.py
+"""
+Cache Backends: Shared (L2) stores for the run_readonly result cache.
+
+The in-process LRU in src/database.py stays the L1 tier; a backend from here
+sits behind it so every worker process can reuse results another one fetched:
+
+- SQLiteBackend: a WAL-mode SQLite file, shared by all workers on one host.
+- RedisBackend: any Redis-protocol server (Redis, Valkey, KeyDB, ...), shared
+  across hosts. Speaks RESP over a plain socket, so no client library is needed.
+
+Backends store opaque bytes with a TTL. A backend that errors is treated as a
+miss by the caller; the query then simply runs against Postgres.
+
+encode_entry / decode_entry turn cache entries into those bytes. The format is
+JSON in which Decimal, dates, times, UUIDs, bytes and NumPy columns are tagged.
+It only describes data, so whoever can write to the store cannot make a worker
+run code (unlike pickle). Payloads that do not decode raise ValueError.
+"""
+import base64
+import datetime
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from decimal import Decimal
+from urllib.parse import unquote, urlparse
+
+import numpy as np
+
+from src.columnar import ColumnarResult
+
+
+class CacheBackend:
+    """Interface: bytes in, bytes out, entries expire after ttl seconds."""
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+# ---------- entry encoding ----------
+_DECODERS = {
+    "$n": Decimal, "$ts": datetime.datetime.fromisoformat, "$d": datetime.date.fromisoformat,
+    "$t": datetime.time.fromisoformat, "$u": uuid.UUID,
+    "$i": lambda v: datetime.timedelta(microseconds=v), "$b": base64.b64decode,
+}
+
+
+def _encode(v):
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    if isinstance(v, Decimal):
+        return {"$n": str(v)}
+    if isinstance(v, datetime.datetime):
+        return {"$ts": v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {"$d": v.isoformat()}
+    if isinstance(v, datetime.time):
+        return {"$t": v.isoformat()}
+    if isinstance(v, datetime.timedelta):
+        return {"$i": v // datetime.timedelta(microseconds=1)}
+    if isinstance(v, uuid.UUID):
+        return {"$u": str(v)}
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return {"$b": base64.b64encode(bytes(v)).decode("ascii")}
+    if isinstance(v, (list, tuple)):
+        return [_encode(x) for x in v]
+    if isinstance(v, dict):
+        return {"$o": [[k, _encode(x)] for k, x in v.items()]}
+    if isinstance(v, np.ndarray):
+        return {"$a": [v.dtype.str, v.tolist()]}
+    if isinstance(v, ColumnarResult):
+        return {"$c": [v.columns, [_encode(col) for col in v.data]]}
+    raise TypeError(f"cannot cache a {type(v).__name__}")
+
+
+def _decode(v):
+    if isinstance(v, list):
+        return [_decode(x) for x in v]
+    if not isinstance(v, dict):
+        return v
+    (tag, data), = v.items()
+    if tag == "$o":
+        return {k: _decode(x) for k, x in data}
+    if tag == "$a":
+        return np.array(data[1], dtype=np.dtype(data[0]))
+    if tag == "$c":
+        return ColumnarResult(data[0], [_decode(col) for col in data[1]])
+    return _DECODERS[tag](data)
+
+
+def encode_entry(value) -> bytes:
+    """
+    JSON bytes for a cache entry (rows, ColumnarResult, plain tuples/lists/dicts of them).
+    Raises:
+        TypeError: For a value with no tagged form; the entry is then not shared.
+    """
+    return json.dumps(_encode(value), separators=(",", ":")).encode("utf-8")
+
+
+def decode_entry(data: bytes):
+    """
+    Inverse of encode_entry; tuples come back as lists.
+    Raises:
+        ValueError: If the payload is not a valid entry.
+    """
+    try:
+        return _decode(json.loads(data))
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"corrupt cache entry: {e}") from None
+
+
+class SQLiteBackend(CacheBackend):
+    _TRIM_EVERY = 64  # puts between purges of expired/excess rows
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        """
+        Args:
+            path (str): SQLite file shared by the worker processes.
+            max_entries (int): Rows kept after a purge (soonest-expiring dropped first).
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=1.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # a cache can afford to lose the last commits
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS result_cache (key TEXT PRIMARY KEY, expires REAL NOT NULL, value BLOB NOT NULL)"
+        )
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM result_cache WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO result_cache (key, expires, value) VALUES (?, ?, ?)", (key, now + ttl, value)
+            )
+            self._puts += 1
+            if self._puts % self._TRIM_EVERY == 0:
+                self._db.execute("DELETE FROM result_cache WHERE expires <= ?", (now,))
+                self._db.execute(
+                    "DELETE FROM result_cache WHERE key NOT IN "
+                    "(SELECT key FROM result_cache ORDER BY expires DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM result_cache")
+
+
+class RedisError(Exception):
+    """Error reply from the server or a broken connection."""
+
+
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str, prefix: str = "text2sql:qc:", timeout: float = 0.25):
+        """
+        Args:
+            url (str): redis://[:password@]host[:port][/db]
+            prefix (str): Namespace for every key this cache writes.
+            timeout (float): Socket timeout in seconds; a slow cache must not slow queries.
+        """
+        u = urlparse(url)
+        self.host = u.hostname or "localhost"
+        self.port = u.port or 6379
+        self.password = unquote(u.password) if u.password else None
+        self.db = int(u.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: socket.socket | None = None
+        self._buf = b""
+
+    # --- RESP plumbing ---
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._buf = b""
+        if self.password:
+            self._roundtrip("AUTH", self.password)
+        if self.db:
+            self._roundtrip("SELECT", str(self.db))
+
+    def _readline(self) -> bytes:
+        while b"\r\n" not in self._buf:
+            chunk = self._sock.recv(65536)  # type: ignore[union-attr]
+            if not chunk:
+                raise RedisError("connection closed")
+            self._buf += chunk
+        line, self._buf = self._buf.split(b"\r\n", 1)
+        return line
+
+    def _readexact(self, n: int) -> bytes:
+        while len(self._buf) < n + 2:
+            chunk = self._sock.recv(max(65536, n + 2 - len(self._buf)))  # type: ignore[union-attr]
+            if not chunk:
+                raise RedisError("connection closed")
+            self._buf += chunk
+        data, self._buf = self._buf[:n], self._buf[n + 2:]
+        return data
+
+    def _reply(self):
+        line = self._readline()
+        kind, rest = line[:1], line[1:]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            return None if n < 0 else self._readexact(n)
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._reply() for _ in range(n)]
+        raise RedisError(f"unexpected reply {line[:20]!r}")
+
+    def _roundtrip(self, *args: str | bytes):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for a in args:
+            b = a.encode() if isinstance(a, str) else a
+            parts.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        self._sock.sendall(b"".join(parts))  # type: ignore[union-attr]
+        return self._reply()
+
+    def command(self, *args: str | bytes):
+        """Run one command, reconnecting once if the connection went away."""
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._roundtrip(*args)
+                except (OSError, RedisError) as e:
+                    if isinstance(e, RedisError) and str(e) != "connection closed":
+                        raise
+                    self.close()
+                    if attempt:
+                        raise RedisError(str(e)) from e
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._buf = b""
+
+    # --- CacheBackend ---
+    def get(self, key: str) -> bytes | None:
+        return self.command("GET", self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.command("SET", self.prefix + key, value, "PX", str(int(ttl * 1000)))
+
+    def delete(self, key: str) -> None:
+        self.command("DEL", self.prefix + key)
+
+    def clear(self) -> None:
+        keys = self.command("KEYS", self.prefix + "*") or []
+        if keys:
+            self.command("DEL", *keys)
+
+
+def make_backend(kind: str, sqlite_path: str, redis_url: str) -> CacheBackend | None:
+    """Backend for QUERY_CACHE_BACKEND (memory = no shared tier)."""
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return None
+    if kind == "sqlite":
+        return SQLiteBackend(sqlite_path)
+    if kind == "redis":
+        return RedisBackend(redis_url)
+    raise ValueError(f"Unknown QUERY_CACHE_BACKEND: {kind!r} (expected memory, sqlite or redis)")
@@ -0,0 +1,87 @@
+# src/columnar.py
+"""
+Columnar Result: Column header plus one array per column, instead of a dict per row.
+
+Column names are stored once rather than once per row, and numeric columns are
+packed into NumPy arrays (int64 / float64 / bool). NUMERIC values become
+float64, which is also what the row-shaped JSON response sends. Columns with
+NULLs in an integer column, text, dates, etc. stay Python lists.
+"""
+import math
+import sys
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Sequence
+
+import numpy as np
+
+
+def _pack(values: list) -> np.ndarray | list:
+    """Pack one column into a NumPy array when every value is of one numeric kind."""
+    if not values:
+        return values
+    kinds = {type(v) for v in values}
+    if kinds == {bool}:
+        return np.array(values, dtype=np.bool_)
+    if kinds == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            return values
+    if kinds <= {float, Decimal, int, type(None)} and kinds & {float, Decimal}:
+        # NULL -> NaN is lossless for float columns
+        return np.array([math.nan if v is None else float(v) for v in values], dtype=np.float64)
+    return values
+
+
+def _plain(col: np.ndarray | list) -> list:
+    if not isinstance(col, np.ndarray):
+        return col
+    values = col.tolist()
+    if col.dtype.kind == "f" and np.isnan(col).any():
+        values = [None if v != v else v for v in values]
+    return values
+
+
+@dataclass
+class ColumnarResult:
+    columns: list[str]
+    data: list[np.ndarray | list]
+
+    @classmethod
+    def from_rows(cls, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> "ColumnarResult":
+        """
+        Args:
+            columns (Sequence[str]): Column names, in result order.
+            rows (Sequence[Sequence]): Row tuples (e.g. SQLAlchemy Row objects).
+        """
+        columns = list(columns)
+        if not rows:
+            return cls(columns, [[] for _ in columns])
+        return cls(columns, [_pack(list(col)) for col in zip(*rows)])
+
+    def __len__(self) -> int:
+        return len(self.data[0]) if self.data else 0
+
+    def nbytes(self) -> int:
+        """Approximate memory held: array buffers exactly, plain-list columns sampled."""
+        total = sys.getsizeof(self.columns) + sum(sys.getsizeof(c) for c in self.columns)
+        for col in self.data:
+            if isinstance(col, np.ndarray):
+                total += col.nbytes
+            elif col:
+                step = max(1, len(col) // 32)
+                sample = col[::step]
+                total += sys.getsizeof(col) + sum(sys.getsizeof(v) for v in sample) * len(col) // len(sample)
+        return total
+
+    def column(self, name: str) -> np.ndarray | list:
+        return self.data[self.columns.index(name)]
+
+    def to_rows(self) -> list[dict]:
+        """Back to the list-of-dicts shape (NumPy values become Python values, NaN None)."""
+        return [dict(zip(self.columns, values)) for values in zip(*map(_plain, self.data))]
+
+    def to_json(self) -> dict:
+        """JSON-ready {"columns": [...], "data": [[...], ...]}; NaN is sent as null."""
+        return {"columns": self.columns, "data": [_plain(col) for col in self.data]}
@@ -1,127 +1,787 @@
 # src/database.py
+import asyncio
+import hashlib
+import json
+import logging
 import os
-import re
+import sys
+import threading
 import time
 from collections import OrderedDict
-from src.query_validator import sanitize_select
+from typing import AsyncIterator, Iterator
+from src.cache_backends import CacheBackend, decode_entry, encode_entry, make_backend
+from src.columnar import ColumnarResult
+from src.db_pool import PoolMonitor
+from src.plan_summary import summarize_plan
+from src.replicas import ReplicaSet
+from src.schema_catalog import get_catalog
+from src import admission, analytics_replica, index_advisor, rollups, table_changes
+from src.query_validator import SelectAnalysis, analyze_select
+from src.sql_canonical import Canonical, canonicalize_sql
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
 
 from src.utils import require_env
 
+logger = logging.getLogger(__name__)
+
 # Load env vars when running locally (no-op in Docker where env is injected)
 load_dotenv()
 
 # --- Config ---
 DB_URL = require_env("DATABASE_URL")
-RO_URL = require_env("DB_READONLY_URL")  # readonly connection string
+# readonly connection strings: DB_READONLY_URLS (comma-separated replicas) or the single DB_READONLY_URL
+RO_URLS = [u.strip() for u in os.getenv("DB_READONLY_URLS", "").split(",") if u.strip()] or [
+    require_env("DB_READONLY_URL")
+]
+RO_URL = RO_URLS[0]
 TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_SECONDS", "5")) * 1000
 ROW_LIMIT = int(os.getenv("ROW_LIMIT", "1000"))
+# Rows fetched per round trip by the streaming (server-side cursor) readers
+STREAM_FETCH_SIZE = int(os.getenv("STREAM_FETCH_SIZE", "500"))
 
 # Optional cache knobs (set to 0 to disable)
 _CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL_SECONDS", "30"))       # seconds
 _CACHE_MAX = int(os.getenv("QUERY_CACHE_MAX_ROWS", "128"))          # entries
+_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # estimated bytes, all entries
+_CACHE_MAX_ENTRY_BYTES = int(os.getenv("QUERY_CACHE_MAX_ENTRY_BYTES", "0"))         # refuse larger entries; 0 = off
+# Shared tier behind the in-process LRU: memory (none), sqlite (one host) or redis
+_CACHE_BACKEND = os.getenv("QUERY_CACHE_BACKEND", "memory")
+_CACHE_SQLITE_PATH = os.getenv("QUERY_CACHE_SQLITE_PATH", ".cache/query_cache.sqlite3")
+_CACHE_REDIS_URL = os.getenv("QUERY_CACHE_REDIS_URL", "redis://localhost:6379/0")
+_SHARED_RETRY_SECONDS = 30  # skip a failing shared tier for this long
+# Lifetime of results whose tables all have a change signal (see src/table_changes.py)
+_CACHE_TABLE_TTL = int(os.getenv("QUERY_CACHE_TABLE_TTL_SECONDS", "3600"))
+
+# Server-side prepared statements per query shape (see src/sql_canonical.py)
+_PREPARE = os.getenv("DB_PREPARE_STATEMENTS", "1") == "1"
+_PREPARE_AFTER = int(os.getenv("DB_PREPARE_AFTER", "2"))   # executions of a shape before it is prepared
+_PREPARED_MAX = int(os.getenv("DB_PREPARED_MAX", "64"))    # prepared statements kept per connection
 
 # --- Engines ---
 admin_engine = create_engine(DB_URL, pool_pre_ping=True)
-ro_engine = create_engine(RO_URL, pool_pre_ping=True)
+# one pool per readonly DSN, queries routed by health and load (src/replicas.py);
+# session settings once per physical connection, pools sized by DB_POOL_* (src/db_pool.py)
+replicas = ReplicaSet(RO_URLS, TIMEOUT_MS)
+ro_engine = replicas.replicas[0].engine  # first DSN: schema introspection, change polling, scripts
+ro_pool = replicas.replicas[0].monitor
+# optional in-process columnar copy for aggregate queries (src/analytics_replica.py); None when off
+analytics = analytics_replica.make_replica()
+
+# --- In-memory TTL + LRU cache, bounded by entries and estimated bytes ---
+# key -> (timestamp, rows, estimated bytes, table versions); rows is a list of
+# dicts or a ColumnarResult (the shape is part of the key). Entries with table
+# versions live QUERY_CACHE_TABLE_TTL_SECONDS unless one of their tables changes.
+Rows = list[dict] | ColumnarResult
+Deps = table_changes.Snapshot | None
+_cache: "OrderedDict[tuple, tuple[float, Rows, int, Deps]]" = OrderedDict()
+_cache_lock = threading.RLock()
+_cache_bytes = 0
+_cache_counters = {
+    "hits": 0, "shared_hits": 0, "misses": 0, "expirations": 0, "invalidations": 0, "evictions": 0, "rejected": 0,
+}
+
+
+def _estimate_bytes(rows: Rows) -> int:
+    """
+    Approximate memory held by a result: container overhead plus values,
+    measured on an evenly spaced sample of at most 32 rows and scaled up.
+    """
+    if isinstance(rows, ColumnarResult):
+        return rows.nbytes()
+    if not rows:
+        return sys.getsizeof(rows)
+    step = max(1, len(rows) // 32)
+    sample = rows[::step]
+    per_row = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values()) for r in sample) / len(sample)
+    return sys.getsizeof(rows) + int(per_row * len(rows))
+
+
+def cache_stats() -> dict:
+    """Counters since process start plus the current size of the in-process cache."""
+    with _cache_lock:
+        stats = dict(_cache_counters)
+        stats["entries"] = len(_cache)
+        stats["bytes"] = _cache_bytes
+    lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["hits"] + stats["shared_hits"]) / lookups, 4) if lookups else 0.0
+    stats["max_bytes"] = _CACHE_MAX_BYTES
+    stats["max_entries"] = _CACHE_MAX
+    return stats
+
 
-# --- Simple in-memory TTL + LRU cache ---
-# key -> (timestamp, rows)
-_cache: "OrderedDict[tuple, tuple[float, list[dict]]]" = OrderedDict()
+def cache_clear() -> None:
+    """Drop every in-process entry (counters are kept)."""
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
 
 
-def _cache_key(sql: str, params: dict | None, row_limit: int | None) -> tuple:
+def _cache_key(canon: Canonical, params: dict | None, row_limit: int | None, shape: str = "rows") -> tuple:
+    # canonical text + lifted literals: whitespace, keyword case and alias names do not split entries
     return (
-        sql.strip(),
+        canon.sql,
+        canon.values,
         tuple(sorted((params or {}).items())),
         int(row_limit or 0),
+        shape,
     )
 
 
-def _cache_get(key: tuple) -> list[dict] | None:
+# --- Shared (L2) tier, see src/cache_backends.py ---
+_shared: CacheBackend | None = None
+_shared_built = False
+_shared_down_until = 0.0
+
+
+def _shared_backend() -> CacheBackend | None:
+    global _shared, _shared_built
+    if not _shared_built:
+        _shared = make_backend(_CACHE_BACKEND, _CACHE_SQLITE_PATH, _CACHE_REDIS_URL)
+        _shared_built = True
+    return _shared if time.time() >= _shared_down_until else None
+
+
+def _shared_failed(e: Exception) -> None:
+    global _shared_down_until
+    _shared_down_until = time.time() + _SHARED_RETRY_SECONDS
+    logger.warning("shared query cache unavailable for %ss: %s", _SHARED_RETRY_SECONDS, e)
+
+
+def _shared_key(key: tuple) -> str:
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+
+def _admissible(size: int) -> bool:
+    if (_CACHE_MAX_ENTRY_BYTES > 0 and size > _CACHE_MAX_ENTRY_BYTES) or size > _CACHE_MAX_BYTES:
+        with _cache_lock:
+            _cache_counters["rejected"] += 1
+        return False
+    return True
+
+
+def _dependencies(tables: frozenset[str]) -> Deps:
+    """
+    Versions of the tables a statement reads, taken before it runs, or None when some
+    table has no change signal (the entry then gets the short TTL).
+    """
+    if table_changes.LISTEN:
+        table_changes.start_listener()
+    table_changes.refresh()
+    return table_changes.snapshot(tables) if table_changes.covers(tables) else None
+
+
+def _ttl(deps: Deps) -> int:
+    return _CACHE_TABLE_TTL if deps is not None else _CACHE_TTL
+
+
+def _l1_put(key: tuple, ts: float, rows: Rows, size: int, deps: Deps) -> None:
+    global _cache_bytes
+    with _cache_lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= old[2]
+        _cache[key] = (ts, rows, size, deps)
+        _cache_bytes += size
+        while len(_cache) > _CACHE_MAX or _cache_bytes > _CACHE_MAX_BYTES:
+            _, (_, _, evicted, _) = _cache.popitem(last=False)  # evict LRU
+            _cache_bytes -= evicted
+            _cache_counters["evictions"] += 1
+
+
+def _fresh(ts: float, deps: Deps) -> str | None:
+    """None if an entry may be served, else the counter explaining why not."""
+    if (time.time() - ts) > _ttl(deps):
+        return "expirations"
+    if deps is not None:
+        table_changes.refresh()
+        if not table_changes.is_current(deps):
+            return "invalidations"
+    return None
+
+
+def _cache_get(key: tuple) -> Rows | None:
+    global _cache_bytes
     if _CACHE_TTL <= 0 or _CACHE_MAX <= 0:
         return None
-    hit = _cache.get(key)
-    if not hit:
+    with _cache_lock:
+        hit = _cache.get(key)
+    if hit:
+        ts, rows, size, deps = hit
+        stale = _fresh(ts, deps)
+        with _cache_lock:
+            if stale is None:
+                # LRU: move to end on hit
+                if key in _cache:
+                    _cache.move_to_end(key)
+                _cache_counters["hits"] += 1
+                return rows
+            if _cache.get(key) is hit:
+                del _cache[key]
+                _cache_bytes -= size
+            _cache_counters[stale] += 1
+
+    rows = _shared_get(key)
+    with _cache_lock:
+        _cache_counters["shared_hits" if rows is not None else "misses"] += 1
+    return rows
+
+
+def _shared_get(key: tuple) -> Rows | None:
+    backend = _shared_backend()
+    if backend is None:
         return None
-    ts, rows = hit
-    if (time.time() - ts) > _CACHE_TTL:
-        # expired
-        try:
-            del _cache[key]
-        except KeyError:
-            pass
+    try:
+        data = backend.get(_shared_key(key))
+        if data is None:
+            return None
+        ts, rows, deps = decode_entry(data)  # data only, never pickle: other processes write this store
+    except Exception as e:
+        _shared_failed(e)
         return None
-    # LRU: move to end on hit
-    _cache.move_to_end(key)
+    if deps is not None:
+        epoch, versions = deps
+        deps = (epoch, tuple(tuple(v) for v in versions))
+    # polled counters mean the same in every process, so the writer's versions can be checked here
+    if _fresh(ts, deps) is not None:
+        return None
+    size = _estimate_bytes(rows)
+    if _admissible(size):
+        _l1_put(key, ts, rows, size, deps)  # keeps the writer's timestamp, so TTL is not extended
     return rows
 
 
-def _cache_put(key: tuple, rows: list[dict]) -> None:
+def _cache_put(key: tuple, rows: Rows, deps: Deps = None) -> None:
+    """Cache rows; `deps` (from _dependencies, taken before the query ran) enables the long TTL."""
     if _CACHE_TTL <= 0 or _CACHE_MAX <= 0:
         return
-    _cache[key] = (time.time(), rows)
-    _cache.move_to_end(key)
-    while len(_cache) > _CACHE_MAX:
-        _cache.popitem(last=False)  # evict LRU
+    size = _estimate_bytes(rows)
+    if not _admissible(size):
+        return
+    now = time.time()
+    _l1_put(key, now, rows, size, deps)
+
+    backend = _shared_backend()
+    if backend is None:
+        return
+    try:
+        payload = encode_entry((now, rows, deps))
+    except TypeError:
+        return  # a value type with no data-only form: kept in this process only
+    try:
+        backend.set(_shared_key(key), payload, _ttl(deps))
+    except Exception as e:
+        _shared_failed(e)
+
 
+# --- Prepared statements ---
+# Counted per process; each connection keeps its own LRU of prepared names in
+# connection.info (PREPARE is session state, it survives rollbacks).
+PREPARED_STATS = {"prepares": 0, "executes": 0, "deallocates": 0, "fallbacks": 0}
+_shape_counts: "OrderedDict[str, int]" = OrderedDict()
+_unpreparable: set[str] = set()
+_prepare_lock = threading.Lock()
 
-def run_readonly(sql: str, params: dict | None = None, row_limit: int | None = None) -> list[dict]:
+
+def _sqlstate(e: DBAPIError) -> str | None:
+    return getattr(e.orig, "pgcode", None) or getattr(e.orig, "sqlstate", None)
+
+
+def _retryable_plain(e: DBAPIError) -> bool:
+    """True if a failed prepared/bound run may be repeated as plain SQL (not a dead link or a timeout)."""
+    return not e.connection_invalidated and _sqlstate(e) != "57014"
+
+
+def _not_preparable(canon: Canonical) -> None:
+    with _prepare_lock:
+        _unpreparable.add(canon.fingerprint)
+        PREPARED_STATS["fallbacks"] += 1
+
+
+def _prepared_name(c, canon: Canonical) -> str | None:
+    """Name of a prepared statement for canon on connection c, preparing it on first use; None = run plain."""
+    if not _PREPARE or not canon.preparable:
+        return None
+    with _prepare_lock:
+        if canon.fingerprint in _unpreparable:
+            return None
+        seen = _shape_counts.pop(canon.fingerprint, 0) + 1
+        _shape_counts[canon.fingerprint] = seen
+        while len(_shape_counts) > 4096:
+            _shape_counts.popitem(last=False)
+    if seen < _PREPARE_AFTER:
+        return None
+
+    prepared: OrderedDict = c.info.setdefault("prepared", OrderedDict())
+    name = f"t2s_{canon.fingerprint}"
+    if name in prepared:
+        prepared.move_to_end(name)
+        return name
+    try:
+        c.execute(text(f"PREPARE {name} AS {canon.sql}"))
+    except DBAPIError as e:
+        if not _retryable_plain(e):
+            raise
+        c.rollback()
+        _not_preparable(canon)
+        return None
+    prepared[name] = True
+    with _prepare_lock:
+        PREPARED_STATS["prepares"] += 1
+    while len(prepared) > _PREPARED_MAX:
+        old, _ = prepared.popitem(last=False)
+        c.execute(text(f"DEALLOCATE {old}"))
+        with _prepare_lock:
+            PREPARED_STATS["deallocates"] += 1
+    return name
+
+
+def _execute(c, s: str, params: dict | None, canon: Canonical):
     """
-    Execute a safe read-only query on the readonly connection.
+    Run s on connection c. Without caller params, a repeated shape runs as
+    EXECUTE of a server-side prepared statement with the lifted literals, so
+    Postgres plans it once per connection. A shape that fails that way is run
+    as plain SQL and never prepared again.
+    """
+    name = None if params else _prepared_name(c, canon)
+    if name is None:
+        return c.execute(text(s), params or {})
+    args = ", ".join(f":_p{i}" for i in range(1, len(canon.values) + 1))
+    try:
+        result = c.execute(text(f"EXECUTE {name}({args})" if args else f"EXECUTE {name}"), canon.bind_params())
+    except DBAPIError as e:
+        if not _retryable_plain(e):
+            raise
+        c.rollback()
+        c.info.get("prepared", {}).pop(name, None)
+        _not_preparable(canon)
+        return c.execute(text(s))
+    with _prepare_lock:
+        PREPARED_STATS["executes"] += 1
+    return result
 
-    - Enforces statement_timeout.
-    - Caps rows via LIMIT.
-    - Caches identical queries (sql+params+row_limit) in memory for a short TTL.
+
+async def _execute_async(c, s: str, params: dict | None, canon: Canonical):
+    """
+    Async twin of _execute: asyncpg already prepares and caches every statement
+    per connection, so sending the canonical text with the literals as bind
+    parameters is enough for shapes to share a plan.
     """
-    limit = int(row_limit or ROW_LIMIT)
-    s = sql.strip()
+    if params or not _PREPARE or not canon.preparable or not canon.values or canon.fingerprint in _unpreparable:
+        return await c.execute(text(s), params or {})
+    try:
+        return await c.execute(text(canon.bind_sql), canon.bind_params())
+    except DBAPIError as e:
+        # e.g. a string literal compared with a date column: asyncpg wants a date
+        if not _retryable_plain(e):
+            raise
+        await c.rollback()
+        _not_preparable(canon)
+        return await c.execute(text(s))
+
+
+def _shape_result(result, columnar: bool) -> Rows:
+    if columnar:
+        return ColumnarResult.from_rows(list(result.keys()), result.all())
+    return [dict(r) for r in result.mappings().all()]
+
+
+# --- Plan cache (EXPLAIN without ANALYZE) ---
+# (canonical sql, lifted values, params, statistics version) -> (timestamp, EXPLAIN JSON).
+# Serves admission control and /explain in estimate mode; a new ANALYZE, DDL or
+# index changes the statistics version, so stale plans are never served.
+_EXPLAIN = {"estimate": "EXPLAIN (FORMAT JSON)", "analyze": "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)"}
+_PLAN_CACHE_TTL = int(os.getenv("EXPLAIN_CACHE_TTL_SECONDS", "300"))
+_PLAN_CACHE_MAX = int(os.getenv("EXPLAIN_CACHE_MAX_ENTRIES", "256"))
+_STATS_CHECK_SECONDS = float(os.getenv("EXPLAIN_STATS_CHECK_SECONDS", "30"))
+_plan_cache: "OrderedDict[tuple, tuple[float, list]]" = OrderedDict()
+_plan_lock = threading.Lock()
+_plan_counters = {"hits": 0, "misses": 0}
+_stats_version = ""
+_stats_checked_at = 0.0
+
+# Planner inputs per relation (incl. indexes): definition (xmin), size estimates, last analyze.
+# Read on the primary: a standby keeps its own (empty) analyze times, so replicas would disagree.
+_STATS_VERSION_SQL = """
+SELECT md5(coalesce(string_agg(
+    c.oid::text || ':' || c.xmin::text || ':' || c.reltuples::text || ':' || c.relpages::text || ':'
+    || coalesce(s.last_analyze::text, '') || ':' || coalesce(s.last_autoanalyze::text, ''),
+    ',' ORDER BY c.oid), ''))
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p', 'm', 'i')
+"""
+
+
+def stats_version() -> str:
+    """Fingerprint of the planner statistics on the primary, re-read at most every EXPLAIN_STATS_CHECK_SECONDS."""
+    global _stats_version, _stats_checked_at
+    if time.time() - _stats_checked_at >= _STATS_CHECK_SECONDS:
+        try:
+            with admin_engine.connect() as c:
+                _stats_version = c.execute(text(_STATS_VERSION_SQL)).scalar() or ""
+        except Exception as e:
+            logger.warning("statistics version check failed: %s", e)
+        _stats_checked_at = time.time()
+    return _stats_version
+
+
+async def _stats_version_async() -> str:
+    if time.time() - _stats_checked_at >= _STATS_CHECK_SECONDS:
+        return await asyncio.to_thread(stats_version)
+    return _stats_version
+
+
+def _plan_key(canon: Canonical, params: dict | None, version: str) -> tuple:
+    return (canon.sql, canon.values, tuple(sorted((params or {}).items())), version)
+
+
+def _plan_get(key: tuple) -> list | None:
+    with _plan_lock:
+        hit = _plan_cache.get(key)
+        if hit is not None and time.time() - hit[0] <= _PLAN_CACHE_TTL:
+            _plan_cache.move_to_end(key)
+            _plan_counters["hits"] += 1
+            return hit[1]
+        _plan_counters["misses"] += 1
+        return None
+
+
+def _plan_put(key: tuple, res) -> list:
+    if isinstance(res, str):
+        res = json.loads(res)  # asyncpg hands back json as text
+    if _PLAN_CACHE_TTL > 0 and _PLAN_CACHE_MAX > 0:
+        with _plan_lock:
+            _plan_cache[key] = (time.time(), res)
+            _plan_cache.move_to_end(key)
+            while len(_plan_cache) > _PLAN_CACHE_MAX:
+                _plan_cache.popitem(last=False)
+    return res
+
+
+def plan_cache_stats() -> dict:
+    with _plan_lock:
+        return {**_plan_counters, "entries": len(_plan_cache), "stats_version": _stats_version}
+
+
+def plan_cache_clear() -> None:
+    with _plan_lock:
+        _plan_cache.clear()
 
-    # If caller specified row_limit, enforce it by wrapping — this respects any user LIMIT
-    if row_limit is not None:
-        s = f"SELECT * FROM ({s}) AS _t LIMIT {limit}"
+
+def _estimate_plan(s: str, params: dict | None, canon: Canonical) -> tuple[list, bool]:
+    """EXPLAIN (FORMAT JSON) of s (of shape canon) through the plan cache. Returns (plan, cached)."""
+    key = _plan_key(canon, params, stats_version())
+    res = _plan_get(key)
+    if res is not None:
+        return res, True
+    res = replicas.run(lambda c: c.execute(text(f"{_EXPLAIN['estimate']} {s}"), params or {}).scalar())
+    return _plan_put(key, res), False
+
+
+async def _estimate_plan_async(s: str, params: dict | None, canon: Canonical) -> tuple[list, bool]:
+    key = _plan_key(canon, params, await _stats_version_async())
+    res = _plan_get(key)
+    if res is not None:
+        return res, True
+
+    async def work(c):
+        return (await c.execute(text(f"{_EXPLAIN['estimate']} {s}"), params or {})).scalar()
+
+    return _plan_put(key, await replicas.run_async(work)), False
+
+
+def estimate_rows(sql: str) -> int:
+    """Planner's row estimate for a validated SELECT (plan cache; nothing runs)."""
+    return int(_estimate_plan(sql, None, canonicalize_sql(sql))[0][0]["Plan"]["Plan Rows"])
+
+
+async def estimate_rows_async(sql: str) -> int:
+    return int((await _estimate_plan_async(sql, None, canonicalize_sql(sql)))[0][0]["Plan"]["Plan Rows"])
+
+
+def _preflight(s: str, params: dict | None, canon: Canonical) -> admission.Estimate | None:
+    """Planner estimate for admission control (src/admission.py); None when it is off."""
+    if not admission.ENABLED:
+        return None
+    return admission.read_plan(_estimate_plan(s, params, canon)[0])
+
+
+async def _preflight_async(s: str, params: dict | None, canon: Canonical) -> admission.Estimate | None:
+    if not admission.ENABLED:
+        return None
+    return admission.read_plan((await _estimate_plan_async(s, params, canon))[0])
+
+
+def _shape(analysis: SelectAnalysis, s: str) -> Canonical:
+    """Canonical shape of s: the analysis' own, or parsed once for a rollup rewrite."""
+    return analysis.canonical if s == analysis.sql else canonicalize_sql(s)
+
+
+def _execution_sql(analysis: SelectAnalysis) -> str:
+    """analysis.sql, or the same query answered from a fresh rollup (src/rollups.py)."""
+    rewritten = rollups.rewrite(analysis.sql, analysis.tree)
+    if rewritten is None:
+        return analysis.sql
+    return rollups.use(analysis.sql, rewritten, rollups.fresh(replicas.run))
+
+
+async def _execution_sql_async(analysis: SelectAnalysis) -> str:
+    rewritten = rollups.rewrite(analysis.sql, analysis.tree)
+    if rewritten is None:
+        return analysis.sql
+    if rollups.check_due():
+        fresh = await asyncio.to_thread(rollups.fresh, replicas.run)
     else:
-        # Otherwise, add LIMIT if none exists at the end
-        if not re.search(r"\blimit\b\s+\d+\s*$", s, re.I) and not re.search(r"\bfetch\s+first\b", s, re.I):
-            s = f"{s}\nLIMIT {limit}"
+        fresh = rollups.fresh(replicas.run)
+    return rollups.use(analysis.sql, rewritten, fresh)
+
+
+def _analytics_rows(analysis: SelectAnalysis, s: str, params: dict | None, columnar: bool) -> Rows | None:
+    """Rows from the analytics replica (src/analytics_replica.py), or None to run on Postgres."""
+    if analytics is None or params or s != analysis.sql:  # bound or answered by a rollup
+        return None
+    analytics.start(ro_engine)  # first call: loads the snapshot in the background
+    if not analytics.eligible(analysis):
+        return None
+    return analytics.run(analysis, columnar, TIMEOUT_MS / 1000)
+
+
+def _record_workload(
+    s: str, params: dict | None, canon: Canonical, started: float, estimate: admission.Estimate | None
+) -> bool:
+    """
+    Count an executed statement for the index advisor (src/index_advisor.py); bound
+    queries are skipped. Returns True when the workload log is due a flush.
+    """
+    if params:
+        return False  # the advisor re-plans the text, which needs its literals
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return index_advisor.record(canon.fingerprint, s, elapsed_ms, estimate.cost if estimate else None)
+
 
-    key = _cache_key(s, params, limit)
+def run_readonly(
+    sql: str, params: dict | None = None, row_limit: int | None = None, columnar: bool = False
+) -> Rows:
+    """
+    Execute a safe read-only query on the readonly connection.
+
+    - Enforces statement_timeout.
+    - Validates and caps rows with one parse (src/query_validator.py): an existing top-level
+      LIMIT is lowered to row_limit, otherwise one is added. Sanitized SQL is not parsed again.
+    - On a cache miss, checks the planner's cost estimate first: too expensive raises
+      AdmissionError (a ValueError); otherwise the query waits for a slot of its cost tier.
+    - Runs repeated query shapes (canonicalized from the parse tree, src/sql_canonical.py) as
+      server-side prepared statements.
+    - Answers sales aggregates from a pre-aggregated rollup when one fits and is fresh (src/rollups.py).
+    - Otherwise, with ANALYTICS_REPLICA set, runs other aggregate queries on the in-process
+      DuckDB snapshot, falling back to Postgres for anything it cannot run (src/analytics_replica.py).
+    - Records executed statements per shape for the index advisor (src/index_advisor.py).
+    - Caches identical queries (canonical sql+literals+params+row_limit+shape) in memory for a short TTL,
+      or for hours when every table the SQL reads has a change signal (src/table_changes.py);
+      rollup and snapshot answers keep the short TTL.
+    - columnar=True returns a ColumnarResult (header + per-column arrays) instead of a dict per row.
+    """
+    analysis = analyze_select(sql, row_limit or ROW_LIMIT)
+    s = analysis.sql
+
+    key = _cache_key(analysis.canonical, params, analysis.limit, "columnar" if columnar else "rows")
     cached = _cache_get(key)
     if cached is not None:
         return cached
 
-    with ro_engine.connect() as c:
-        c.execute(text(f"SET statement_timeout = {TIMEOUT_MS}"))
-        rows = [dict(r) for r in c.execute(text(s), params or {}).mappings().all()]
+    deps = _dependencies(analysis.tables)
+    s = _execution_sql(analysis)
+    rows = _analytics_rows(analysis, s, params, columnar)
+    if rows is not None:
+        _cache_put(key, rows)  # the snapshot may trail the table versions: short TTL only
+        return rows
+    canon = _shape(analysis, s)
+    estimate = _preflight(s, params, canon)
+    started = time.perf_counter()
+    with admission.admit(estimate):
+        rows = replicas.run(lambda c: _shape_result(_execute(c, s, params, canon), columnar))
+
+    if _record_workload(s, params, canon, started, estimate):
+        index_advisor.flush()
+    # a rollup changes on its refresh, not with the tables: short TTL only
+    _cache_put(key, rows, deps if s == analysis.sql else None)
+    return rows
+
+
+def stream_readonly(
+    sql: str, params: dict | None = None, row_limit: int | None = None, fetch_size: int = STREAM_FETCH_SIZE
+) -> Iterator[dict]:
+    """
+    Yield rows of a read-only query one at a time from a server-side (named)
+    cursor, fetching `fetch_size` rows per round trip. Same LIMIT handling and
+    timeout as run_readonly, but nothing is cached and the full result is never
+    held in memory. The connection is held until the generator is exhausted or closed.
+    """
+    analysis = analyze_select(sql, row_limit or ROW_LIMIT)
+    s = _execution_sql(analysis)
+
+    with admission.admit(_preflight(s, params, _shape(analysis, s))), replicas.connect() as c:
+        result = c.execution_options(stream_results=True, yield_per=fetch_size).execute(text(s), params or {})
+        for r in result.mappings():
+            yield dict(r)
+
+
+# --- Async engines (asyncpg) ---
+# One pool per replica and running event loop: asyncpg connections are bound to
+# the loop that opened them. In production (uvicorn) that is a single loop.
+def async_ro_engine():
+    """Return the asyncpg-backed engine of the first readonly DSN for the running event loop."""
+    return async_ro_pool().engine
+
+
+def async_ro_pool() -> PoolMonitor:
+    """PoolMonitor of async_ro_engine() for the running event loop."""
+    return replicas.replicas[0].async_monitor()
+
+
+def pool_stats() -> dict:
+    """Per-replica health, load and pool counters (checkouts, waiters, wait times), plus prepared statement counters."""
+    stats = replicas.stats()
+    stats["prepared_statements"] = dict(PREPARED_STATS)
+    return stats
+
+
+def analytics_stats() -> dict:
+    """Analytics replica counters and snapshot age, or {"engine": None} when it is off."""
+    return analytics.stats() if analytics is not None else {"engine": None}
+
+
+async def run_readonly_async(
+    sql: str, params: dict | None = None, row_limit: int | None = None, columnar: bool = False
+) -> Rows:
+    """
+    Async twin of run_readonly: same LIMIT handling and cache, but the query
+    runs on the asyncpg pool so waiting on Postgres costs a coroutine, not a thread.
+    """
+    analysis = analyze_select(sql, row_limit or ROW_LIMIT)
+    s = analysis.sql
+
+    key = _cache_key(analysis.canonical, params, analysis.limit, "columnar" if columnar else "rows")
+    # the cache may poll change counters and read/write the shared SQLite/Redis tier
+    cached = await asyncio.to_thread(_cache_get, key)
+    if cached is not None:
+        return cached
+
+    deps = await asyncio.to_thread(_dependencies, analysis.tables)  # may poll change counters
+    s = await _execution_sql_async(analysis)
+    if analytics is not None:
+        rows = await asyncio.to_thread(_analytics_rows, analysis, s, params, columnar)
+        if rows is not None:
+            await asyncio.to_thread(_cache_put, key, rows)
+            return rows
 
-    _cache_put(key, rows)
+    canon = _shape(analysis, s)
+
+    async def work(c):
+        return _shape_result(await _execute_async(c, s, params, canon), columnar)
+
+    estimate = await _preflight_async(s, params, canon)
+    started = time.perf_counter()
+    async with admission.admit_async(estimate):
+        rows = await replicas.run_async(work)
+
+    if _record_workload(s, params, canon, started, estimate):
+        await asyncio.to_thread(index_advisor.flush)  # appends to the workload log
+    # a rollup changes on its refresh, not with the tables: short TTL only
+    await asyncio.to_thread(_cache_put, key, rows, deps if s == analysis.sql else None)
     return rows
 
+
+async def stream_readonly_async(
+    sql: str, params: dict | None = None, row_limit: int | None = None, fetch_size: int = STREAM_FETCH_SIZE
+) -> AsyncIterator[dict]:
+    """Async twin of stream_readonly (asyncpg server-side cursor)."""
+    analysis = analyze_select(sql, row_limit or ROW_LIMIT)
+    s = await _execution_sql_async(analysis)
+
+    async with admission.admit_async(await _preflight_async(s, params, _shape(analysis, s))), replicas.aconnect() as c:
+        result = await c.stream(text(s), params or {}, execution_options={"yield_per": fetch_size})
+        async for r in result.mappings():
+            yield dict(r)
+
 # ---- Execution plan (safe) ----
-def explain_sql(sql: str, row_limit: int | None = 50) -> dict:
+def _check_mode(mode: str) -> None:
+    if mode not in _EXPLAIN:
+        raise ValueError(f"Unknown explain mode {mode!r} (expected 'estimate' or 'analyze')")
+
+
+def explain_sql(sql: str, row_limit: int | None = 50, mode: str = "analyze") -> dict:
     """
-    Run a safe EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) on a SELECT.
-    - Reuses sanitize_select to prevent non-SELECT & to cap rows.
-    - Applies statement_timeout.
-    Returns a JSON-ready dict with the plan & timings.
+    Explain a SELECT safely.
+    - mode="analyze": EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON), which runs the query
+      (after admission control) and reports actual times, rows and spills.
+    - mode="estimate": plain EXPLAIN, nothing runs; served from the plan cache
+      while the statistics version is unchanged. Cheap enough for dashboards.
+    - Reuses analyze_select to prevent non-SELECT & to cap rows.
+    - statement_timeout is applied per connection (src/db_pool.py).
+    Returns a JSON-ready dict with the plan, timings and a hotspot summary (src/plan_summary.py).
     """
-    safe_sql = sanitize_select(sql, row_limit=row_limit or 50) # type: ignore
+    _check_mode(mode)
+    analysis = analyze_select(sql, row_limit or 50)
+    safe_sql = analysis.sql
 
-    with ro_engine.connect() as c:
-        c.execute(text(f"SET statement_timeout = {TIMEOUT_MS}"))
+    if mode == "estimate":
+        res, cached = _estimate_plan(safe_sql, None, analysis.canonical)
+    else:
         # FORMAT JSON returns a single JSON value (list with one dict)
-        res = c.execute(
-            text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {safe_sql}")
-        ).scalar()
+        with admission.admit(_preflight(safe_sql, None, analysis.canonical)):
+            res = replicas.run(lambda c: c.execute(text(f"{_EXPLAIN['analyze']} {safe_sql}")).scalar())
+        cached = False
+
+    return _plan_result(safe_sql, res, mode, cached)
+
+
+async def explain_sql_async(sql: str, row_limit: int | None = 50, mode: str = "analyze") -> dict:
+    """Async twin of explain_sql (runs on the asyncpg pool)."""
+    _check_mode(mode)
+    analysis = analyze_select(sql, row_limit or 50)
+    safe_sql = analysis.sql
+
+    if mode == "estimate":
+        res, cached = await _estimate_plan_async(safe_sql, None, analysis.canonical)
+    else:
+        async def work(c):
+            return (await c.execute(text(f"{_EXPLAIN['analyze']} {safe_sql}"))).scalar()
+
+        async with admission.admit_async(await _preflight_async(safe_sql, None, analysis.canonical)):
+            res = await replicas.run_async(work)
+        cached = False
+
+    # summarizing reads the schema catalog (introspected on first use)
+    return await asyncio.to_thread(_plan_result, safe_sql, res, mode, cached)
+
+
+def _table_rows() -> dict[str, int]:
+    """Row estimates from the schema catalog, to size seq scans in plan summaries."""
+    try:
+        return {name: t.row_estimate for name, t in get_catalog().tables.items()}
+    except Exception:
+        return {}
+
 
+def _plan_result(safe_sql: str, res, mode: str = "analyze", cached: bool = False) -> dict:
+    # asyncpg hands back json as text
+    if isinstance(res, str):
+        res = json.loads(res)
     # res looks like: [ { "Plan": {...}, "Planning Time": X, "Execution Time": Y, ... } ]
     top = res[0] if isinstance(res, list) and res else {}
     plan = top.get("Plan", {})
     return {
         "sql": safe_sql,
+        "mode": mode,
+        "cached": cached,
         "plan": plan,  # full node tree
+        "summary": summarize_plan(top, _table_rows()),
         "planning_time_ms": top.get("Planning Time"),
         "execution_time_ms": top.get("Execution Time"),
         "jit": top.get("JIT"),
@@ -0,0 +1,174 @@
+# src/db_pool.py
+"""
+DB Pool: Connection lifecycle for the read-only engines.
+
+- Session settings (statement_timeout, application_name) are sent as startup
+  options, i.e. applied once per physical connection instead of a SET per checkout.
+- Pool size, overflow, recycle and checkout timeout come from DB_POOL_* env vars.
+- Pre-ping is off by default; instead a statement that fails because its
+  connection died is retried once on a fresh connection (see run_with_reconnect).
+- PoolMonitor counts checkouts, waiters and time spent waiting for a connection
+  so the pool can be sized under load.
+"""
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, TypeVar
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))   # seconds; -1 = never
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))   # seconds to wait for a free connection
+PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "text2sql-readonly")
+CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))  # seconds; an unreachable replica fails fast
+
+T = TypeVar("T")
+
+
+def pool_options(**overrides) -> dict:
+    opts = {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_pre_ping": PRE_PING,
+    }
+    opts.update(overrides)
+    return opts
+
+
+def create_ro_engine(url: str, timeout_ms: int, **overrides):
+    """psycopg2 engine whose connections start with the read-only session settings."""
+    options = f"-c statement_timeout={int(timeout_ms)}"
+    return create_engine(
+        url,
+        connect_args={"options": options, "application_name": APPLICATION_NAME, "connect_timeout": CONNECT_TIMEOUT},
+        **pool_options(**overrides),
+    )
+
+
+def async_connect_args(timeout_ms: int) -> dict:
+    """asyncpg equivalent of create_ro_engine's startup options."""
+    return {
+        "server_settings": {"statement_timeout": str(int(timeout_ms)), "application_name": APPLICATION_NAME},
+        "timeout": CONNECT_TIMEOUT,
+    }
+
+
+class PoolMonitor:
+    """Pool counters for one engine (sync or async)."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._pool = getattr(engine, "sync_engine", engine).pool
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.counters = {
+            "checkouts": 0, "connects": 0, "invalidations": 0, "reconnect_retries": 0, "checkout_errors": 0,
+        }
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        target = self._pool
+        event.listen(target, "connect", lambda *a: self._count("connects"))
+        event.listen(target, "invalidate", lambda *a: self._count("invalidations"))
+        event.listen(target, "soft_invalidate", lambda *a: self._count("invalidations"))
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def _begin_wait(self) -> float:
+        with self._lock:
+            self.waiting += 1
+        return time.perf_counter()
+
+    def _end_wait(self, t0: float, ok: bool) -> None:
+        waited = time.perf_counter() - t0
+        with self._lock:
+            self.waiting -= 1
+            if ok:
+                self.counters["checkouts"] += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            else:
+                self.counters["checkout_errors"] += 1
+
+    @contextmanager
+    def connect(self):
+        """engine.connect() that records how long the checkout waited."""
+        t0 = self._begin_wait()
+        try:
+            conn = self.engine.connect()
+        except Exception:
+            self._end_wait(t0, False)
+            raise
+        self._end_wait(t0, True)
+        with conn:
+            yield conn
+
+    @asynccontextmanager
+    async def aconnect(self):
+        """Async twin of connect() for an AsyncEngine."""
+        t0 = self._begin_wait()
+        try:
+            conn = await self.engine.connect().start()
+        except Exception:
+            self._end_wait(t0, False)
+            raise
+        self._end_wait(t0, True)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    def stats(self) -> dict:
+        pool = self._pool
+        with self._lock:
+            checkouts = self.counters["checkouts"]
+            out = dict(self.counters)
+            out.update(
+                waiting=self.waiting,
+                wait_ms_total=round(self.wait_total * 1000, 3),
+                wait_ms_avg=round(self.wait_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                wait_ms_max=round(self.wait_max * 1000, 3),
+            )
+        for name in ("size", "checkedout", "overflow", "checkedin"):
+            fn = getattr(pool, name, None)
+            if callable(fn):
+                out["checked_out" if name == "checkedout" else name] = fn()
+        return out
+
+
+def run_with_reconnect(monitor: PoolMonitor, work: Callable[..., T]) -> T:
+    """
+    Run work(conn) on a pooled connection; if the connection turns out to be
+    dead (server restart, idle kill), retry once on a fresh one. Read-only
+    statements are safe to repeat.
+    """
+    for attempt in (0, 1):
+        try:
+            with monitor.connect() as c:
+                return work(c)
+        except DBAPIError as e:
+            if attempt or not e.connection_invalidated:
+                raise
+            monitor._count("reconnect_retries")
+    raise AssertionError("unreachable")
+
+
+async def run_with_reconnect_async(monitor: PoolMonitor, work):
+    """Async twin of run_with_reconnect; work is an async callable."""
+    for attempt in (0, 1):
+        try:
+            async with monitor.aconnect() as c:
+                return await work(c)
+        except DBAPIError as e:
+            if attempt or not e.connection_invalidated:
+                raise
+            monitor._count("reconnect_retries")
+    raise AssertionError("unreachable")
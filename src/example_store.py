@@ -0,0 +1,162 @@
+# src/example_store.py
+"""
+Example Store: Local few-shot corpus with a vectorized similarity index.
+
+Examples are read from a JSON-lines file ({"q": ..., "sql": ...} per line) and
+indexed once as L2-normalized TF-IDF vectors over hashed unigrams and bigrams
+of the normalized question. The index is kept as sparse postings in NumPy
+arrays, so scoring a question only touches the examples that share a term with
+it and picking the k most similar examples stays far below a millisecond even
+for thousands of examples. No network embedding service is involved.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from src.question_cache import normalize_question
+
+FEW_SHOT_PATH = os.getenv(
+    "FEW_SHOT_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "examples", "few_shots.jsonl"),
+)
+# Examples sent per prompt
+FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", "3"))
+
+# hashed feature space; postings are sparse, so a large space costs nothing
+_DIM = 1 << 20
+
+
+def _features(question: str) -> Counter:
+    """Hashed unigram + bigram counts of the normalized question."""
+    words = normalize_question(question).split()
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return Counter(zlib.crc32(g.encode("utf-8")) % _DIM for g in grams)
+
+
+def _sql_key(sql: str) -> str:
+    return " ".join(sql.lower().split())
+
+
+def render_example(ex: dict) -> str:
+    return f"Q: {ex['q']}\nSQL: {ex['sql'].strip()}"
+
+
+def load_examples(path: str) -> list[dict]:
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                ex = json.loads(line)
+                examples.append({"q": ex["q"], "sql": ex["sql"]})
+    return examples
+
+
+class ExampleStore:
+    def __init__(self, examples: list[dict]):
+        """
+        Args:
+            examples (list[dict]): Items like {"q": "...", "sql": "..."}; earlier
+                items are preferred when nothing in the corpus matches a question.
+        """
+        self.examples = list(examples)
+        self._rendered = [render_example(ex) for ex in self.examples]
+        # near-duplicates (same SQL up to case/whitespace) share a group and are sent once
+        groups: dict[str, int] = {}
+        self._group = [groups.setdefault(_sql_key(ex["sql"]), len(groups)) for ex in self.examples]
+
+        docs = [_features(ex["q"]) for ex in self.examples]
+        n = len(docs)
+        df = Counter(f for doc in docs for f in doc)
+        self._idf = {f: math.log((1 + n) / (1 + d)) + 1.0 for f, d in df.items()}
+
+        postings: dict[int, tuple[list[int], list[float]]] = {}
+        for i, doc in enumerate(docs):
+            weights = {f: (1.0 + math.log(tf)) * self._idf[f] for f, tf in doc.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for f, w in weights.items():
+                ids, ws = postings.setdefault(f, ([], []))
+                ids.append(i)
+                ws.append(w / norm)
+        # feature -> (example ids, normalized weights)
+        self._postings = {
+            f: (np.asarray(ids, dtype=np.int32), np.asarray(ws, dtype=np.float32))
+            for f, (ids, ws) in postings.items()
+        }
+
+        digest = hashlib.sha256()
+        for text in self._rendered:
+            digest.update(text.encode("utf-8"))
+            digest.update(b"\0")
+        self.version = digest.hexdigest()[:16]
+
+    @classmethod
+    def from_file(cls, path: str) -> "ExampleStore":
+        return cls(load_examples(path))
+
+    def __len__(self) -> int:
+        return len(self.examples)
+
+    def scores(self, question: str) -> np.ndarray:
+        """Cosine similarity of the question to every example."""
+        n = len(self.examples)
+        ids, ws = [], []
+        for f, tf in _features(question).items():
+            hit = self._postings.get(f)
+            if hit is not None:
+                ids.append(hit[0])
+                ws.append(hit[1] * ((1.0 + math.log(tf)) * self._idf[f]))
+        if not ids:
+            return np.zeros(n, dtype=np.float64)
+        # query norm is left out: it scales every score equally
+        return np.bincount(np.concatenate(ids), weights=np.concatenate(ws), minlength=n)
+
+    def top_k(self, question: str, k: int = FEW_SHOT_K) -> list[int]:
+        """
+        Indices of the k most similar examples, best first, at most one per
+        distinct SQL. Falls back to corpus order when nothing overlaps.
+        """
+        n = len(self.examples)
+        if k <= 0 or n == 0:
+            return []
+        scores = self.scores(question)
+        # over-fetch a little so dropping duplicates still leaves k
+        m = min(n, k * 4)
+        cand = np.argpartition(-scores, m - 1)[:m] if m < n else np.arange(n)
+        cand = cand[np.lexsort((cand, -scores[cand]))]
+        if m < n and len({self._group[i] for i in cand.tolist()}) < k:
+            cand = np.lexsort((np.arange(n), -scores))
+
+        picked: list[int] = []
+        seen: set[int] = set()
+        for i in cand.tolist():
+            if self._group[i] not in seen:
+                seen.add(self._group[i])
+                picked.append(i)
+                if len(picked) == k:
+                    break
+        return picked
+
+    def render(self, question: str, k: int = FEW_SHOT_K) -> str:
+        """Prompt-ready examples block for the question."""
+        return "\n\n".join(self._rendered[i] for i in self.top_k(question, k))
+
+
+_store: ExampleStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_example_store() -> ExampleStore:
+    """Process-wide store built from FEW_SHOT_PATH on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ExampleStore.from_file(FEW_SHOT_PATH)
+    return _store
@@ -0,0 +1,467 @@
+# src/index_advisor.py
+"""
+Index Advisor: Suggest indexes for the workload that actually runs.
+
+- Workload: run_readonly records every executed statement by canonical shape
+  (src/sql_canonical.py): calls, time spent, and the planner's estimate when
+  admission control computed one. With WORKLOAD_LOG_PATH set, the counts are
+  appended as JSON lines every WORKLOAD_FLUSH_SECONDS, so the advisor can
+  read the workload of every API worker.
+- Candidates: from each statement's syntax tree (sqlglot), per table: a btree on
+  each filtered/joined column, a composite of equality columns followed by one
+  range column, the same with INCLUDE of the other columns the query reads
+  (covering, for index-only scans), and expression indexes for expressions
+  used in WHERE/GROUP BY/ORDER BY.
+- Evaluation: every workload query is planned with and without a candidate.
+  With the hypopg extension the index is hypothetical. Otherwise it is built
+  inside a savepoint that is rolled back, which needs the table owner and holds
+  a SHARE lock on the table while it builds. Indexes are picked greedily by
+  (calls x cost saved) until nothing saves at least ADVISOR_MIN_GAIN of
+  the workload's cost.
+
+render_ddl() turns the advice into a commented CREATE INDEX CONCURRENTLY script
+for review (scripts/advise_indexes.py).
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, NamedTuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.optimizer.scope import traverse_scope
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+RECORD = os.getenv("WORKLOAD_RECORD", "1") == "1"
+LOG_PATH = os.getenv("WORKLOAD_LOG_PATH", "")  # empty = keep the workload in memory only
+FLUSH_SECONDS = float(os.getenv("WORKLOAD_FLUSH_SECONDS", "30"))
+MAX_SHAPES = int(os.getenv("WORKLOAD_MAX_SHAPES", "1024"))
+MAX_INDEXES = int(os.getenv("ADVISOR_MAX_INDEXES", "5"))
+MIN_GAIN = float(os.getenv("ADVISOR_MIN_GAIN", "0.02"))  # fraction of the workload's estimated cost
+_MAX_INCLUDE = 4
+_RANGE = (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between)
+
+
+class WorkloadEntry(NamedTuple):
+    fingerprint: str
+    sql: str           # last executed text of the shape (runnable, literals inline)
+    calls: int
+    total_ms: float
+    plan_cost: float | None  # planner estimate when admission control produced one
+
+
+class Candidate(NamedTuple):
+    table: str
+    keys: tuple[str, ...]          # column names, or "(expression)"
+    include: tuple[str, ...] = ()
+
+    @property
+    def name(self) -> str:
+        words = [re.sub(r"[^a-z0-9]+", "_", k.lower()).strip("_") for k in self.keys]
+        name = "_".join(["idx", self.table, *words] + (["incl"] if self.include else []))
+        return name[:63]
+
+    def ddl(self, concurrently: bool = False) -> str:
+        how = "CONCURRENTLY IF NOT EXISTS " if concurrently else ""
+        include = f" INCLUDE ({', '.join(self.include)})" if self.include else ""
+        return f"CREATE INDEX {how}{self.name} ON {self.table} ({', '.join(self.keys)}){include}"
+
+
+class Recommendation(NamedTuple):
+    candidate: Candidate
+    gain: float                     # calls x planner cost saved, summed over the workload
+    helps: dict[str, tuple[float, float]]  # fingerprint -> (cost before, cost after)
+    size_bytes: int | None
+
+
+class Advice(NamedTuple):
+    recommendations: list[Recommendation]
+    baseline_cost: float            # calls x cost over the workload, before
+    final_cost: float               # ... with every recommendation
+    queries: dict[str, WorkloadEntry]
+    rejected: dict[str, str]        # candidate name -> why it could not be evaluated
+    method: str                     # "hypopg" or "rollback"
+
+
+# ---------- workload ----------
+_lock = threading.Lock()
+_workload: "OrderedDict[str, dict]" = OrderedDict()
+_unflushed: dict[str, dict] = {}
+_flushed_at = time.time()
+
+
+def record(fingerprint: str, sql: str, elapsed_ms: float, plan_cost: float | None = None) -> bool:
+    """
+    Count one execution of a statement shape (called by run_readonly). Returns True
+    when the log is due a flush(); the caller runs it (off the event loop in async code).
+    """
+    if not RECORD:
+        return False
+    with _lock:
+        for book in (_workload, _unflushed):
+            e = book.get(fingerprint)
+            if e is None:
+                e = book[fingerprint] = {"fingerprint": fingerprint, "calls": 0, "total_ms": 0.0, "plan_cost": None}
+            e["sql"] = sql
+            e["calls"] += 1
+            e["total_ms"] += elapsed_ms
+            if plan_cost is not None:
+                e["plan_cost"] = plan_cost
+        _workload.move_to_end(fingerprint)
+        while len(_workload) > MAX_SHAPES:
+            _workload.popitem(last=False)
+        return bool(LOG_PATH) and time.time() - _flushed_at >= FLUSH_SECONDS
+
+
+def flush(path: str | None = None) -> None:
+    """Append the counts since the last flush to the workload log."""
+    global _flushed_at
+    path = path or LOG_PATH
+    with _lock:
+        batch = list(_unflushed.values())
+        _unflushed.clear()
+        _flushed_at = time.time()
+    if not path or not batch:
+        return
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for e in batch:
+                f.write(json.dumps(e) + "\n")
+    except OSError as e:
+        logger.warning("workload log %s not written: %s", path, e)
+
+
+def workload() -> list[WorkloadEntry]:
+    """This process's workload, most recently executed last."""
+    with _lock:
+        return [_entry(e) for e in _workload.values()]
+
+
+def load_workload(paths: Iterable[str]) -> list[WorkloadEntry]:
+    """Sum workload log lines (from any number of workers) per shape."""
+    merged: dict[str, dict] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                e = json.loads(line)
+                m = merged.setdefault(e["fingerprint"], {**e, "calls": 0, "total_ms": 0.0})
+                m["sql"] = e["sql"]
+                m["calls"] += e["calls"]
+                m["total_ms"] += e["total_ms"]
+                if e.get("plan_cost") is not None:
+                    m["plan_cost"] = e["plan_cost"]
+    return [_entry(e) for e in merged.values()]
+
+
+def clear_workload() -> None:
+    with _lock:
+        _workload.clear()
+        _unflushed.clear()
+
+
+def _entry(e: dict) -> WorkloadEntry:
+    return WorkloadEntry(e["fingerprint"], e["sql"], e["calls"], round(e["total_ms"], 3), e.get("plan_cost"))
+
+
+# ---------- candidates ----------
+def _conjuncts(node: exp.Expression | None) -> list[exp.Expression]:
+    if node is None:
+        return []
+    node = (node.this if isinstance(node, exp.Where) else node).unnest()
+    return list(node.flatten()) if isinstance(node, exp.And) else [node]
+
+
+def _is_value(node: exp.Expression) -> bool:
+    """A literal, bind parameter, or an expression without columns (e.g. CURRENT_DATE - INTERVAL '1 year')."""
+    return not any(node.find_all(exp.Column)) and not any(node.find_all(exp.Select))
+
+
+def _expression_key(node: exp.Expression, table_of: dict[str, str]) -> tuple[str, str] | None:
+    """(table, "(expr)") for an expression over the columns of one base table."""
+    cols = list(node.find_all(exp.Column))
+    tables = {table_of.get(c.table) for c in cols}
+    if not cols or len(tables) != 1 or None in tables or any(node.find_all(exp.AggFunc, exp.Select)):
+        return None
+    bare = node.copy()
+    for c in list(bare.find_all(exp.Column)):
+        c.replace(exp.column(c.name))
+    return tables.pop(), f"({bare.sql(dialect='postgres')})"
+
+
+class _Use:
+    """Columns one scope uses from one table, by role."""
+
+    def __init__(self):
+        self.eq: list[str] = []
+        self.range: list[str] = []
+        self.join: list[str] = []
+        self.order: list[str] = []
+        self.exprs: list[str] = []
+        self.read: set[str] = set()
+
+    @staticmethod
+    def add(bucket: list[str], key: str) -> None:
+        if key not in bucket:
+            bucket.append(key)
+
+
+def _uses(tree: exp.Expression, columns: dict[str, list[str]]) -> dict[str, _Use]:
+    schema = {t: {c: "text" for c in cols} for t, cols in columns.items()}
+    tree = qualify(tree, schema=schema, dialect="postgres", validate_qualify_columns=False, quote_identifiers=False)
+    uses: dict[str, _Use] = {}
+    for scope in traverse_scope(tree):
+        table_of = {
+            alias: src.name for alias, src in scope.sources.items()
+            if isinstance(src, exp.Table) and src.name in columns
+        }
+
+        def use(table: str) -> _Use:
+            return uses.setdefault(table, _Use())
+
+        for col in scope.columns:
+            if col.table in table_of:
+                use(table_of[col.table]).read.add(col.name)
+
+        select = scope.expression
+        if not isinstance(select, exp.Select):
+            continue
+        conditions = _conjuncts(select.args.get("where"))
+        for join in select.args.get("joins") or ():
+            conditions += _conjuncts(join.args.get("on"))
+        for cond in conditions:
+            if isinstance(cond, (exp.EQ, exp.In, *_RANGE)):
+                left = cond.this.unnest()
+                rights = [cond.args.get(k) for k in ("expression", "low", "high") if cond.args.get(k) is not None]
+                rights += cond.expressions if isinstance(cond, exp.In) else []
+                role = "eq" if isinstance(cond, (exp.EQ, exp.In)) else "range"
+                if isinstance(cond, exp.EQ) and isinstance(left, exp.Column) and isinstance(cond.expression.unnest(), exp.Column):
+                    for side in (left, cond.expression.unnest()):
+                        if side.table in table_of:
+                            _Use.add(use(table_of[side.table]).join, side.name)
+                    continue
+                if not rights or not all(_is_value(r) for r in rights):
+                    # value on the left: "5 < t.x"
+                    if isinstance(cond, (exp.EQ, *_RANGE[:4])) and _is_value(left):
+                        left = cond.expression.unnest()
+                    else:
+                        continue
+                if isinstance(left, exp.Column) and left.table in table_of:
+                    _Use.add(getattr(use(table_of[left.table]), role), left.name)
+                else:
+                    key = _expression_key(left, table_of)
+                    if key:
+                        _Use.add(use(key[0]).exprs, key[1])
+        group = select.args.get("group")
+        order = select.args.get("order")
+        for node in [*(group.expressions if group else ()), *(o.this for o in (order.expressions if order else ()))]:
+            node = node.unnest()
+            if isinstance(node, exp.Column):
+                if node.table in table_of:
+                    _Use.add(use(table_of[node.table]).order, node.name)
+            else:
+                key = _expression_key(node, table_of)
+                if key:
+                    _Use.add(use(key[0]).exprs, key[1])
+    return uses
+
+
+def candidates(sql: str, columns: dict[str, list[str]]) -> list[Candidate]:
+    """
+    Candidate indexes for one statement.
+    Args:
+        sql (str): A SELECT.
+        columns (dict[str, list[str]]): Column names per table of the schema.
+    """
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+        uses = _uses(tree, columns)
+    except (SqlglotError, ValueError, KeyError) as e:
+        logger.debug("no candidates for %s: %s", sql, e)
+        return []
+    out: list[Candidate] = []
+
+    def add(c: Candidate) -> None:
+        if c.keys and c not in out:
+            out.append(c)
+
+    for table, u in uses.items():
+        for col in u.eq + u.range + u.join:
+            add(Candidate(table, (col,)))
+        for key in u.exprs:
+            add(Candidate(table, (key,)))
+        keys = tuple(u.eq) + tuple(u.range[:1])
+        if not keys:
+            keys = tuple(u.order)
+        if keys:
+            add(Candidate(table, keys))
+            rest = tuple(sorted(u.read - set(keys)))
+            if rest and len(rest) <= _MAX_INCLUDE:
+                add(Candidate(table, keys, rest))
+    return out
+
+
+# ---------- evaluation ----------
+_COLUMNS_SQL = """
+SELECT table_name, column_name FROM information_schema.columns
+WHERE table_schema = current_schema() ORDER BY table_name, ordinal_position
+"""
+_INDEXES_SQL = """
+SELECT c.relname AS table_name, i.indnkeyatts AS nkeys,
+       array(SELECT pg_get_indexdef(i.indexrelid, k, true) FROM generate_subscripts(i.indkey, 1) k) AS cols
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = current_schema()
+"""
+
+
+def _columns(conn) -> dict[str, list[str]]:
+    out: dict[str, list[str]] = {}
+    for table, col in conn.execute(text(_COLUMNS_SQL)):
+        out.setdefault(table, []).append(col)
+    return out
+
+
+def _covered(c: Candidate, existing: list[tuple[str, tuple[str, ...], tuple[str, ...]]]) -> bool:
+    """True if an existing index starts with the same keys and has the included columns."""
+    norm = tuple(k.strip("()").replace(" ", "").lower() for k in c.keys)
+    for table, keys, rest in existing:
+        have = tuple(k.strip("()").replace(" ", "").lower() for k in keys)
+        if table == c.table and have[: len(norm)] == norm and set(c.include) <= set(keys) | set(rest):
+            return True
+    return False
+
+
+def _has_hypopg(conn) -> bool:
+    return bool(conn.execute(text("SELECT count(*) FROM pg_extension WHERE extname = 'hypopg'")).scalar())
+
+
+def _cost(conn, sql: str) -> float:
+    res = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(res, str):
+        res = json.loads(res)
+    return float(res[0]["Plan"]["Total Cost"])
+
+
+def _with_indexes(conn, indexes: list[Candidate], sqls: dict[str, str], hypo: bool) -> tuple[dict[str, float], dict[str, int]]:
+    """Planner cost of each statement with `indexes` in place, and each index's size; nothing persists."""
+    sizes: dict[str, int] = {}
+    savepoint = conn.begin_nested()
+    try:
+        for c in indexes:
+            if hypo:
+                oid = conn.execute(text("SELECT indexrelid FROM hypopg_create_index(:ddl)"), {"ddl": c.ddl()}).scalar()
+                size = conn.execute(text("SELECT hypopg_relation_size(:oid)"), {"oid": oid}).scalar()
+            else:
+                conn.execute(text(c.ddl()))
+                size = conn.execute(text("SELECT pg_relation_size(CAST(:n AS regclass))"), {"n": c.name}).scalar()
+            sizes[c.name] = int(size or 0)
+        return {fp: _cost(conn, s) for fp, s in sqls.items()}, sizes
+    finally:
+        savepoint.rollback()
+        if hypo:
+            conn.execute(text("SELECT hypopg_reset()"))  # hypothetical indexes live outside transactions
+
+
+def advise(
+    conn, entries: list[WorkloadEntry], max_indexes: int = MAX_INDEXES, min_gain: float = MIN_GAIN,
+) -> Advice:
+    """
+    Pick indexes for a workload on an owner connection (no changes are kept).
+    Args:
+        conn: SQLAlchemy connection to the database (or a scaled copy) to advise on.
+        entries (list[WorkloadEntry]): Workload, e.g. workload() or load_workload(paths).
+        max_indexes (int): Recommendations at most.
+        min_gain (float): Smallest saving worth an index, as a fraction of the workload's cost.
+    """
+    hypo = _has_hypopg(conn)
+    columns = _columns(conn)
+    existing = [
+        (t, tuple(cols[:nkeys]), tuple(cols[nkeys:])) for t, nkeys, cols in conn.execute(text(_INDEXES_SQL))
+    ]
+    queries: dict[str, WorkloadEntry] = {}
+    baseline: dict[str, float] = {}
+    tables_of: dict[str, set[str]] = {}
+    pool: list[Candidate] = []
+    for e in entries:
+        try:
+            with conn.begin_nested():
+                baseline[e.fingerprint] = _cost(conn, e.sql)
+        except Exception as err:  # e.g. a table or column that no longer exists
+            logger.info("workload query skipped: %s", str(getattr(err, "orig", err)).splitlines()[0])
+            continue
+        queries[e.fingerprint] = e
+        tables_of[e.fingerprint] = {t.name for t in sqlglot.parse_one(e.sql, read="postgres").find_all(exp.Table)}
+        for c in candidates(e.sql, columns):
+            if c not in pool and not _covered(c, existing):
+                pool.append(c)
+
+    def weighted(costs: dict[str, float]) -> float:
+        return sum(queries[fp].calls * cost for fp, cost in costs.items())
+
+    total = weighted(baseline)
+    current = dict(baseline)
+    chosen: list[Recommendation] = []
+    rejected: dict[str, str] = {}
+    while len(chosen) < max_indexes and pool:
+        best = None
+        for c in list(pool):
+            affected = {fp: queries[fp].sql for fp in queries if c.table in tables_of[fp]}
+            try:
+                costs, _ = _with_indexes(conn, [r.candidate for r in chosen] + [c], affected, hypo)
+            except Exception as err:
+                # e.g. an expression that is not IMMUTABLE (DATE_TRUNC on a date gives timestamptz)
+                rejected[c.name] = str(getattr(err, "orig", err)).splitlines()[0]
+                pool.remove(c)
+                continue
+            gain = sum(queries[fp].calls * (current[fp] - cost) for fp, cost in costs.items())
+            if best is None or gain > best[1]:
+                best = (c, gain, costs)
+        if best is None or best[1] <= max(min_gain * total, 0.0):
+            break
+        c, gain, costs = best
+        helps = {fp: (current[fp], cost) for fp, cost in costs.items() if cost < current[fp]}
+        current.update(costs)
+        chosen.append(Recommendation(c, round(gain, 2), helps, None))
+        pool.remove(c)
+
+    if chosen:
+        _, sizes = _with_indexes(conn, [r.candidate for r in chosen], {}, hypo)
+        chosen = [r._replace(size_bytes=sizes.get(r.candidate.name)) for r in chosen]
+    return Advice(chosen, round(total, 2), round(weighted(current), 2), queries, rejected, "hypopg" if hypo else "rollback")
+
+
+def render_ddl(advice: Advice) -> str:
+    """A reviewable DDL script for the advice."""
+    saved = advice.baseline_cost - advice.final_cost
+    pct = 100 * saved / advice.baseline_cost if advice.baseline_cost else 0.0
+    calls = sum(e.calls for e in advice.queries.values())
+    lines = [
+        "-- Index advisor (src/index_advisor.py)",
+        f"-- Workload: {len(advice.queries)} query shapes, {calls} executions; evaluated by {advice.method}.",
+        f"-- Estimated workload cost {advice.baseline_cost:,.0f} -> {advice.final_cost:,.0f} (-{pct:.1f}%).",
+        "-- CONCURRENTLY does not block writes but cannot run inside a transaction block.",
+    ]
+    if not advice.recommendations:
+        lines.append("-- No index saves enough to recommend.")
+    for i, r in enumerate(advice.recommendations, 1):
+        size = f", ~{r.size_bytes / 1024:,.0f} kB" if r.size_bytes else ""
+        lines += ["", f"-- {i}. saves {r.gain:,.0f} cost units{size}; helps {len(r.helps)} query shape(s):"]
+        for fp, (before, after) in sorted(r.helps.items(), key=lambda kv: kv[1][1] - kv[1][0])[:3]:
+            sql = " ".join(advice.queries[fp].sql.split())
+            lines.append(f"--    {before:,.0f} -> {after:,.0f} x{advice.queries[fp].calls}: {sql[:100]}")
+        lines.append(r.candidate.ddl(concurrently=True) + ";")
+    if advice.rejected:
+        lines += ["", "-- Not evaluable:"] + [f"--   {name}: {why}" for name, why in advice.rejected.items()]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,425 @@
+# src/pagination.py
+"""
+Pagination: Keyset pages of a query, resumed from signed continuation tokens.
+
+keyset() makes the order of a SELECT total: its own ORDER BY first, then a
+unique key. That key is the GROUP BY expressions of a grouped query, the primary
+keys of every joined table (src/schema_catalog.py) otherwise, and the whole
+row for SELECT DISTINCT / UNION. Each page is the base query plus
+
+    WHERE (or HAVING) <keys come after the last row's keys> ORDER BY <keys> LIMIT size + 1
+
+so a page costs the same whether it is the first or the hundredth: no OFFSET,
+no rescan of what was already returned. The comparison is a row value
+`(a, b) > (:a0, :a1)` when all keys are NOT NULL and sort the same way;
+otherwise it is spelled out term by term, with NULLs placed where ORDER BY
+puts them. The last row's key values are bind parameters.
+
+A grouped query gets the predicate in WHERE when its keys are group keys, so
+later pages aggregate only the remaining rows. Ordered by an aggregate, it
+has to go in HAVING, and every page computes all groups again before keeping
+the next `size`.
+
+A token is the base SQL, the last row's keys, the page size and the rows left
+under the caller's row_limit (or the query's own LIMIT), signed with HMAC-SHA256 (PAGINATION_SECRET) and
+valid for PAGINATION_TOKEN_TTL_SECONDS. Without PAGINATION_SECRET a random
+per-process key is used, and tokens then only work on the worker that issued them.
+"""
+import asyncio
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, NamedTuple
+
+from sqlglot import exp
+
+from src import database
+from src.columnar import ColumnarResult
+from src.query_validator import analyze_select
+from src.schema_catalog import get_catalog
+
+logger = logging.getLogger(__name__)
+
+SECRET = os.getenv("PAGINATION_SECRET", "")
+TOKEN_TTL = int(os.getenv("PAGINATION_TOKEN_TTL_SECONDS", "3600"))
+MAX_ROWS = int(os.getenv("PAGINATION_MAX_ROWS", "1000000"))  # rows across all pages of one query
+_KEYSETS_MAX = 512
+_KEY_ALIAS = "_key{}"
+
+if not SECRET:
+    logger.warning("PAGINATION_SECRET is not set: continuation tokens are valid on this process only")
+_key = SECRET.encode("utf-8") or secrets.token_bytes(32)
+
+_keysets: "OrderedDict[str, Keyset | None]" = OrderedDict()
+_keysets_lock = threading.Lock()
+
+
+class Keyset(NamedTuple):
+    sql: str                          # base query: validated, top-level LIMIT removed
+    tree: exp.Expression              # base query without ORDER BY (shared, copy before changing it)
+    keys: tuple[exp.Expression, ...]  # sort keys; the last ones make the order total
+    desc: tuple[bool, ...]
+    nulls_first: tuple[bool, ...]
+    not_null: tuple[bool, ...]
+    columns: tuple[str, ...]          # result column holding each key's value
+    clause: str                       # where the predicate goes: "where", "having" or "outer"
+    limit: int                        # rows across all pages (the query's own LIMIT, or MAX_ROWS)
+
+
+class Page(NamedTuple):
+    rows: list[dict] | ColumnarResult
+    next_token: str | None            # None on the last page
+    has_more: bool
+    size: int                         # requested page size
+    sql: str                          # statement that produced the page
+    estimated_total_rows: int | None  # first page only
+
+
+# ---------- keys ----------
+def _select_item(select: exp.Select, node: exp.Expression) -> exp.Expression:
+    """ORDER BY / GROUP BY item -> expression: `1` is the first select item, an output alias its expression."""
+    items = select.expressions
+    if isinstance(node, exp.Literal) and node.is_int and 0 < int(node.name) <= len(items):
+        return items[int(node.name) - 1].unalias()
+    if isinstance(node, exp.Column) and not node.table:
+        for item in items:
+            if isinstance(item, exp.Alias) and item.alias == node.name:
+                return item.unalias()
+    return node
+
+
+def _sources(select: exp.Select) -> list[exp.Expression]:
+    sources = [select.args["from_"].this] if select.args.get("from_") else []
+    return sources + [j.this for j in select.args.get("joins") or ()]
+
+
+def _not_null(node: exp.Expression, tables: dict[str, str]) -> bool:
+    """True for a column the catalog declares NOT NULL."""
+    if not isinstance(node, exp.Column):
+        return False
+    name = node.table or (next(iter(tables)) if len(tables) == 1 else "")
+    if name not in tables:
+        return False
+    table = get_catalog().tables.get(tables[name])
+    return any(c.name == node.name and not c.nullable for c in table.columns) if table else False
+
+
+def _unique_key(select: exp.Select) -> tuple[list[exp.Expression], dict[str, str]] | None:
+    """Primary key columns of every table in FROM/JOIN (alias-qualified), and alias -> table."""
+    catalog = get_catalog()
+    keys: list[exp.Expression] = []
+    tables: dict[str, str] = {}
+    for source in _sources(select):
+        table = catalog.tables.get(source.name) if isinstance(source, exp.Table) and not source.db else None
+        if table is None or table.is_view or not table.primary_key:
+            return None  # subquery, CTE, function or view: no known key
+        tables[source.alias_or_name] = source.name
+        keys += [exp.column(c, table=source.alias_or_name) for c in table.primary_key]
+    return (keys, tables) if keys else None
+
+
+def _plan(analysis) -> Keyset | None:
+    tree = analysis.tree.copy()
+    limit = analysis.limit
+    if any(tree.find_all(exp.Placeholder)):
+        return None  # needs bind parameters the token does not carry
+    source = tree.args["from_"].this if isinstance(tree, exp.Select) and tree.args.get("from_") else None
+    if isinstance(source, exp.Subquery) and source.alias == "_t" and tree.is_star:
+        return None  # capped from outside (LIMIT with an expression, WITH TIES, ...)
+    if tree.args.get("offset"):
+        return None  # OFFSET counts rows before the keyset predicate
+    tree.set("limit", None)
+    sql = tree.sql(dialect="postgres")
+
+    order = tree.args.get("order")
+    ordered = list(order.expressions) if order else []
+    if any(o.args.get("with_fill") for o in ordered):
+        return None
+
+    if isinstance(tree, exp.Select) and not tree.args.get("distinct"):
+        if any(tree.find_all(exp.Window)):
+            return None  # a WHERE on the keys would change window results
+        group = tree.args.get("group")
+        if group and (group.args.get("rollup") or group.args.get("cube") or group.args.get("grouping_sets")):
+            return None
+        tables: dict[str, str] = {}
+        if group:
+            unique = [_select_item(tree, g) for g in group.expressions]
+            _, tables = _unique_key(tree) or ([], {})
+            clause = "having"
+        elif any(tree.find_all(exp.AggFunc)):
+            return None  # one row: nothing to page
+        else:
+            found = _unique_key(tree)
+            if found is None:
+                return None
+            unique, tables = found
+            clause = "where"
+        keys = [(_select_item(tree, o.this), bool(o.args.get("desc")), bool(o.args.get("nulls_first"))) for o in ordered]
+        for u in unique:
+            if not any(k.sql() == u.sql() for k, _, _ in keys):
+                keys.append((u, False, False))
+        if group and not any(k.find(exp.AggFunc) for k, _, _ in keys):
+            # keys are constant within a group: skip earlier rows before grouping, not whole groups after
+            clause = "where"
+        columns = tuple(_KEY_ALIAS.format(i) for i in range(len(keys)))
+        not_null = tuple(_not_null(k, tables) for k, _, _ in keys)
+    elif (isinstance(tree, exp.Select) and tree.args["distinct"].args.get("on") is None) or (
+        isinstance(tree, exp.Union) and tree.args.get("distinct")
+    ):
+        # distinct rows: the whole row is the key, compared outside the query
+        names = [item.alias_or_name for item in (tree.selects if isinstance(tree, exp.Union) else tree.expressions)]
+        if not all(names) or len(set(names)) != len(names) or "*" in names:
+            return None
+        by_name = {n: i for i, n in enumerate(names)}
+        keys = []
+        for o in ordered:
+            node = o.this
+            if isinstance(node, exp.Literal) and node.is_int and 0 < int(node.name) <= len(names):
+                name = names[int(node.name) - 1]
+            elif isinstance(node, exp.Column) and node.name in by_name and (not node.table or isinstance(tree, exp.Select)):
+                name = node.name
+            else:
+                return None
+            keys.append((exp.column(name, table="_p"), bool(o.args.get("desc")), bool(o.args.get("nulls_first"))))
+        for n in names:
+            if not any(k.name == n for k, _, _ in keys):
+                keys.append((exp.column(n, table="_p"), False, False))
+        columns = tuple(k.name for k, _, _ in keys)
+        not_null = tuple(False for _ in keys)
+        clause = "outer"
+    else:
+        return None
+
+    tree.set("order", None)
+    return Keyset(
+        sql=sql, tree=tree,
+        keys=tuple(k for k, _, _ in keys), desc=tuple(d for _, d, _ in keys),
+        nulls_first=tuple(n for _, _, n in keys), not_null=not_null,
+        columns=columns, clause=clause, limit=limit,
+    )
+
+
+def keyset(sql: str) -> Keyset | None:
+    """
+    How to page a SELECT, or None if it has no usable total order (e.g. a
+    window function, OFFSET, a subquery without a key, or a single-row aggregate).
+    Raises:
+        ValueError: If the SQL is not a valid read-only SELECT (src/query_validator.py).
+    """
+    with _keysets_lock:
+        if sql in _keysets:
+            _keysets.move_to_end(sql)
+            return _keysets[sql]
+    ks = _plan(analyze_select(sql, MAX_ROWS))
+    with _keysets_lock:
+        _keysets[sql] = ks
+        while len(_keysets) > _KEYSETS_MAX:
+            _keysets.popitem(last=False)
+    return ks
+
+
+# ---------- page query ----------
+def _param(i: int) -> exp.Expression:
+    return exp.var(f":_a{i}")  # SQLAlchemy-style bind, kept as is by the validator
+
+
+def _after(ks: Keyset, keys: list[exp.Expression], values: list) -> exp.Expression | None:
+    """Rows whose keys sort after `values` in the keyset's order."""
+    if all(ks.not_null) and len(set(ks.desc)) == 1 and None not in values:
+        left = keys[0] if len(keys) == 1 else exp.Tuple(expressions=keys)
+        right = _param(0) if len(keys) == 1 else exp.Tuple(expressions=[_param(i) for i in range(len(keys))])
+        return exp.LT(this=left, expression=right) if ks.desc[0] else exp.GT(this=left, expression=right)
+    terms = []
+    for i, (k, v) in enumerate(zip(keys, values)):
+        if v is None:
+            after = None if not ks.nulls_first[i] else exp.Not(this=exp.Is(this=k.copy(), expression=exp.Null()))
+        else:
+            after = (exp.LT if ks.desc[i] else exp.GT)(this=k.copy(), expression=_param(i))
+            if not ks.nulls_first[i] and not ks.not_null[i]:
+                after = exp.or_(after, exp.Is(this=k.copy(), expression=exp.Null()))
+        if after is not None:
+            same = [
+                exp.Is(this=keys[j].copy(), expression=exp.Null()) if values[j] is None
+                else exp.EQ(this=keys[j].copy(), expression=_param(j))
+                for j in range(i)
+            ]
+            terms.append(exp.and_(*same, after) if same else after)
+    return exp.or_(*terms) if terms else exp.false()
+
+
+def page_query(ks: Keyset, after: list | None, size: int) -> tuple[str, dict]:
+    """SQL and bind parameters of the `size` rows after `after` (None: first page), plus one to detect more."""
+    tree = ks.tree.copy()
+    if ks.clause == "outer":
+        keys = list(ks.keys)
+        outer = exp.select("*").from_(tree.subquery("_p"))
+    else:
+        keys = [k.copy() for k in ks.keys]
+        for k, name in zip(keys, ks.columns):
+            tree.append("expressions", exp.alias_(k.copy(), name))
+        outer = tree
+    if after is not None:
+        predicate = _after(ks, keys, after)
+        outer = outer.having(predicate) if ks.clause == "having" else outer.where(predicate)
+    outer = outer.order_by(*[
+        exp.Ordered(this=k.copy(), desc=d, nulls_first=n) for k, d, n in zip(keys, ks.desc, ks.nulls_first)
+    ]).limit(size + 1)
+    params = {f"_a{i}": v for i, v in enumerate(after or []) if v is not None}
+    return outer.sql(dialect="postgres"), params
+
+
+# ---------- tokens ----------
+def _encode_value(v: Any) -> Any:
+    if isinstance(v, Decimal):
+        return {"$n": str(v)}
+    if isinstance(v, datetime.datetime):
+        return {"$ts": v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {"$d": v.isoformat()}
+    if isinstance(v, datetime.time):
+        return {"$t": v.isoformat()}
+    if isinstance(v, (bool, int, float, str)) or v is None:
+        return v
+    return {"$s": str(v)}  # e.g. UUID: compared as text
+
+
+def _decode_value(v: Any) -> Any:
+    if not isinstance(v, dict):
+        return v
+    (tag, s), = v.items()
+    return {
+        "$n": Decimal, "$ts": datetime.datetime.fromisoformat, "$d": datetime.date.fromisoformat,
+        "$t": datetime.time.fromisoformat, "$s": str,
+    }[tag](s)
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def encode_token(ks: Keyset, after: list, size: int, left: int) -> str:
+    payload = json.dumps(
+        {"sql": ks.sql, "after": [_encode_value(v) for v in after], "size": size, "left": left,
+         "exp": int(time.time()) + TOKEN_TTL},
+        separators=(",", ":"),
+    ).encode("utf-8")
+    sig = hmac.new(_key, payload, hashlib.sha256).digest()
+    return f"{_b64(payload)}.{_b64(sig)}"
+
+
+def decode_token(token: str) -> dict:
+    """
+    Verify and unpack a continuation token.
+    Raises:
+        ValueError: If the token is malformed, forged or expired.
+    """
+    try:
+        body, sig = token.split(".")
+        payload = _unb64(body)
+        ok = hmac.compare_digest(hmac.new(_key, payload, hashlib.sha256).digest(), _unb64(sig))
+    except (ValueError, TypeError):
+        ok = False
+    if not ok:
+        raise ValueError("Invalid continuation token")
+    data = json.loads(payload)
+    if data["exp"] < time.time():
+        raise ValueError("Continuation token expired; ask again")
+    data["after"] = [_decode_value(v) for v in data["after"]]
+    return data
+
+
+# ---------- pages ----------
+def _finish(ks: Keyset, rows: list[dict], size: int, left: int, sql: str, columnar: bool, estimate: int | None) -> Page:
+    n = min(size, left)
+    has_more = len(rows) > n and left > n
+    rows = rows[:n]
+    token = None
+    if has_more:
+        after = [rows[-1][c] for c in ks.columns]
+        token = encode_token(ks, after, size, left - len(rows))
+    if ks.clause != "outer":
+        hidden = set(ks.columns)
+        rows = [{k: v for k, v in r.items() if k not in hidden} for r in rows]
+    if columnar:
+        names = list(rows[0]) if rows else []
+        rows = ColumnarResult.from_rows(names, [tuple(r.values()) for r in rows])
+    return Page(rows, token, has_more, size, sql, estimate)
+
+
+def _estimate(total: int, rows: int) -> int | None:
+    return min(max(rows, 0), total)
+
+
+def _total(ks: Keyset, row_limit: int | None) -> int:
+    """Rows across all pages: the query's own LIMIT (or MAX_ROWS), capped by row_limit."""
+    return min(ks.limit, row_limit) if row_limit else ks.limit
+
+
+def first_page(sql: str, size: int, columnar: bool = False, row_limit: int | None = None) -> Page | None:
+    """
+    First `size` rows of sql with a continuation token and the planner's row estimate.
+    Returns None if the query cannot be paged (see keyset()).
+    Args:
+        row_limit (int): Rows across all pages; the token carries what is left of it.
+    """
+    ks = keyset(sql)
+    if ks is None:
+        return None
+    total = _total(ks, row_limit)
+    page_sql, params = page_query(ks, None, min(size, total))
+    rows = database.run_readonly(page_sql, params, row_limit=size + 1)
+    return _finish(ks, rows, size, total, page_sql, columnar, _estimate(total, database.estimate_rows(ks.sql)))
+
+
+def next_page(token: str, columnar: bool = False) -> Page:
+    """
+    The page after the one that issued `token`.
+    Raises:
+        ValueError: If the token is invalid/expired or the query no longer pages the same way.
+    """
+    ks, t = _resume(token)
+    page_sql, params = page_query(ks, t["after"], min(t["size"], t["left"]))
+    rows = database.run_readonly(page_sql, params, row_limit=t["size"] + 1)
+    return _finish(ks, rows, t["size"], t["left"], page_sql, columnar, None)
+
+
+async def first_page_async(sql: str, size: int, columnar: bool = False, row_limit: int | None = None) -> Page | None:
+    """Async twin of first_page."""
+    ks = await asyncio.to_thread(keyset, sql)  # may introspect the schema catalog
+    if ks is None:
+        return None
+    total = _total(ks, row_limit)
+    page_sql, params = page_query(ks, None, min(size, total))
+    rows = await database.run_readonly_async(page_sql, params, row_limit=size + 1)
+    estimate = _estimate(total, await database.estimate_rows_async(ks.sql))
+    return _finish(ks, rows, size, total, page_sql, columnar, estimate)
+
+
+async def next_page_async(token: str, columnar: bool = False) -> Page:
+    """Async twin of next_page."""
+    ks, t = await asyncio.to_thread(_resume, token)
+    page_sql, params = page_query(ks, t["after"], min(t["size"], t["left"]))
+    rows = await database.run_readonly_async(page_sql, params, row_limit=t["size"] + 1)
+    return _finish(ks, rows, t["size"], t["left"], page_sql, columnar, None)
+
+
+def _resume(token: str) -> tuple[Keyset, dict]:
+    t = decode_token(token)
+    ks = keyset(t["sql"])
+    if ks is None or len(ks.keys) != len(t["after"]):
+        raise ValueError("Continuation token no longer matches the schema; ask again")
+    return ks, t
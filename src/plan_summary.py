@@ -0,0 +1,125 @@
+# src/plan_summary.py
+"""
+Plan Summary: Turn an EXPLAIN (FORMAT JSON) tree into the few facts worth acting on.
+
+- hotspots: nodes ranked by their own cost (estimate) or own time (analyze),
+  i.e. minus what their children account for;
+- seq_scans: sequential scans of tables with at least EXPLAIN_LARGE_TABLE_ROWS rows;
+- misestimates (analyze only): nodes whose actual row count is off from the
+  planner's estimate by EXPLAIN_MISESTIMATE_FACTOR or more;
+- spills (analyze only): sorts, hashes and hash aggregates that went to disk.
+"""
+import os
+
+LARGE_TABLE_ROWS = int(os.getenv("EXPLAIN_LARGE_TABLE_ROWS", "10000"))
+MISESTIMATE_FACTOR = float(os.getenv("EXPLAIN_MISESTIMATE_FACTOR", "10"))
+_MISESTIMATE_MIN_ROWS = 100  # below this on both sides a miss does not matter
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _walk(child)
+
+
+def label(node: dict) -> str:
+    """Readable node name, e.g. "Index Scan using orders_pkey on orders o"."""
+    text = node.get("Node Type", "?")
+    if node.get("Strategy") == "Hashed" and text == "Aggregate":
+        text = "HashAggregate"
+    if node.get("Join Type") not in (None, "Inner"):
+        text += f" ({node['Join Type']})"
+    if node.get("Index Name"):
+        text += f" using {node['Index Name']}"
+    if node.get("Relation Name"):
+        text += f" on {node['Relation Name']}"
+        if node.get("Alias") and node["Alias"] != node["Relation Name"]:
+            text += f" {node['Alias']}"
+    return text
+
+
+def _self_cost(node: dict) -> float:
+    return max(0.0, node.get("Total Cost", 0.0) - sum(c.get("Total Cost", 0.0) for c in node.get("Plans", ())))
+
+
+def _total_time(node: dict) -> float:
+    return node.get("Actual Total Time", 0.0) * node.get("Actual Loops", 1)
+
+
+def _self_time(node: dict) -> float:
+    return max(0.0, _total_time(node) - sum(_total_time(c) for c in node.get("Plans", ())))
+
+
+def _spill(node: dict) -> dict | None:
+    if node.get("Sort Space Type") == "Disk":
+        return {"kind": "sort", "method": node.get("Sort Method"), "disk_kb": node.get("Sort Space Used")}
+    if node.get("Hash Batches", 1) > 1:
+        return {"kind": "hash", "batches": node["Hash Batches"], "planned_batches": node.get("Original Hash Batches")}
+    if node.get("HashAgg Batches", 0) > 1 or node.get("Disk Usage", 0) > 0:
+        return {"kind": "hash_aggregate", "batches": node.get("HashAgg Batches"), "disk_kb": node.get("Disk Usage")}
+    return None
+
+
+def summarize_plan(top: dict, table_rows: dict[str, int] | None = None, top_n: int = 5) -> dict:
+    """
+    Args:
+        top (dict): One element of the EXPLAIN (FORMAT JSON) result ({"Plan": ..., ...}).
+        table_rows (dict[str, int]): Row estimates per table (schema catalog), used to size seq scans.
+        top_n (int): Hotspots to return.
+    """
+    plan = top.get("Plan", {})
+    analyzed = "Actual Total Time" in plan
+    table_rows = table_rows or {}
+    nodes = list(_walk(plan))
+
+    if analyzed:
+        weights = [_self_time(n) for n in nodes]
+        total = _total_time(plan) or sum(weights)
+    else:
+        weights = [_self_cost(n) for n in nodes]
+        total = plan.get("Total Cost", 0.0) or sum(weights)
+    ranked = sorted(range(len(nodes)), key=lambda i: -weights[i])[:top_n]
+    hotspots = []
+    for i in ranked:
+        if weights[i] <= 0:
+            break
+        entry = {"node": label(nodes[i]), "self_cost": round(_self_cost(nodes[i]), 2)}
+        if analyzed:
+            entry["self_time_ms"] = round(weights[i], 3)
+        entry["share"] = round(weights[i] / total, 3) if total else 0.0
+        hotspots.append(entry)
+
+    seq_scans, misestimates, spills = [], [], []
+    for node in nodes:
+        if node.get("Node Type") == "Seq Scan":
+            table = node.get("Relation Name")
+            rows = table_rows.get(table)
+            if rows is None and analyzed:
+                rows = (node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) * node.get("Actual Loops", 1)
+            if rows is None:
+                rows = node.get("Plan Rows", 0)
+            if rows >= LARGE_TABLE_ROWS:
+                seq_scans.append({"table": table, "rows": int(rows), "filter": node.get("Filter")})
+        if not analyzed:
+            continue
+        if node.get("Actual Loops", 0) > 0:
+            est, actual = node.get("Plan Rows", 0), node.get("Actual Rows", 0)
+            factor = max(est, 1) / max(actual, 1) if est > actual else max(actual, 1) / max(est, 1)
+            if factor >= MISESTIMATE_FACTOR and max(est, actual) >= _MISESTIMATE_MIN_ROWS:
+                misestimates.append({
+                    "node": label(node), "estimated_rows": est, "actual_rows": actual,
+                    "factor": round(factor, 1), "direction": "over" if est > actual else "under",
+                })
+        spill = _spill(node)
+        if spill is not None:
+            spills.append({"node": label(node), **spill})
+
+    return {
+        "analyzed": analyzed,
+        "total_cost": plan.get("Total Cost"),
+        "estimated_rows": plan.get("Plan Rows"),
+        "hotspots": hotspots,
+        "seq_scans": seq_scans,
+        "misestimates": misestimates,
+        "spills": spills,
+    }
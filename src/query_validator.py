@@ -1,12 +1,155 @@
 # src/query_validator.py
-# src/query_validator.py
 """
 Query Validator: Sanitizes and validates SQL queries for security and correctness.
+
+Each statement is parsed once (sqlglot, Postgres dialect). The same syntax tree
+is used for validation, for capping rows at the top level, for listing the
+tables it reads (result cache invalidation) and for its canonical shape (cache
+key and prepared statement, src/sql_canonical.py). analyze_select() returns the
+rendered statement with all of these and remembers it, also under
+its own output: running an already sanitized statement costs a dict lookup,
+not a second parse or another LIMIT wrapper.
 """
-import re
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from src.sql_canonical import Canonical, canonicalize
+
+_SYSTEM_SCHEMAS = {"pg_catalog", "information_schema"}
+# nodes that write, lock or create anything (e.g. a data-modifying CTE, SELECT ... INTO)
+_FORBIDDEN = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+    exp.TruncateTable, exp.Command, exp.Into, exp.Lock,
+)
+_QUERY = (exp.Select, exp.SetOperation, exp.Subquery)
+_ANALYSES_MAX = 2048
+
+_analyses: "OrderedDict[tuple[str, int], SelectAnalysis]" = OrderedDict()
+_analyses_lock = threading.Lock()
+
+
+class SelectAnalysis(NamedTuple):
+    sql: str                # validated statement, top-level LIMIT applied
+    limit: int              # effective row cap
+    tables: frozenset[str]  # relations read (CTE names excluded)
+    canonical: Canonical    # cache key / prepared statement shape of sql
+    tree: exp.Expression    # parsed sql; shared, copy before changing it
+
+
+def _parse(sql: str) -> exp.Expression:
+    if not sql or not sql.strip():
+        raise ValueError("Empty SQL")
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="postgres") if s is not None]
+    except SqlglotError as e:
+        raise ValueError(f"Invalid SQL: {str(e).splitlines()[0]}") from None
+    if len(statements) > 1:
+        raise ValueError("Multiple statements not allowed")
+    if not statements:
+        raise ValueError("Empty SQL")
+    return statements[0]
+
+
+def _validate(tree: exp.Expression) -> None:
+    if not isinstance(tree, _QUERY):
+        raise ValueError("Only SELECT/CTE allowed")
+    for node in tree.walk():
+        if isinstance(node, _FORBIDDEN):
+            raise ValueError("Forbidden keyword or system schema")
+        if isinstance(node, exp.Identifier) and node.name.lower() in _SYSTEM_SCHEMAS:
+            raise ValueError("Forbidden keyword or system schema")
+        # unqualified pg_* relations resolve to catalog views (pg_tables, pg_roles, ...)
+        if isinstance(node, exp.Table) and node.name.lower().startswith("pg_"):
+            raise ValueError("Forbidden keyword or system schema")
+
+
+def _tables(tree: exp.Expression) -> frozenset[str]:
+    ctes = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+    found = set()
+    for table in tree.find_all(exp.Table):
+        if not isinstance(table.this, exp.Identifier):
+            continue  # table function, e.g. generate_series(...)
+        name = table.name if table.this.quoted else table.name.lower()
+        if table.db or name not in ctes:
+            found.add(name)
+    return frozenset(found)
+
+
+def _int(node: exp.Expression | None) -> int | None:
+    if isinstance(node, exp.Literal) and not node.is_string and node.name.isdigit():
+        return int(node.name)
+    return None
+
+
+def _cap(tree: exp.Expression, row_limit: int) -> tuple[exp.Expression, int]:
+    """Apply row_limit to the top-level query: lower an existing LIMIT/FETCH FIRST, add one, or (rarely) wrap."""
+    current = tree.args.get("limit")
+    if current is None or (isinstance(current, exp.Limit) and isinstance(current.expression, exp.Var)):  # LIMIT ALL
+        tree.set("limit", exp.Limit(expression=exp.Literal.number(row_limit)))
+        return tree, row_limit
+    if isinstance(current, exp.Limit) and _int(current.expression) is not None:
+        limit = min(_int(current.expression), row_limit)
+        current.set("expression", exp.Literal.number(limit))
+        return tree, limit
+    options = current.args.get("limit_options") if isinstance(current, exp.Fetch) else None
+    plain_fetch = options is None or not (options.args.get("percent") or options.args.get("with_ties"))
+    if isinstance(current, exp.Fetch) and plain_fetch and _int(current.args.get("count")) is not None:
+        limit = min(_int(current.args["count"]), row_limit)
+        current.set("count", exp.Literal.number(limit))
+        return tree, limit
+    # a bind parameter, an expression, PERCENT or WITH TIES: cap from outside
+    wrapped = exp.select("*").from_(tree.subquery("_t")).limit(row_limit)
+    return wrapped, row_limit
+
+
+def _render(tree: exp.Expression) -> str:
+    # keep SQLAlchemy-style :name binds (sqlglot would print them as %(name)s)
+    tree = tree.transform(
+        lambda n: exp.var(f":{n.name}") if isinstance(n, exp.Placeholder) and n.name else n
+    )
+    return tree.sql(dialect="postgres")
+
+
+def _analyze(sql: str, row_limit: int) -> SelectAnalysis:
+    tree = _parse(sql)
+    _validate(tree)
+    tables = _tables(tree)
+    tree, limit = _cap(tree, row_limit)
+    rendered = _render(tree)
+    return SelectAnalysis(rendered, limit, tables, canonicalize(tree), tree)
+
+
+def analyze_select(sql: str, row_limit: int = 1000) -> SelectAnalysis:
+    """
+    Parse, validate and cap a SELECT once; repeated calls (including with the
+    returned sql) are served from memory.
+    Args:
+        sql (str): Input SQL query.
+        row_limit (int): Maximum number of rows to return.
+    Raises:
+        ValueError: If the query is empty, unparseable, not a single SELECT/CTE,
+            writes anything or reads a system schema.
+    """
+    key = (sql, int(row_limit))
+    with _analyses_lock:
+        hit = _analyses.get(key)
+        if hit is not None:
+            _analyses.move_to_end(key)
+            return hit
+    analysis = _analyze(sql, int(row_limit))
+    with _analyses_lock:
+        _analyses[key] = analysis
+        # the rendered statement analyzes to itself
+        _analyses[(analysis.sql, int(row_limit))] = analysis
+        while len(_analyses) > _ANALYSES_MAX:
+            _analyses.popitem(last=False)
+    return analysis
 
-_BLOCK = re.compile(r"\b(INSERT|UPDATE|DELETE|DROP|ALTER|TRUNCATE|CREATE|GRANT|REVOKE|VACUUM|ANALYZE)\b", re.I)
-_SYS   = re.compile(r"\b(pg_catalog|information_schema)\b", re.I)
 
 def sanitize_select(sql: str, row_limit: int = 1000) -> str:
     """
@@ -20,24 +163,4 @@ def sanitize_select(sql: str, row_limit: int = 1000) -> str:
     Raises:
         ValueError: If query is empty, contains forbidden keywords, or is not SELECT/CTE.
     """
-    if not sql or not sql.strip():
-        raise ValueError("Empty SQL")
-    s = sql.strip()
-
-    # single statement only
-    if ";" in s.strip(";"):
-        raise ValueError("Multiple statements not allowed")
-
-    # must start with SELECT or WITH
-    u = s.lstrip().upper()
-    if not (u.startswith("SELECT") or u.startswith("WITH")):
-        raise ValueError("Only SELECT/CTE allowed")
-
-    if _BLOCK.search(s) or _SYS.search(s):
-        raise ValueError("Forbidden keyword or system schema")
-
-    # enforce LIMIT if not present at top level (cheap check)
-    if re.search(r"\blimit\b\s+\d+\s*$", s, re.I) is None and re.search(r"\bfetch\s+first\b", s, re.I) is None:
-        s = f"{s.rstrip()}\nLIMIT {int(row_limit)}"
-
-    return s
+    return analyze_select(sql, row_limit).sql
@@ -0,0 +1,133 @@
+# src/question_cache.py
+"""
+Question Cache: Normalized question -> SQL cache that sits in front of the LLM.
+
+Keys combine the normalized question with a fingerprint of the schema hint,
+model name and any other prompt inputs (e.g. the few-shot corpus version), so a
+schema, model or example change never serves stale SQL. Entries live in
+an in-process TTL + LRU map and, optionally, in a local SQLite file so the cache
+survives restarts.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Set either to 0 to disable
+_TTL = int(os.getenv("SQL_CACHE_TTL_SECONDS", "86400"))    # seconds
+_MAX = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "1024"))     # entries
+# Optional on-disk store (empty = memory only)
+_PATH = os.getenv("SQL_CACHE_PATH", "")
+
+# comparison operators, signed and decimal numbers, then words; other punctuation is dropped
+_TOKEN = re.compile(r"<>|!=|[<>]=?|=|[≤≥≠]|(?<![\w.])-?\d+\.\d+|(?<![\w.])-\d+|\w+")
+
+# key -> (timestamp, sql)
+_cache: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+_lock = threading.Lock()
+_db: sqlite3.Connection | None = None
+_db_path: str | None = None
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question so trivially different phrasings share a cache entry.
+    Lower-cases, drops punctuation and collapses whitespace. Comparison
+    operators, minus signs and decimal points are kept: "price > 20" and
+    "price < 20" ask for different SQL.
+    """
+    return " ".join(_TOKEN.findall((question or "").lower()))
+
+
+def schema_fingerprint(schema_hint: str, model_name: str, *extra: str) -> str:
+    """Short, stable fingerprint of the prompt inputs that shape the SQL."""
+    h = hashlib.sha256()
+    for part in (model_name, schema_hint, *extra):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def make_key(question: str, schema_hint: str, model_name: str, *extra: str) -> str:
+    fp = schema_fingerprint(schema_hint, model_name, *extra)
+    return hashlib.sha256(f"{fp}:{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+
+def _store() -> sqlite3.Connection | None:
+    """Lazily open the on-disk store (reopened if SQL_CACHE_PATH changes)."""
+    global _db, _db_path
+    if not _PATH:
+        return None
+    if _db is None or _db_path != _PATH:
+        os.makedirs(os.path.dirname(os.path.abspath(_PATH)), exist_ok=True)
+        _db = sqlite3.connect(_PATH, check_same_thread=False, isolation_level=None)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("CREATE TABLE IF NOT EXISTS sql_cache (key TEXT PRIMARY KEY, ts REAL NOT NULL, sql TEXT NOT NULL)")
+        _db_path = _PATH
+    return _db
+
+
+def _remember(key: str, ts: float, sql: str) -> None:
+    _cache[key] = (ts, sql)
+    _cache.move_to_end(key)
+    while len(_cache) > _MAX:
+        _cache.popitem(last=False)  # evict LRU
+
+
+def cache_get(key: str) -> str | None:
+    if _TTL <= 0 or _MAX <= 0:
+        return None
+    now = time.time()
+    with _lock:
+        hit = _cache.get(key)
+        if hit:
+            ts, sql = hit
+            if (now - ts) <= _TTL:
+                _cache.move_to_end(key)
+                return sql
+            del _cache[key]  # expired
+
+        db = _store()
+        if db is None:
+            return None
+        row = db.execute("SELECT ts, sql FROM sql_cache WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        ts, sql = row
+        if (now - ts) > _TTL:
+            db.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+            return None
+        # promote into memory
+        _remember(key, ts, sql)
+        return sql
+
+
+def cache_put(key: str, sql: str) -> None:
+    if _TTL <= 0 or _MAX <= 0 or not sql:
+        return
+    now = time.time()
+    with _lock:
+        _remember(key, now, sql)
+        db = _store()
+        if db is None:
+            return
+        db.execute("INSERT OR REPLACE INTO sql_cache (key, ts, sql) VALUES (?, ?, ?)", (key, now, sql))
+        # keep the file bounded: drop expired rows, then the oldest beyond _MAX
+        db.execute("DELETE FROM sql_cache WHERE ts < ?", (now - _TTL,))
+        db.execute(
+            "DELETE FROM sql_cache WHERE key NOT IN (SELECT key FROM sql_cache ORDER BY ts DESC LIMIT ?)",
+            (_MAX,),
+        )
+
+
+def cache_clear(persistent: bool = False) -> None:
+    """Drop in-memory entries (and the on-disk store when persistent=True)."""
+    with _lock:
+        _cache.clear()
+        if persistent:
+            db = _store()
+            if db is not None:
+                db.execute("DELETE FROM sql_cache")
@@ -0,0 +1,329 @@
+# src/replicas.py
+"""
+Replicas: Route read-only queries across several Postgres DSNs.
+
+Every DSN in DB_READONLY_URLS gets its own pool (src/db_pool.py). Each query
+goes to the healthy replica with the lowest (in-flight queries + 1) x recent
+latency, so a slow or busy node gets less traffic. A replica is ejected when:
+
+- its health check fails (checked every DB_REPLICA_CHECK_SECONDS, in the
+  background after the first check);
+- it replays WAL more than DB_REPLICA_MAX_LAG_SECONDS behind its primary;
+- a query on it fails with a connection-level error. That query is retried
+  once on another replica.
+
+An ejected replica rejoins when a later health check passes. If every replica
+is ejected, all of them are tried anyway: a possibly-stale answer beats none.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from src.db_pool import (
+    PoolMonitor, async_connect_args, create_ro_engine, pool_options, run_with_reconnect, run_with_reconnect_async,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "30"))
+CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", "10"))  # 0 disables health checks
+_EWMA_ALPHA = 0.2
+
+# Lag is 0 when everything received has been replayed (an idle primary sends nothing new)
+_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+# errors that say "this server", not "this query": worth another replica
+_RETRY_SQLSTATES = {"40001", "57P01", "57P02", "57P03"}
+
+T = TypeVar("T")
+
+
+def async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return f"postgresql+asyncpg{sep}{rest}" if scheme.split("+")[0] in ("postgresql", "postgres") else url
+
+
+def replica_failed(e: Exception) -> bool:
+    """True if e means the replica (not the SQL) is at fault: connection lost, refused, or recovery conflict."""
+    if not isinstance(e, DBAPIError):
+        return isinstance(e, OSError)
+    if e.connection_invalidated:
+        return True
+    state = getattr(e.orig, "pgcode", None) or getattr(e.orig, "sqlstate", None)
+    if state is not None:
+        return state in _RETRY_SQLSTATES or state.startswith("08")
+    # no SQLSTATE: the server never answered (refused / unreachable)
+    return isinstance(e, OperationalError) or e.orig is None or "connect" in str(e.orig).lower()
+
+
+class Replica:
+    def __init__(self, url: str, timeout_ms: int, **pool_overrides):
+        """
+        Args:
+            url (str): Read-only DSN.
+            timeout_ms (int): statement_timeout for its connections.
+        """
+        self.url = url
+        self.timeout_ms = timeout_ms
+        self.engine = create_ro_engine(url, timeout_ms, **pool_overrides)
+        self.monitor = PoolMonitor(self.engine)
+        self._pool_overrides = pool_overrides
+        self._async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, PoolMonitor]" = weakref.WeakKeyDictionary()
+        self.healthy = True
+        self.lag_seconds: float | None = None
+        self.inflight = 0
+        self.latency_ms = 0.0  # EWMA of query time
+        self.queries = 0
+        self.failures = 0
+        self.ejections = 0
+
+    @property
+    def name(self) -> str:
+        return self.engine.url.render_as_string(hide_password=True)
+
+    def async_monitor(self) -> PoolMonitor:
+        """PoolMonitor of this replica's asyncpg engine for the running event loop."""
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        loop = asyncio.get_running_loop()
+        monitor = self._async.get(loop)
+        if monitor is None:
+            engine = create_async_engine(
+                async_url(self.url),
+                connect_args=async_connect_args(self.timeout_ms),
+                **pool_options(**self._pool_overrides),
+            )
+            monitor = self._async[loop] = PoolMonitor(engine)
+        return monitor
+
+    def score(self) -> float:
+        return (self.inflight + 1) * max(self.latency_ms, 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "url": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "inflight": self.inflight,
+            "latency_ms": round(self.latency_ms, 3),
+            "queries": self.queries,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "pool": self.monitor.stats(),
+            "async_pools": [m.stats() for m in list(self._async.values())],
+        }
+
+
+class ReplicaSet:
+    def __init__(
+        self, urls: list[str], timeout_ms: int, max_lag_seconds: float = MAX_LAG_SECONDS,
+        check_seconds: float = CHECK_SECONDS, **pool_overrides,
+    ):
+        """
+        Args:
+            urls (list[str]): Read-only DSNs; the first one also serves schema
+                introspection and change polling (see src/schema_catalog.py, src/table_changes.py).
+            timeout_ms (int): statement_timeout for every replica.
+            max_lag_seconds (float): Replay lag above which a replica is ejected.
+            check_seconds (float): Health check interval; 0 = never check.
+        """
+        if not urls:
+            raise ValueError("ReplicaSet needs at least one DSN")
+        self.replicas = [Replica(u, timeout_ms, **pool_overrides) for u in urls]
+        self.max_lag_seconds = max_lag_seconds
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._checking = threading.Event()
+        self.retries = 0
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    # ---------- health ----------
+    def _eject(self, replica: Replica, reason: str) -> None:
+        with self._lock:
+            if replica.healthy:
+                replica.healthy = False
+                replica.ejections += 1
+                logger.warning("replica %s ejected: %s", replica.name, reason)
+
+    def check(self) -> None:
+        """Health and lag check of every replica, once."""
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as c:
+                    lag = float(c.execute(text(_LAG_SQL)).scalar() or 0.0)
+            except Exception as e:
+                replica.lag_seconds = None
+                self._eject(replica, f"health check failed: {e}")
+                continue
+            replica.lag_seconds = lag
+            if lag > self.max_lag_seconds:
+                self._eject(replica, f"replication lag {lag:.1f}s > {self.max_lag_seconds}s")
+            elif not replica.healthy:
+                with self._lock:
+                    replica.healthy = True
+                logger.info("replica %s back in rotation", replica.name)
+        self._checked_at = time.time()
+
+    def _check_in_background(self) -> None:
+        if self._checking.is_set():
+            return
+        self._checking.set()
+
+        def run():
+            try:
+                self.check()
+            finally:
+                self._checking.clear()
+
+        threading.Thread(target=run, daemon=True, name="replica-check").start()
+
+    def needs_first_check(self) -> bool:
+        return len(self.replicas) > 1 and self.check_seconds > 0 and self._checked_at == 0.0
+
+    def refresh(self) -> None:
+        """Keep health at most check_seconds old (first check is synchronous). One DSN is never checked."""
+        if len(self.replicas) < 2 or self.check_seconds <= 0:
+            return
+        if self._checked_at == 0.0:
+            self.check()
+        elif time.time() - self._checked_at >= self.check_seconds:
+            self._check_in_background()
+
+    # ---------- routing ----------
+    def pick(self, exclude: tuple[Replica, ...] = ()) -> Replica | None:
+        """Healthy replica with the lowest load score (ties at random), or None if all are excluded."""
+        with self._lock:
+            candidates = [r for r in self.replicas if r not in exclude]
+            healthy = [r for r in candidates if r.healthy] or candidates
+            if not healthy:
+                return None
+            best = min(r.score() for r in healthy)
+            replica = random.choice([r for r in healthy if r.score() == best])
+            replica.inflight += 1
+            return replica
+
+    def _done(self, replica: Replica, started: float, ok: bool) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            replica.inflight -= 1
+            replica.queries += 1
+            if not ok:
+                replica.failures += 1
+            elif replica.latency_ms:
+                replica.latency_ms += _EWMA_ALPHA * (elapsed_ms - replica.latency_ms)
+            else:
+                replica.latency_ms = elapsed_ms
+
+    def _failed(self, replica: Replica, e: Exception, tried: tuple[Replica, ...]) -> bool:
+        """Eject after a replica-level error; True if another replica should be tried."""
+        if not replica_failed(e):
+            return False
+        self._eject(replica, str(e).splitlines()[0] if str(e) else type(e).__name__)
+        if len(tried) < 2 and len(self.replicas) > len(tried):
+            with self._lock:
+                self.retries += 1
+            return True
+        return False
+
+    def run(self, work: Callable[..., T]) -> T:
+        """Run work(conn) on the best replica; on a replica-level error retry once on another one."""
+        self.refresh()
+        tried: tuple[Replica, ...] = ()
+        while True:
+            replica = self.pick(exclude=tried)
+            tried += (replica,)
+            started = time.perf_counter()
+            try:
+                result = run_with_reconnect(replica.monitor, work)
+            except Exception as e:
+                self._done(replica, started, False)
+                if self._failed(replica, e, tried):
+                    continue
+                raise
+            self._done(replica, started, True)
+            return result
+
+    async def run_async(self, work):
+        """Async twin of run; work is an async callable taking an AsyncConnection."""
+        if self.needs_first_check():
+            await asyncio.to_thread(self.refresh)
+        else:
+            self.refresh()
+        tried: tuple[Replica, ...] = ()
+        while True:
+            replica = self.pick(exclude=tried)
+            tried += (replica,)
+            started = time.perf_counter()
+            try:
+                result = await run_with_reconnect_async(replica.async_monitor(), work)
+            except Exception as e:
+                self._done(replica, started, False)
+                if self._failed(replica, e, tried):
+                    continue
+                raise
+            self._done(replica, started, True)
+            return result
+
+    @contextmanager
+    def connect(self):
+        """A connection from the best replica, held by the caller (streaming); no retry."""
+        self.refresh()
+        replica = self.pick()
+        started = time.perf_counter()
+        ok = True
+        try:
+            with replica.monitor.connect() as c:
+                yield c
+        except Exception as e:
+            ok = False
+            if replica_failed(e):
+                self._eject(replica, str(e).splitlines()[0])
+            raise
+        finally:
+            self._done(replica, started, ok)
+
+    @asynccontextmanager
+    async def aconnect(self):
+        """Async twin of connect."""
+        if self.needs_first_check():
+            await asyncio.to_thread(self.refresh)
+        else:
+            self.refresh()
+        replica = self.pick()
+        started = time.perf_counter()
+        ok = True
+        try:
+            async with replica.async_monitor().aconnect() as c:
+                yield c
+        except Exception as e:
+            ok = False
+            if replica_failed(e):
+                self._eject(replica, str(e).splitlines()[0])
+            raise
+        finally:
+            self._done(replica, started, ok)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "max_lag_seconds": self.max_lag_seconds,
+                "replicas": [r.stats() for r in self.replicas],
+            }
@@ -0,0 +1,471 @@
+# src/rollups.py
+"""
+Rollups: Pre-aggregated sales and transparent query rewriting onto them.
+
+Three tables in the `rollups` schema hold orders JOIN order_details summed at
+month, customer/month and product/month grain (line_count, quantity,
+gross_sales = SUM(unit_price * quantity), net_sales with discount, and
+order_count where it is additive). scripts/setup_rollups.py creates and
+refreshes them:
+
+- a refresh adds only orders above the stored watermark (max order_id seen);
+- triggers mark the rollups dirty when older rows change (UPDATE/DELETE/TRUNCATE,
+  or lines added to an order that is already rolled up); the next refresh then rebuilds.
+
+rewrite() maps an aggregate over orders/order_details (optionally joined to
+customers, products, categories along their keys) onto the smallest rollup
+that has the needed grain and measures, keeping the dimension joins. Filters
+on order_date are only accepted at month granularity. Anything it does not
+fully understand is left alone. The rewritten SQL is only used while the
+rollups are fresh (not dirty, watermark = max(order_id)).
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+from sqlglot import exp
+from sqlalchemy import text
+
+from src.schema_catalog import get_catalog
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("ROLLUPS", "1") == "1"
+CHECK_SECONDS = float(os.getenv("ROLLUP_CHECK_SECONDS", "5"))  # freshness is re-read at most this often
+SCHEMA = "rollups"
+_ALIAS = "_r"
+
+
+class Rollup(NamedTuple):
+    name: str
+    dims: tuple[str, ...]
+    measures: tuple[str, ...]
+
+
+_ALL = ("order_count", "line_count", "quantity", "gross_sales", "net_sales")
+# smallest first; order_count is not additive across products (one order, many products)
+ROLLUPS = (
+    Rollup("month", ("month",), _ALL),
+    Rollup("customer_month", ("customer_id", "month"), _ALL),
+    Rollup("product_month", ("product_id", "month"), _ALL[1:]),
+)
+
+_DIM_SQL = {"customer_id": "o.customer_id", "product_id": "od.product_id", "month": "date_trunc('month', o.order_date)::date"}
+_DIM_TYPE = {"customer_id": "varchar", "product_id": "integer", "month": "date"}
+_MEASURE_SQL = {
+    "order_count": "count(DISTINCT o.order_id)",
+    "line_count": "count(*)",
+    "quantity": "sum(od.quantity)",
+    "gross_sales": "sum(od.unit_price * od.quantity)",
+    "net_sales": "sum(od.unit_price * od.quantity * (1 - od.discount))",
+}
+_MEASURE_TYPE = {"order_count": "bigint", "line_count": "bigint", "quantity": "bigint", "gross_sales": "numeric", "net_sales": "numeric"}
+
+# join keys a query may use: {table, table} -> (table, column, table, column)
+_EDGES = {
+    frozenset({"orders", "order_details"}): ("orders", "order_id", "order_details", "order_id"),
+    frozenset({"orders", "customers"}): ("orders", "customer_id", "customers", "customer_id"),
+    frozenset({"order_details", "products"}): ("order_details", "product_id", "products", "product_id"),
+    frozenset({"products", "categories"}): ("products", "category_id", "categories", "category_id"),
+}
+_TABLES = {"orders", "order_details", "customers", "products", "categories"}
+# dimension table -> rollup column it hangs off
+_DIM_OF = {"customers": "customer_id", "products": "product_id", "categories": "product_id"}
+
+_stats_lock = threading.Lock()
+_stats = {"rewrites": 0, "stale": 0, "checks": 0}
+_fresh = False
+_checked_at = 0.0
+_rewrites: "OrderedDict[str, str | None]" = OrderedDict()
+_REWRITES_MAX = 2048
+
+
+# ---------- DDL and refresh (run as the owner, see scripts/setup_rollups.py) ----------
+def _table_sql(r: Rollup) -> str:
+    cols = [f"{d} {_DIM_TYPE[d]}" for d in r.dims] + [f"{m} {_MEASURE_TYPE[m]} NOT NULL" for m in r.measures]
+    return (
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA}.{r.name} ({', '.join(cols)}, "
+        f"UNIQUE NULLS NOT DISTINCT ({', '.join(r.dims)}))"
+    )
+
+
+_FUNCTIONS_SQL = f"""
+CREATE OR REPLACE FUNCTION {SCHEMA}.mark_dirty() RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = pg_catalog AS $$
+BEGIN
+  UPDATE {SCHEMA}.state SET dirty = true WHERE NOT dirty;
+  RETURN NULL;
+END$$;
+
+CREATE OR REPLACE FUNCTION {SCHEMA}.mark_dirty_if_old() RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = pg_catalog AS $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM new_rows n, {SCHEMA}.state s WHERE n.order_id <= s.watermark) THEN
+    UPDATE {SCHEMA}.state SET dirty = true WHERE NOT dirty;
+  END IF;
+  RETURN NULL;
+END$$;
+"""
+
+# (trigger, table, event, function); inserts above the watermark are picked up by the next refresh
+_TRIGGERS = (
+    ("rollups_old_insert", "orders", "INSERT", "mark_dirty_if_old", True),
+    ("rollups_change", "orders", "UPDATE OF order_id, customer_id, order_date OR DELETE OR TRUNCATE", "mark_dirty", False),
+    ("rollups_old_insert", "order_details", "INSERT", "mark_dirty_if_old", True),
+    ("rollups_change", "order_details", "UPDATE OR DELETE OR TRUNCATE", "mark_dirty", False),
+)
+
+
+def install(conn, reader: str = "readonly") -> None:
+    """Create the schema, tables, state row and triggers, and let `reader` query them."""
+    conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}"))
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA}.state (id boolean PRIMARY KEY DEFAULT true CHECK (id), "
+        "watermark integer NOT NULL DEFAULT 0, dirty boolean NOT NULL DEFAULT true, refreshed_at timestamptz)"
+    ))
+    conn.execute(text(f"INSERT INTO {SCHEMA}.state DEFAULT VALUES ON CONFLICT DO NOTHING"))
+    for r in ROLLUPS:
+        conn.execute(text(_table_sql(r)))
+    conn.execute(text(_FUNCTIONS_SQL))
+    for name, table, event, function, transition in _TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name} ON {table}"))
+        referencing = "REFERENCING NEW TABLE AS new_rows " if transition else ""
+        conn.execute(text(
+            f"CREATE TRIGGER {name} AFTER {event} ON {table} {referencing}"
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.{function}()"
+        ))
+    conn.execute(text(f"GRANT USAGE ON SCHEMA {SCHEMA} TO {reader}"))
+    conn.execute(text(f"GRANT SELECT ON ALL TABLES IN SCHEMA {SCHEMA} TO {reader}"))
+    invalidate()
+
+
+def drop(conn) -> None:
+    for name, table, *_ in _TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name} ON {table}"))
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    invalidate()
+
+
+def _upsert_sql(r: Rollup, incremental: bool) -> str:
+    dims = ", ".join(r.dims)
+    cols = ", ".join((*r.dims, *r.measures))
+    select = ", ".join([_DIM_SQL[d] for d in r.dims] + [_MEASURE_SQL[m] for m in r.measures])
+    where = "o.order_id > :low AND o.order_id <= :high" if incremental else "o.order_id <= :high"
+    add = ", ".join(f"{m} = {SCHEMA}.{r.name}.{m} + EXCLUDED.{m}" for m in r.measures)
+    return (
+        f"INSERT INTO {SCHEMA}.{r.name} ({cols}) "
+        f"SELECT {select} FROM orders o JOIN order_details od ON od.order_id = o.order_id "
+        f"WHERE {where} GROUP BY {', '.join(str(i) for i in range(1, len(r.dims) + 1))} "
+        f"ON CONFLICT ({dims}) DO UPDATE SET {add}"
+    )
+
+
+def refresh(conn, full: bool = False) -> dict:
+    """
+    Bring the rollups up to date inside the caller's transaction: new orders are
+    added on top, a dirty state (or full=True) rebuilds everything.
+    Args:
+        conn: Owner connection in a transaction (e.g. engine.begin()).
+        full (bool): Rebuild even when only new orders arrived.
+    Returns:
+        dict: {"mode": "full" | "incremental" | "noop", "watermark": int}
+    """
+    # no writer can commit below the new watermark while we read it
+    conn.execute(text("LOCK TABLE orders, order_details IN SHARE MODE"))
+    watermark, dirty = conn.execute(text(f"SELECT watermark, dirty FROM {SCHEMA}.state FOR UPDATE")).one()
+    high = conn.execute(text("SELECT coalesce(max(order_id), 0) FROM orders")).scalar()
+    full = full or dirty
+    if not full and high <= watermark:
+        return {"mode": "noop", "watermark": watermark}
+    for r in ROLLUPS:
+        if full:
+            conn.execute(text(f"TRUNCATE {SCHEMA}.{r.name}"))
+        conn.execute(text(_upsert_sql(r, incremental=not full)), {"low": watermark, "high": high})
+    conn.execute(text(f"UPDATE {SCHEMA}.state SET watermark = :high, dirty = false, refreshed_at = now()"), {"high": high})
+    invalidate()
+    return {"mode": "full" if full else "incremental", "watermark": high}
+
+
+# ---------- freshness (read-only role) ----------
+_FRESH_SQL = f"""
+SELECT NOT s.dirty AND s.watermark >= (SELECT coalesce(max(order_id), 0) FROM orders)
+FROM {SCHEMA}.state s
+"""
+
+
+def check_due() -> bool:
+    return time.time() - _checked_at >= CHECK_SECONDS
+
+
+def fresh(run: Callable) -> bool:
+    """True if the rollups cover every order; read through run(work) at most every ROLLUP_CHECK_SECONDS."""
+    global _fresh, _checked_at
+    if check_due():
+        try:
+            _fresh = bool(run(lambda c: c.execute(text(_FRESH_SQL)).scalar()))
+        except Exception as e:
+            # not installed (or no access): answer from the base tables
+            logger.debug("rollup freshness check failed: %s", e)
+            _fresh = False
+        _checked_at = time.time()
+        with _stats_lock:
+            _stats["checks"] += 1
+    return _fresh
+
+
+def invalidate() -> None:
+    """Forget the freshness answer and cached rewrites (after DDL or a refresh in this process)."""
+    global _checked_at
+    _checked_at = 0.0
+    with _stats_lock:
+        _rewrites.clear()
+
+
+def use(sql: str, rewritten: str | None, is_fresh: bool) -> str:
+    """The SQL to run: the rewrite while the rollups are fresh, else the original."""
+    if rewritten is None:
+        return sql
+    with _stats_lock:
+        _stats["rewrites" if is_fresh else "stale"] += 1
+    return rewritten if is_fresh else sql
+
+
+def rollup_stats() -> dict:
+    with _stats_lock:
+        return {**_stats, "enabled": ENABLED, "fresh": _fresh}
+
+
+# ---------- rewrite ----------
+class _NoMatch(Exception):
+    pass
+
+
+def rewrite(sql: str, tree: exp.Expression) -> str | None:
+    """
+    The query over a rollup, or None if no rollup can answer it exactly.
+    Args:
+        sql (str): Rendered statement (memo key).
+        tree (exp.Expression): Its syntax tree (src/query_validator.py); not modified.
+    """
+    if not ENABLED:
+        return None
+    with _stats_lock:
+        if sql in _rewrites:
+            _rewrites.move_to_end(sql)
+            return _rewrites[sql]
+    try:
+        out = _rewrite(tree.copy())
+    except _NoMatch:
+        out = None
+    with _stats_lock:
+        _rewrites[sql] = out
+        while len(_rewrites) > _REWRITES_MAX:
+            _rewrites.popitem(last=False)
+    return out
+
+
+def _require(cond) -> None:
+    if not cond:
+        raise _NoMatch
+
+
+def _strip(node: exp.Expression) -> exp.Expression:
+    while isinstance(node, exp.Paren):
+        node = node.this
+    return node
+
+
+def _table_name(t: exp.Table) -> str:
+    _require(isinstance(t, exp.Table) and isinstance(t.this, exp.Identifier) and t.db in ("", "public"))
+    _require(not t.args.get("sample"))  # a rollup holds every row, not the sample (src/approximate.py)
+    return t.name if t.this.quoted else t.name.lower()
+
+
+def _sources(tree: exp.Select) -> dict[str, str]:
+    """alias -> table for FROM/JOIN, after checking the joins follow the known keys."""
+    from_ = tree.args.get("from_")
+    _require(from_ is not None and not from_.expressions)
+    aliases: dict[str, str] = {}
+    conditions: list[exp.Expression] = []
+    for i, item in enumerate([from_.this] + [j.this for j in tree.args.get("joins") or ()]):
+        table = _table_name(item)
+        alias = item.alias_or_name
+        _require(table in _TABLES and alias not in aliases and table not in aliases.values() and alias != _ALIAS)
+        aliases[alias] = table
+        if i:
+            join = tree.args["joins"][i - 1]
+            _require(join.args.get("side") in (None, "") and join.args.get("kind") in (None, "", "INNER"))
+            _require(join.args.get("on") is not None and not join.args.get("using"))
+            conditions.extend(join.args["on"].flatten() if isinstance(join.args["on"], exp.And) else [join.args["on"]])
+
+    edges = set()
+    for cond in conditions:
+        cond = _strip(cond)
+        _require(isinstance(cond, exp.EQ))
+        left, right = _strip(cond.this), _strip(cond.expression)
+        _require(isinstance(left, exp.Column) and isinstance(right, exp.Column))
+        ends = {(aliases.get(left.table), left.name), (aliases.get(right.table), right.name)}
+        key = frozenset(t for t, _ in ends)
+        edge = _EDGES.get(key)
+        _require(edge is not None and ends == {(edge[0], edge[1]), (edge[2], edge[3])} and key not in edges)
+        edges.add(key)
+    # a tree over the tables: every table reached, no cross joins
+    tables = set(aliases.values())
+    _require("order_details" in tables and len(edges) == len(tables) - 1)
+    reached, frontier = set(), {"order_details"}
+    while frontier:
+        reached |= frontier
+        frontier = {t for e in edges if e & reached for t in e} - reached
+    _require(reached == tables)
+    return aliases
+
+
+def _factors(node: exp.Expression) -> list[exp.Expression]:
+    node = _strip(node)
+    if isinstance(node, exp.Mul):
+        return _factors(node.this) + _factors(node.expression)
+    return [node]
+
+
+def _measure(arg: exp.Expression, aliases: dict[str, str]) -> str:
+    """Measure behind SUM/AVG(arg): quantity, gross_sales or net_sales."""
+    names = []
+    for f in _factors(arg):
+        if isinstance(f, exp.Sub) and isinstance(_strip(f.this), exp.Literal) and _strip(f.this).name == "1":
+            f = _strip(f.expression)
+            _require(isinstance(f, exp.Column) and aliases.get(f.table) == "order_details" and f.name == "discount")
+            names.append("1-discount")
+            continue
+        _require(isinstance(f, exp.Column) and aliases.get(f.table) == "order_details")
+        names.append(f.name)
+    measure = {
+        ("quantity",): "quantity",
+        ("quantity", "unit_price"): "gross_sales",
+        ("1-discount", "quantity", "unit_price"): "net_sales",
+    }.get(tuple(sorted(names)))
+    _require(measure is not None)
+    return measure
+
+
+def _column(name: str) -> exp.Column:
+    return exp.column(name, table=_ALIAS)
+
+
+def _sum(measure: str) -> exp.Expression:
+    return exp.func("SUM", _column(measure))
+
+
+def _replace_aggregate(agg: exp.AggFunc, aliases: dict[str, str], measures: set[str]) -> exp.Expression:
+    _require(not isinstance(agg.parent, exp.Filter))
+    if isinstance(agg, exp.Count):
+        arg = agg.this
+        if isinstance(arg, exp.Distinct):
+            _require(len(arg.expressions) == 1)
+            col = _strip(arg.expressions[0])
+            _require(isinstance(col, exp.Column) and aliases.get(col.table) == "orders" and col.name == "order_id")
+            measure = "order_count"
+        else:
+            col = _strip(arg) if arg is not None else None
+            # NOT NULL columns count every line
+            _require(isinstance(col, exp.Star) or (
+                isinstance(col, exp.Column)
+                and (aliases.get(col.table) == "order_details" or (aliases.get(col.table) == "orders" and col.name == "order_id"))
+            ))
+            measure = "line_count"
+        measures.add(measure)
+        return exp.func("COALESCE", exp.cast(_sum(measure), "BIGINT"), exp.Literal.number(0))
+    if isinstance(agg, exp.Sum):
+        measure = _measure(agg.this, aliases)
+        measures.add(measure)
+        return exp.cast(_sum(measure), "BIGINT") if measure == "quantity" else _sum(measure)
+    if isinstance(agg, exp.Avg):
+        measure = _measure(agg.this, aliases)
+        measures.update((measure, "line_count"))
+        total = exp.cast(_sum(measure), "NUMERIC") if measure == "quantity" else _sum(measure)
+        return exp.Div(this=total, expression=_sum("line_count"), typed=True)  # plain /, not a float division
+    raise _NoMatch
+
+
+def _output_reference(col: exp.Column, output_names: set[str], aliases: dict[str, str]) -> bool:
+    """
+    True if Postgres binds the unqualified column to an output column: a bare
+    ORDER BY item, or a bare GROUP BY item that no input column shadows. Anywhere
+    else (WHERE, HAVING, expressions, aggregates) the name means an input column.
+    """
+    if col.name not in output_names:
+        return False
+    if isinstance(col.parent, exp.Ordered) and isinstance(col.parent.parent, exp.Order):
+        return True
+    if isinstance(col.parent, exp.Group):
+        tables = get_catalog().tables
+        return not any(t in tables and col.name in tables[t].column_names() for t in aliases.values())
+    return False
+
+
+def _rewrite(tree: exp.Expression) -> str:
+    _require(isinstance(tree, exp.Select) and not tree.args.get("with_") and not tree.args.get("distinct"))
+    _require(not any(n is not tree for n in tree.find_all(exp.Select)))
+    _require(not any(tree.find_all(exp.Window, exp.Placeholder, exp.Parameter)))
+    _require(all(isinstance(s.parent, exp.Count) for s in tree.find_all(exp.Star)))  # COUNT(*) only
+    aliases = _sources(tree)
+    # the join conditions are known; the new FROM is built below
+    tree.set("joins", None)
+    output_names = {e.alias for e in tree.expressions if isinstance(e, exp.Alias)}
+
+    measures: set[str] = set()
+    aggregates = [a for a in tree.find_all(exp.AggFunc)]
+    _require(aggregates or tree.args.get("group"))
+    for agg in aggregates:
+        agg.replace(_replace_aggregate(agg, aliases, measures))
+
+    dims: set[str] = set()
+    for trunc in list(tree.find_all(exp.TimestampTrunc, exp.DateTrunc)):
+        col = _strip(trunc.this)
+        if (
+            isinstance(col, exp.Column) and aliases.get(col.table) == "orders" and col.name == "order_date"
+            and trunc.text("unit").lower() == "month"
+        ):
+            trunc.replace(exp.cast(_column("month"), "TIMESTAMPTZ"))
+            dims.add("month")
+    for col in list(tree.find_all(exp.Column)):
+        if col.table == _ALIAS:
+            continue
+        if not col.table:
+            _require(_output_reference(col, output_names, aliases))
+            continue
+        table = aliases.get(col.table)
+        _require(table is not None)
+        if table in _DIM_OF:
+            dims.add(_DIM_OF[table])
+        elif (table, col.name) in (("orders", "customer_id"), ("order_details", "product_id")):
+            dims.add(col.name)
+            col.replace(_column(col.name))
+        else:
+            raise _NoMatch  # e.g. o.order_date outside DATE_TRUNC('month', ...)
+    for table in aliases.values():
+        if table in _DIM_OF:
+            dims.add(_DIM_OF[table])
+
+    rollup = next((r for r in ROLLUPS if dims <= set(r.dims) and measures <= set(r.measures)), None)
+    _require(rollup is not None)
+
+    by_table = {table: alias for alias, table in aliases.items()}
+    joins = []
+    if "customers" in by_table:
+        c = by_table["customers"]
+        joins.append((c, "customers", f"{c}.customer_id = {_ALIAS}.customer_id"))
+    if "products" in by_table:
+        p = by_table["products"]
+        joins.append((p, "products", f"{p}.product_id = {_ALIAS}.product_id"))
+        if "categories" in by_table:
+            cat = by_table["categories"]
+            joins.append((cat, "categories", f"{cat}.category_id = {p}.category_id"))
+    tree.set("from_", exp.From(this=exp.to_table(f"{SCHEMA}.{rollup.name}").as_(_ALIAS)))
+    tree.set("joins", [
+        exp.Join(this=exp.to_table(table).as_(alias), on=exp.condition(on)) for alias, table, on in joins
+    ])
+    return tree.sql(dialect="postgres")
+
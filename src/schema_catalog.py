@@ -0,0 +1,256 @@
+# src/schema_catalog.py
+"""
+Schema Catalog: Tables, columns, keys and row estimates introspected from Postgres.
+
+The catalog is read once over the readonly connection, kept in memory and on
+disk, and only re-introspected when a cheap version fingerprint of the system
+catalogs changes. The version check itself runs at most every
+SCHEMA_CATALOG_CHECK_SECONDS and in the background, so prompt building,
+validation and planning read the catalog without touching the database.
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+from sqlalchemy import text
+
+CATALOG_SCHEMA = os.getenv("SCHEMA_CATALOG_SCHEMA", "public")
+CATALOG_PATH = os.getenv("SCHEMA_CATALOG_PATH", ".cache/schema_catalog.json")
+CHECK_SECONDS = int(os.getenv("SCHEMA_CATALOG_CHECK_SECONDS", "300"))
+
+_RELKINDS = "('r', 'p', 'v', 'm')"
+
+# Fingerprint of everything the catalog is built from: relations, columns
+# and key constraints. Any DDL touching them changes a row version (xmin).
+_VERSION_SQL = f"""
+SELECT md5(
+  coalesce((SELECT string_agg(c.oid::text || ':' || c.xmin::text, ',' ORDER BY c.oid)
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relkind IN {_RELKINDS}), '')
+  || '|' ||
+  coalesce((SELECT string_agg(a.attrelid::text || '.' || a.attnum::text || ':' || a.xmin::text, ','
+                              ORDER BY a.attrelid, a.attnum)
+            FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relkind IN {_RELKINDS} AND a.attnum > 0), '')
+  || '|' ||
+  coalesce((SELECT string_agg(con.oid::text || ':' || con.xmin::text, ',' ORDER BY con.oid)
+            FROM pg_constraint con JOIN pg_namespace n ON n.oid = con.connamespace
+            WHERE n.nspname = :schema AND con.contype IN ('p', 'f')), '')
+)
+"""
+
+_TABLES_SQL = f"""
+SELECT c.relname AS table_name, c.relkind AS kind, GREATEST(c.reltuples, 0)::bigint AS row_estimate
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = :schema AND c.relkind IN {_RELKINDS}
+ORDER BY c.relname
+"""
+
+_COLUMNS_SQL = f"""
+SELECT c.relname AS table_name, a.attname AS column_name,
+       format_type(a.atttypid, a.atttypmod) AS data_type, NOT a.attnotnull AS nullable
+FROM pg_attribute a
+JOIN pg_class c ON c.oid = a.attrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = :schema AND c.relkind IN {_RELKINDS} AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY c.relname, a.attnum
+"""
+
+_KEYS_SQL = """
+SELECT con.contype AS kind, c.relname AS table_name, rc.relname AS ref_table,
+       ARRAY(SELECT a.attname FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+             JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+             ORDER BY k.ord) AS columns,
+       ARRAY(SELECT a.attname FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+             JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+             ORDER BY k.ord) AS ref_columns
+FROM pg_constraint con
+JOIN pg_class c ON c.oid = con.conrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_class rc ON rc.oid = con.confrelid
+WHERE n.nspname = :schema AND con.contype IN ('p', 'f')
+ORDER BY c.relname, con.conname
+"""
+
+
+@dataclass
+class Column:
+    name: str
+    data_type: str
+    nullable: bool = True
+
+
+@dataclass
+class ForeignKey:
+    columns: list[str]
+    ref_table: str
+    ref_columns: list[str]
+
+
+@dataclass
+class Table:
+    name: str
+    columns: list[Column] = field(default_factory=list)
+    primary_key: list[str] = field(default_factory=list)
+    foreign_keys: list[ForeignKey] = field(default_factory=list)
+    row_estimate: int = 0
+    is_view: bool = False
+
+    def column_names(self) -> list[str]:
+        return [c.name for c in self.columns]
+
+    def hint_line(self) -> str:
+        refs = {}
+        for fk in self.foreign_keys:
+            if len(fk.columns) == 1:
+                refs[fk.columns[0]] = f"{fk.ref_table}.{fk.ref_columns[0]}"
+        cols = [f"{c} -> {refs[c]}" if c in refs else c for c in self.column_names()]
+        return f"    {self.name}({', '.join(cols)})"
+
+
+@dataclass
+class Catalog:
+    version: str
+    tables: dict[str, Table]
+    _hint: str | None = field(default=None, init=False, repr=False, compare=False)
+
+    def table_names(self) -> list[str]:
+        return list(self.tables)
+
+    def to_hint(self, tables: list[str] | None = None) -> str:
+        """Render the prompt schema hint (all tables, or the given subset in catalog order)."""
+        if tables is None and self._hint is not None:
+            return self._hint
+        wanted = set(tables) if tables is not None else None
+        lines = [t.hint_line() for name, t in self.tables.items() if wanted is None or name in wanted]
+        hint = "\nTables:\n" + "\n".join(lines) + "\n"
+        if tables is None:
+            self._hint = hint
+        return hint
+
+    def to_dict(self) -> dict:
+        return {"version": self.version, "tables": [asdict(t) for t in self.tables.values()]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Catalog":
+        tables = {}
+        for t in data["tables"]:
+            tables[t["name"]] = Table(
+                name=t["name"],
+                columns=[Column(**c) for c in t["columns"]],
+                primary_key=list(t["primary_key"]),
+                foreign_keys=[ForeignKey(**fk) for fk in t["foreign_keys"]],
+                row_estimate=int(t["row_estimate"]),
+                is_view=bool(t.get("is_view", False)),
+            )
+        return cls(version=data["version"], tables=tables)
+
+
+def fetch_version(conn) -> str:
+    return conn.execute(text(_VERSION_SQL), {"schema": CATALOG_SCHEMA}).scalar() or ""
+
+
+def introspect(conn) -> Catalog:
+    """Read the full catalog for CATALOG_SCHEMA over an open connection."""
+    params = {"schema": CATALOG_SCHEMA}
+    version = fetch_version(conn)
+    tables: dict[str, Table] = {}
+    for r in conn.execute(text(_TABLES_SQL), params).mappings():
+        tables[r["table_name"]] = Table(
+            name=r["table_name"], row_estimate=int(r["row_estimate"]), is_view=r["kind"] in ("v", "m")
+        )
+    for r in conn.execute(text(_COLUMNS_SQL), params).mappings():
+        tables[r["table_name"]].columns.append(Column(r["column_name"], r["data_type"], bool(r["nullable"])))
+    for r in conn.execute(text(_KEYS_SQL), params).mappings():
+        t = tables[r["table_name"]]
+        if r["kind"] == "p":
+            t.primary_key = list(r["columns"])
+        elif r["ref_table"]:
+            t.foreign_keys.append(ForeignKey(list(r["columns"]), r["ref_table"], list(r["ref_columns"])))
+    return Catalog(version=version, tables=tables)
+
+
+def save_catalog(catalog: Catalog, path: str = CATALOG_PATH) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(catalog.to_dict(), f)
+    os.replace(tmp, path)  # atomic: readers never see a half-written file
+
+
+def load_catalog(path: str = CATALOG_PATH) -> Catalog | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return Catalog.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+# --- Process-wide cached catalog ---
+_catalog: Catalog | None = None
+_checked_at = 0.0
+_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def _engine():
+    from src.database import ro_engine  # lazy: database requires DB env vars at import
+    return ro_engine
+
+
+def refresh_catalog(force: bool = False) -> Catalog:
+    """
+    Run the version check and re-introspect only if the catalog changed
+    (or force=True). Persists a changed catalog to CATALOG_PATH.
+    """
+    global _catalog, _checked_at
+    with _lock:
+        if _catalog is None:
+            _catalog = load_catalog(CATALOG_PATH)
+        with _engine().connect() as c:
+            if force or _catalog is None or fetch_version(c) != _catalog.version:
+                _catalog = introspect(c)
+                try:
+                    save_catalog(_catalog, CATALOG_PATH)
+                except OSError:
+                    pass  # disk cache is best effort
+        _checked_at = time.time()
+        return _catalog
+
+
+def _refresh_in_background() -> None:
+    if _refreshing.is_set():
+        return
+    _refreshing.set()
+
+    def run():
+        try:
+            refresh_catalog()
+        except Exception:
+            pass  # keep serving the catalog we have
+        finally:
+            _refreshing.clear()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def get_catalog() -> Catalog:
+    """
+    Return the cached catalog without a database round trip. Only the very
+    first call of a process with no disk cache introspects synchronously; a
+    due version check runs in the background while the current catalog is served.
+    """
+    global _catalog, _checked_at
+    if _catalog is None:
+        with _lock:
+            if _catalog is None:
+                _catalog = load_catalog(CATALOG_PATH)
+        if _catalog is None:
+            return refresh_catalog(force=True)
+    if time.time() - _checked_at >= CHECK_SECONDS:
+        _refresh_in_background()
+    return _catalog
+
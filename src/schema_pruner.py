@@ -0,0 +1,197 @@
+# src/schema_pruner.py
+"""
+Schema Pruner: Keep only the tables a question is likely to need in the prompt.
+
+Tables are scored lexically against the question (table names, column names and
+a few domain terms), the top-k are kept, and the foreign-key graph is used to
+add the tables on the join paths between them so the LLM can still join the
+kept tables correctly. If nothing matches, the full schema is used.
+"""
+import logging
+import os
+import re
+import threading
+from collections import deque
+
+from src.schema_catalog import Catalog
+
+logger = logging.getLogger(__name__)
+
+# Number of directly relevant tables to keep (join-path tables come on top); 0 disables pruning
+PRUNE_TOP_K = int(os.getenv("SCHEMA_PRUNE_TOP_K", "4"))
+
+# Question words that point at a table without naming it
+TERM_HINTS: dict[str, list[str]] = {
+    "sales": ["order_details"],
+    "sold": ["order_details"],
+    "revenue": ["order_details"],
+    "amount": ["order_details"],
+    "value": ["order_details"],
+    "spent": ["order_details"],
+    "bought": ["order_details"],
+    "purchased": ["order_details"],
+    "month": ["orders"],
+    "monthly": ["orders"],
+    "year": ["orders"],
+    "yearly": ["orders"],
+    "placed": ["orders"],
+    "region": ["customers"],
+    "client": ["customers"],
+    "clients": ["customers"],
+    "staff": ["employees"],
+    "representative": ["employees"],
+    "manager": ["employees"],
+    "item": ["products"],
+    "items": ["products"],
+}
+
+# weights: naming the table beats naming one of its columns beats a shared word
+_W_TABLE, _W_COLUMN, _W_WORD, _W_HINT = 3.0, 1.5, 0.5, 2.0
+# tables scoring below this fraction of the best table are dropped as noise
+_MIN_RELATIVE_SCORE = 0.4
+_GENERIC = {"id", "name", "by", "of", "the", "a", "an", "and", "for", "per", "all", "each"}
+_WORD = re.compile(r"[a-z0-9]+")
+
+# cumulative telemetry since process start
+PRUNING_STATS = {"requests": 0, "pruned": 0, "chars_full": 0, "chars_sent": 0}
+_stats_lock = threading.Lock()
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _question_words(question: str) -> tuple[set[str], str]:
+    words = _WORD.findall(question.lower())
+    return set(words), " ".join(words)
+
+
+class _Index:
+    """Per-catalog lookup structures: term -> table weights and the FK graph."""
+
+    def __init__(self, catalog: Catalog):
+        self.terms: dict[str, dict[str, float]] = {}
+        self.phrases: list[tuple[str, str]] = []  # ("order date", table) for multi-word columns
+        self.graph: dict[str, set[str]] = {name: set() for name in catalog.tables}
+
+        for name, table in catalog.tables.items():
+            self._add(name, name, _W_TABLE)
+            self._add(_singular(name), name, _W_TABLE)
+            for part in name.split("_"):
+                self._add(part, name, _W_WORD)
+                self._add(_singular(part), name, _W_WORD)
+            for col in table.column_names():
+                self._add(col, name, _W_COLUMN)
+                parts = col.split("_")
+                if len(parts) > 1:
+                    self.phrases.append((" ".join(parts), name))
+                for part in parts:
+                    if part not in _GENERIC:
+                        self._add(part, name, _W_WORD)
+            for fk in table.foreign_keys:
+                if fk.ref_table in self.graph and fk.ref_table != name:
+                    self.graph[name].add(fk.ref_table)
+                    self.graph[fk.ref_table].add(name)
+        for term, tables in TERM_HINTS.items():
+            for t in tables:
+                if t in catalog.tables:
+                    self._add(term, t, _W_HINT)
+
+    def _add(self, term: str, table: str, weight: float) -> None:
+        slot = self.terms.setdefault(term, {})
+        slot[table] = max(slot.get(table, 0.0), weight)
+
+    def path(self, src: str, dst: str) -> list[str]:
+        """Shortest FK path from src to dst (inclusive), or [] if unconnected."""
+        prev = {src: src}
+        todo = deque([src])
+        while todo:
+            node = todo.popleft()
+            if node == dst:
+                out = [dst]
+                while out[-1] != src:
+                    out.append(prev[out[-1]])
+                return out[::-1]
+            for nxt in self.graph[node]:
+                if nxt not in prev:
+                    prev[nxt] = node
+                    todo.append(nxt)
+        return []
+
+
+_indexes: dict[str, _Index] = {}
+
+
+def _index_for(catalog: Catalog) -> _Index:
+    idx = _indexes.get(catalog.version)
+    if idx is None:
+        _indexes.clear()  # only the current catalog version is ever needed
+        idx = _indexes[catalog.version] = _Index(catalog)
+    return idx
+
+
+def score_tables(catalog: Catalog, question: str) -> dict[str, float]:
+    """Lexical relevance score per table (tables scoring 0 are omitted)."""
+    idx = _index_for(catalog)
+    words, text = _question_words(question)
+    scores: dict[str, float] = {}
+    for word in words:
+        # a word and its singular count once per table ("orders" vs "order")
+        hits = dict(idx.terms.get(_singular(word), {}))
+        for table, w in idx.terms.get(word, {}).items():
+            hits[table] = max(hits.get(table, 0.0), w)
+        for table, w in hits.items():
+            scores[table] = scores.get(table, 0.0) + w
+    for phrase, table in idx.phrases:
+        if phrase in text:
+            scores[table] = scores.get(table, 0.0) + _W_COLUMN
+    return scores
+
+
+def select_tables(catalog: Catalog, question: str, top_k: int = PRUNE_TOP_K) -> list[str]:
+    """
+    Top-k relevant tables plus the tables on FK paths connecting them,
+    in catalog order. Returns every table when pruning is off or nothing matched.
+    """
+    if top_k <= 0:
+        return catalog.table_names()
+    scores = score_tables(catalog, question)
+    if not scores:
+        return catalog.table_names()
+    best = max(scores.values())
+    ranked = [t for t in sorted(scores, key=lambda t: (-scores[t], t)) if scores[t] >= best * _MIN_RELATIVE_SCORE]
+    ranked = ranked[:top_k]
+
+    idx = _index_for(catalog)
+    keep = {ranked[0]}
+    for table in ranked[1:]:
+        # join the next table to the closest one already kept
+        paths = [p for p in (idx.path(k, table) for k in keep) if p]
+        if paths:
+            keep.update(min(paths, key=len))
+        else:
+            keep.add(table)
+    return [name for name in catalog.tables if name in keep]
+
+
+def pruned_hint(catalog: Catalog, question: str, top_k: int = PRUNE_TOP_K) -> str:
+    """Schema hint restricted to select_tables(); records prompt-size telemetry."""
+    full = catalog.to_hint()
+    tables = select_tables(catalog, question, top_k)
+    hint = full if len(tables) == len(catalog.tables) else catalog.to_hint(tables)
+
+    with _stats_lock:
+        PRUNING_STATS["requests"] += 1
+        PRUNING_STATS["pruned"] += hint is not full
+        PRUNING_STATS["chars_full"] += len(full)
+        PRUNING_STATS["chars_sent"] += len(hint)
+    logger.info(
+        "schema pruning: kept %d/%d tables, hint %d -> %d chars (%.0f%% smaller)",
+        len(tables), len(catalog.tables), len(full), len(hint),
+        100.0 * (1 - len(hint) / len(full)) if full else 0.0,
+    )
+    return hint
@@ -0,0 +1,162 @@
+# src/sql_canonical.py
+"""
+SQL Canonical: One normalized form per query shape.
+
+LLM output for the same question varies in whitespace, keyword case, table
+alias names and literal values. canonicalize() maps all of those onto one
+shape so they share a cache key and a server-side prepared plan. It works on
+the syntax tree src/query_validator.py already parsed, not on the text:
+
+- the tree is rendered without comments, so keyword case and whitespace are
+  sqlglot's; unquoted identifiers are lower-cased (Postgres folds them anyway);
+- table aliases are renamed t1, t2, ... in order of appearance, unless an
+  alias is also used bare (e.g. row_to_json(o)) or shadows a table name, where
+  renaming could change meaning;
+- literals are lifted into $n parameters only where the value cannot change the
+  shape of the plan: an operand of a comparison or LIKE, an IN (...) list of
+  literals, BETWEEN bounds, and LIMIT/OFFSET. Typed literals (DATE '...',
+  INTERVAL '...'), ORDER BY/GROUP BY ordinals and literals that are part of a
+  larger expression (-5, 5 + 1) stay inline.
+
+Numbers are lifted as CAST($n AS int/bigint/numeric), i.e. with the type the
+literal had, so comparisons resolve exactly as before. Strings are lifted
+untyped and take the type of their context, as a quoted literal does.
+"""
+import hashlib
+import re
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+_COMPARISON = (exp.EQ, exp.NEQ, exp.LT, exp.LTE, exp.GT, exp.GTE, exp.Like, exp.ILike)
+_INT4 = 2**31
+_INT8 = 2**63
+# stands in for a lifted literal while rendering; NUL cannot occur in Postgres SQL text
+_SLOT = re.compile("\x00(\\d+)\x00")
+
+
+class Canonical(NamedTuple):
+    sql: str                 # normalized text with $1..$n for lifted literals (PREPARE form)
+    bind_sql: str            # same text with :_p1..:_pn (SQLAlchemy text() form)
+    values: tuple[Any, ...]  # lifted literal values, in placeholder order
+    fingerprint: str         # hash of sql: same shape, same fingerprint
+    preparable: bool         # False when the text already has bind parameters
+
+    def bind_params(self) -> dict:
+        return {f"_p{i}": v for i, v in enumerate(self.values, 1)}
+
+
+def _rename_aliases(tree: exp.Expression) -> None:
+    """Rename FROM/JOIN aliases to t1, t2, ... in place, unless that could change what a name refers to."""
+    defs = [
+        a for a in tree.find_all(exp.TableAlias, bfs=False)
+        if isinstance(a.parent, (exp.Table, exp.Subquery)) and a.this and not a.columns
+        and not (isinstance(a.parent, exp.Table) and not isinstance(a.parent.this, exp.Identifier))  # table function
+    ]
+    if not defs:
+        return
+    mapping: dict[str, str] = {}
+    for a in defs:
+        if a.name not in mapping:
+            mapping[a.name] = f"t{len(mapping) + 1}"
+    unsafe = {t.name for t in tree.find_all(exp.Table)} | {c.alias_or_name for c in tree.find_all(exp.CTE)}
+    for col in tree.find_all(exp.Column):
+        if not col.table and col.name in mapping:
+            unsafe.add(col.name)  # used bare: could be a column or a whole-row reference
+    if unsafe & mapping.keys():
+        return
+    targets = set(mapping.values())
+    if any(i.name in targets and i.name not in mapping for i in tree.find_all(exp.Identifier)):
+        return  # a target name already used for something other than an alias
+    for a in defs:
+        a.set("this", exp.to_identifier(mapping[a.name]))
+    for col in tree.find_all(exp.Column):
+        if col.table in mapping and not col.args.get("db"):
+            col.set("table", exp.to_identifier(mapping[col.table]))
+
+
+def _liftable(tree: exp.Expression) -> list[exp.Literal]:
+    lift: list[exp.Literal] = []
+    for node in tree.find_all(*_COMPARISON, exp.Between, exp.In, exp.Limit, exp.Offset):
+        if isinstance(node, _COMPARISON):
+            lift += [side for side in (node.this, node.expression) if isinstance(side, exp.Literal)]
+        elif isinstance(node, exp.Between):
+            bounds = [node.args.get("low"), node.args.get("high")]
+            lift += [b for b in bounds if isinstance(b, exp.Literal)]
+        elif isinstance(node, exp.In):
+            items = node.expressions
+            if items and not node.args.get("query") and all(isinstance(i, exp.Literal) for i in items):
+                lift += items
+        elif isinstance(node.expression, exp.Literal) and not node.expression.is_string:
+            lift.append(node.expression)
+    return lift
+
+
+def _literal(lit: exp.Literal) -> tuple[Any, str | None]:
+    """The literal's value and the type its parameter is cast to (None: untyped)."""
+    if lit.is_string:
+        return lit.this, None
+    if lit.this.isdigit():
+        n = int(lit.this)
+        if n < _INT4:
+            return n, "int"
+        if n < _INT8:
+            return n, "bigint"
+    return Decimal(lit.this), "numeric"
+
+
+def _render(tree: exp.Expression) -> str:
+    # keep SQLAlchemy-style :name binds (sqlglot would print them as %(name)s)
+    tree = tree.transform(
+        lambda n: exp.var(f":{n.name}") if isinstance(n, exp.Placeholder) and n.name else n
+    )
+    return tree.sql(dialect="postgres", comments=False)
+
+
+def canonicalize(tree: exp.Expression) -> Canonical:
+    """
+    Normalized shape of a parsed statement plus the lifted literal values.
+    Args:
+        tree (exp.Expression): Parsed statement (src/query_validator.py); not modified.
+    """
+    tree = normalize_identifiers(tree.copy(), dialect="postgres")
+    has_binds = any(tree.find_all(exp.Placeholder))
+    _rename_aliases(tree)
+
+    lifted: list[tuple[Any, str | None]] = []
+    for lit in [] if has_binds else _liftable(tree):
+        value, type_ = _literal(lit)
+        slot = exp.var(f"\x00{len(lifted)}\x00")
+        lit.replace(exp.cast(slot, type_) if type_ else slot)
+        lifted.append((value, type_))
+    rendered = _render(tree)
+
+    # number the parameters in the order they appear in the text
+    order = [int(i) for i in _SLOT.findall(rendered)]
+    number = {slot: n for n, slot in enumerate(order, 1)}
+    sql = _SLOT.sub(lambda m: f"${number[int(m.group(1))]}", rendered)
+    bind_sql = _SLOT.sub(lambda m: f":_p{number[int(m.group(1))]}", rendered)
+    values = tuple(lifted[i][0] for i in order)
+    fingerprint = hashlib.sha256(sql.encode("utf-8")).hexdigest()[:16]
+    return Canonical(sql, bind_sql, values, fingerprint, not has_binds)
+
+
+@lru_cache(maxsize=2048)
+def canonicalize_sql(sql: str) -> Canonical:
+    """
+    canonicalize() for SQL that was not analyzed by src/query_validator.py (e.g. a
+    rollup rewrite). Statements sqlglot cannot parse are returned stripped and unlifted.
+    """
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except SqlglotError:
+        tree = None
+    if tree is None:
+        s = sql.strip()
+        return Canonical(s, s, (), hashlib.sha256(s.encode("utf-8")).hexdigest()[:16], False)
+    return canonicalize(tree)
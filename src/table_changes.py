@@ -0,0 +1,217 @@
+# src/table_changes.py
+"""
+Table Changes: Per-table change versions for cache invalidation.
+
+Cached results are tagged with the tables their SQL reads and a snapshot of
+those tables' versions. A table's version moves when a change signal arrives:
+
+- polling: the insert/update/delete counters in pg_stat_user_tables are read at
+  most every QUERY_CACHE_POLL_SECONDS (in the background after the first read);
+- notifications: with QUERY_CACHE_LISTEN=1 a listener thread waits for
+  pg_notify('table_changes', <table>) sent by the triggers that
+  scripts/install_change_triggers.py installs, so changes apply immediately.
+  Only tables that have the trigger are covered this way.
+
+Both read the primary (DATABASE_URL): a physical standby keeps its own
+pg_stat_user_tables, which replayed writes do not move, and cannot LISTEN. If
+the polled server is in recovery anyway, its counters cover no table, so results
+without a notify trigger get the short TTL.
+
+A version is (poll counter, local notification count). The counter comes from
+Postgres and means the same in every worker process, so snapshots stay
+comparable across processes through the shared cache tier. A notification only
+makes this process's snapshots stale, which is always safe.
+"""
+import logging
+import os
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = float(os.getenv("QUERY_CACHE_POLL_SECONDS", "5"))  # 0 disables polling
+LISTEN = os.getenv("QUERY_CACHE_LISTEN", "0") == "1"
+CHANNEL = "table_changes"
+TRIGGERS_SECONDS = 60.0  # how often the listener re-reads which tables have the notify trigger
+
+_POLL_SQL = """
+SELECT relname, n_tup_ins + n_tup_upd + n_tup_del AS changes
+FROM pg_stat_user_tables
+WHERE schemaname = current_schema()
+"""
+_RECOVERY_SQL = "SELECT pg_is_in_recovery()"
+# tables with the notify trigger of scripts/install_change_triggers.py
+_TRIGGERS_SQL = """
+SELECT c.relname
+FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid
+WHERE t.tgname = 'table_change_notify' AND t.tgenabled <> 'D'
+  AND c.relnamespace = current_schema()::regnamespace
+"""
+
+# Snapshot of the versions of the tables a result depends on:
+# (listener epoch, ((table, polled counter, notifications seen), ...))
+Snapshot = tuple[int, tuple[tuple[str, int | None, int], ...]]
+
+_counters: dict[str, int] = {}    # table -> last polled change counter
+_notified: dict[str, int] = {}    # table -> notifications received by this process
+_triggered: set[str] = set()      # tables whose changes notify the connected listener
+_epoch = 0                        # bumped when the listener lost notifications (reconnect)
+_polled_at = 0.0
+_standby = False                  # the polled server is a standby: its counters do not move
+_lock = threading.Lock()
+_polling = threading.Event()
+_listener: threading.Thread | None = None
+_stop = threading.Event()
+
+
+# ---------- versions ----------
+def _engine():
+    # the primary: the read-only DSNs may be standbys (src/replicas.py)
+    from src.database import admin_engine  # lazy: avoids an import cycle with src.database
+    return admin_engine
+
+
+def poll() -> None:
+    """Read pg_stat_user_tables change counters once."""
+    global _polled_at, _standby
+    with _engine().connect() as c:
+        standby = bool(c.execute(text(_RECOVERY_SQL)).scalar())
+        counters = {r[0]: int(r[1]) for r in c.execute(text(_POLL_SQL))}
+    if standby and not _standby:
+        logger.warning("table change polling reads a standby; cached results get the short TTL")
+    with _lock:
+        _standby = standby
+        _counters.clear()
+        _counters.update(counters)
+        _polled_at = time.time()
+
+
+def _poll_in_background() -> None:
+    if _polling.is_set():
+        return
+    _polling.set()
+
+    def run():
+        try:
+            poll()
+        except Exception as e:
+            logger.warning("table change poll failed: %s", e)
+        finally:
+            _polling.clear()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def refresh() -> None:
+    """Make sure the counters are at most POLL_SECONDS old (first poll is synchronous)."""
+    if POLL_SECONDS <= 0:
+        return
+    if _polled_at == 0.0:
+        try:
+            poll()
+        except Exception as e:
+            logger.warning("table change poll failed: %s", e)
+    elif time.time() - _polled_at >= POLL_SECONDS:
+        _poll_in_background()
+
+
+def covers(tables: frozenset[str]) -> bool:
+    """
+    True when every table has a change signal (a polled counter on the primary,
+    or a notify trigger while the listener is connected), so results on them may live long.
+    """
+    if not tables:
+        return False
+    listening = _listener is not None and _listener.is_alive()
+    with _lock:
+        polled = POLL_SECONDS > 0 and not _standby
+        return all((polled and t in _counters) or (listening and t in _triggered) for t in tables)
+
+
+def snapshot(tables: frozenset[str]) -> Snapshot:
+    with _lock:
+        return _epoch, tuple((t, _counters.get(t), _notified.get(t, 0)) for t in sorted(tables))
+
+
+def is_current(snap: Snapshot) -> bool:
+    epoch, versions = snap
+    with _lock:
+        return epoch == _epoch and all(
+            _counters.get(t) == counter and _notified.get(t, 0) == seen for t, counter, seen in versions
+        )
+
+
+def notify(table: str) -> None:
+    """Record a change to `table` (called by the listener, usable by writers in-process)."""
+    with _lock:
+        _notified[table] = _notified.get(table, 0) + 1
+
+
+# ---------- LISTEN / NOTIFY ----------
+def _read_triggers(conn) -> None:
+    """Remember which tables notify this listener (on connect, then every TRIGGERS_SECONDS)."""
+    with conn.cursor() as cur:
+        cur.execute(_TRIGGERS_SQL)
+        triggered = {r[0] for r in cur.fetchall()}
+    with _lock:
+        _triggered.clear()
+        _triggered.update(triggered)
+
+
+def _listen_forever(url: str) -> None:
+    global _epoch
+    import psycopg2
+
+    while not _stop.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(url)
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            _read_triggers(conn)
+            read_at = time.time()
+            while not _stop.is_set():
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        notify(conn.notifies.pop(0).payload)
+                if time.time() - read_at >= TRIGGERS_SECONDS:
+                    _read_triggers(conn)
+                    read_at = time.time()
+            conn.close()
+        except Exception as e:
+            logger.warning("table change listener reconnecting: %s", e)
+            if conn is not None:
+                conn.close()
+            # anything may have changed while disconnected
+            with _lock:
+                _epoch += 1
+                _triggered.clear()
+            time.sleep(1.0)
+    with _lock:
+        _triggered.clear()
+
+
+def start_listener(url: str | None = None) -> threading.Thread:
+    """Start the NOTIFY listener thread once per process."""
+    global _listener
+    with _lock:
+        if _listener is None or not _listener.is_alive():
+            if url is None:
+                url = _engine().url.render_as_string(hide_password=False).replace("+psycopg2", "")
+            _stop.clear()
+            _listener = threading.Thread(target=_listen_forever, args=(url,), daemon=True, name="table-changes")
+            _listener.start()
+        return _listener
+
+
+def stop_listener(timeout: float = 5.0) -> None:
+    global _listener
+    _stop.set()
+    if _listener is not None:
+        _listener.join(timeout)
+    _listener = None
@@ -0,0 +1,119 @@
+# src/template_matcher.py
+"""
+Template Matcher: Compiled question -> SQL template lookup for the stub path.
+
+Each template has an ordered priority (its position in the file), a SQL answer
+and a match rule in disjunctive form: a list of clauses, each clause a list of
+substrings that must all occur in the lower-cased question. The first template
+(lowest priority number) with any satisfied clause wins, exactly like an
+if-chain, but lookup does not walk the templates.
+
+All substrings are compiled once into an Aho-Corasick automaton. A lookup scans
+the question once, then only checks the clauses anchored on a matched substring
+(each clause is anchored on its rarest substring), so its cost tracks the
+question length and the number of hits rather than the number of templates.
+"""
+import json
+from collections import deque
+
+
+class TemplateMatcher:
+    def __init__(self, templates: list[dict]):
+        """
+        Args:
+            templates (list[dict]): Items like {"match": [["a", "b"], ["c"]], "sql": "..."},
+                in priority order.
+        """
+        self._sql: list[str] = []
+        # clause id -> (template index, pattern ids that must all occur)
+        self._clauses: list[tuple[int, tuple[int, ...]]] = []
+        pattern_ids: dict[str, int] = {}
+        uses: list[int] = []  # pattern id -> number of clauses using it
+
+        for t_idx, tpl in enumerate(templates):
+            self._sql.append(tpl["sql"])
+            for clause in tpl["match"]:
+                parts = sorted({p.lower() for p in clause if p})
+                if not parts:
+                    raise ValueError(f"Template {t_idx} has an empty match clause")
+                pids = []
+                for p in parts:
+                    pid = pattern_ids.get(p)
+                    if pid is None:
+                        pid = pattern_ids[p] = len(uses)
+                        uses.append(0)
+                    uses[pid] += 1
+                    pids.append(pid)
+                self._clauses.append((t_idx, tuple(pids)))
+
+        # Index each clause under its rarest pattern only, so common words
+        # ("show", "list") never fan out to every clause that mentions them.
+        self._anchored: list[list[int]] = [[] for _ in uses]
+        for c_idx, (_, pids) in enumerate(self._clauses):
+            self._anchored[min(pids, key=uses.__getitem__)].append(c_idx)
+
+        self._build_automaton(pattern_ids)
+
+    @classmethod
+    def from_file(cls, path: str) -> "TemplateMatcher":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self._sql)
+
+    def _build_automaton(self, pattern_ids: dict[str, int]) -> None:
+        # state -> {char: next_state}; state 0 is the root
+        goto: list[dict[str, int]] = [{}]
+        out: list[list[int]] = [[]]
+        for pattern, pid in pattern_ids.items():
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(pid)
+
+        fail = [0] * len(goto)
+        todo = deque(goto[0].values())
+        while todo:
+            state = todo.popleft()
+            for ch, nxt in goto[state].items():
+                todo.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def _scan(self, text: str) -> set[int]:
+        """Pattern ids that occur anywhere in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found: set[int] = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+    def match(self, question: str) -> str | None:
+        """Return the SQL of the highest-priority matching template, or None."""
+        found = self._scan(question.lower().strip())
+        best = len(self._sql)
+        for pid in found:
+            for c_idx in self._anchored[pid]:
+                t_idx, pids = self._clauses[c_idx]
+                if t_idx < best and all(p in found for p in pids):
+                    best = t_idx
+        return self._sql[best] if best < len(self._sql) else None
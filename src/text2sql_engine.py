@@ -6,24 +6,71 @@ load_dotenv()
 """
 Text2SQL Engine: Generates SQL from natural language using Gemini LLM or stub fallback.
 """
+import asyncio
 import os
+import queue
+import threading
+import time
+from collections import deque
 from typing import Optional
 
+from src.example_store import FEW_SHOT_K, ExampleStore, get_example_store
+from src.question_cache import cache_get, cache_put, make_key
+from src.schema_catalog import get_catalog
+from src.schema_pruner import pruned_hint
+from src.template_matcher import TemplateMatcher
+
 # Dynamic check for stub mode (evaluated at runtime, not import time)
 
-# You can expand this later or generate from the DB metadata
+# Static fallback, used only when the live catalog (src/schema_catalog.py) cannot be read
 SCHEMA_HINT = """
 Tables:
+    categories(category_id, category_name, description)
     customers(customer_id, company_name, contact_name, contact_title, city, country)
-    products(product_id, product_name, unit_price, category_id, discontinued)
-    orders(order_id, customer_id, employee_id, order_date, shipped_date, shipper_id, freight)
-    order_details(order_id, product_id, unit_price, quantity, discount)
-    categories(category_id, category_name)
-    employees(employee_id, first_name, last_name, title)
+    employees(employee_id, employee_name, title, city, country, reports_to -> employees.employee_id)
+    order_details(order_id -> orders.order_id, product_id -> products.product_id, unit_price, quantity, discount)
+    orders(order_id, customer_id -> customers.customer_id, employee_id -> employees.employee_id, order_date, required_date, shipped_date, shipper_id -> shippers.shipper_id, freight)
+    products(product_id, product_name, quantity_per_unit, unit_price, discontinued, category_id -> categories.category_id)
     shippers(shipper_id, company_name)
 """
 
+_CATALOG_RETRY_SECONDS = 60
+_catalog_failed_at = 0.0
+
+
+def default_schema_hint(question: Optional[str] = None) -> str:
+    """
+    Schema hint rendered from the cached schema catalog, pruned to the tables
+    relevant to `question` when one is given. Falls back to the static
+    SCHEMA_HINT (and retries later) if the catalog cannot be read.
+    """
+    global _catalog_failed_at
+    if time.time() - _catalog_failed_at < _CATALOG_RETRY_SECONDS:
+        return SCHEMA_HINT
+    try:
+        catalog = get_catalog()
+        return pruned_hint(catalog, question) if question is not None else catalog.to_hint()
+    except Exception:
+        _catalog_failed_at = time.time()
+        return SCHEMA_HINT
+
 # ---------- STUB: predictable, offline SQL ----------
+# Templates are compiled once into an indexed matcher (see src/template_matcher.py);
+# file order is priority order, so the first matching template wins.
+STUB_TEMPLATES_PATH = os.getenv(
+    "STUB_TEMPLATES_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "templates", "stub_templates.json"),
+)
+_matcher: TemplateMatcher | None = None
+
+
+def _stub_matcher() -> TemplateMatcher:
+    global _matcher
+    if _matcher is None:
+        _matcher = TemplateMatcher.from_file(STUB_TEMPLATES_PATH)
+    return _matcher
+
+
 def _stub_generate(question: str) -> str:
     """
     Generate predictable SQL for offline testing and fallback.
@@ -32,28 +79,224 @@ def _stub_generate(question: str) -> str:
     Returns:
         str: SQL query string.
     """
-    q = question.lower().strip()
-    if "list all customer names" in q or "list customers by name" in q:
-        return "SELECT customer_id, company_name FROM customers ORDER BY company_name"
-    if "top 5 customers by the total sales amount" in q:
-        return "SELECT o.customer_id, SUM(od.unit_price * od.quantity) AS total_sales FROM orders o JOIN order_details od ON o.order_id = od.order_id GROUP BY o.customer_id ORDER BY total_sales DESC LIMIT 5"
-    if "monthly sales trend" in q or "total sales amount for each month" in q:
-        return "SELECT DATE_TRUNC('month', o.order_date) AS month, SUM(od.unit_price * od.quantity) AS sales FROM orders o JOIN order_details od ON o.order_id = od.order_id WHERE o.order_date >= CURRENT_DATE - INTERVAL '1 year' GROUP BY month ORDER BY month"
-    if "top 3 products by quantity sold" in q or "top products by region" in q:
-        return "SELECT c.country AS region, p.product_name, SUM(od.quantity) AS sales FROM customers c JOIN orders o ON c.customer_id = o.customer_id JOIN order_details od ON o.order_id = od.order_id JOIN products p ON od.product_id = p.product_id GROUP BY region, p.product_name ORDER BY region, sales DESC LIMIT 3"
-    if "for each customer, show their company name and the total number of orders" in q or "customer orders" in q:
-        return "SELECT c.customer_id, c.company_name, COUNT(o.order_id) AS order_count FROM customers c LEFT JOIN orders o ON c.customer_id = o.customer_id GROUP BY c.customer_id, c.company_name"
-    if "total number of orders for each country" in q or "orders by country" in q:
-        return "SELECT c.country, COUNT(o.order_id) AS order_count FROM customers c LEFT JOIN orders o ON c.customer_id = o.customer_id GROUP BY c.country"
-    if "average value of their orders" in q or "average order value per customer" in q:
-        return "SELECT c.customer_id, c.company_name, AVG(od.unit_price * od.quantity) AS avg_order_value FROM customers c JOIN orders o ON c.customer_id = o.customer_id JOIN order_details od ON o.order_id = od.order_id GROUP BY c.customer_id, c.company_name"
-    if "list all company names of customers" in q or ("customers" in q and ("list" in q or "show" in q or "name" in q)):
-        return "SELECT company_name FROM customers ORDER BY company_name"
-    if "show the names of all products" in q or ("products" in q and ("list" in q or "show" in q or "name" in q)):
-        return "SELECT product_name FROM products ORDER BY product_name"
-    if "list the order dates for all orders" in q or ("orders" in q and "date" in q):
-        return "SELECT order_date FROM orders ORDER BY order_date"
-    return "SELECT 1"
+    return _stub_matcher().match(question) or "SELECT 1"
+
+
+# ---------- REAL: long-lived Gemini generator ----------
+PROMPT_TEMPLATE = """You are a Text-to-SQL assistant for **PostgreSQL**.
+
+RULES:
+- Output ONE statement only, SELECT or WITH…SELECT (no extra text).
+- Use only these tables/columns (Postgres names & syntax):
+{schema_hint}
+- Never write DDL/DML; no INSERT/UPDATE/DELETE/ALTER/TRUNCATE; no pg_catalog/information_schema.
+- Prefer explicit JOINs and proper GROUP BY.
+
+Examples:
+{examples}
+
+Now answer:
+Q: {question}
+SQL:
+"""
+
+FALLBACK_MODELS = ("models/gemini-1.5-flash", "models/gemini-1.5-flash-001")
+
+# Latency budget per question; once spent we answer from the stub
+GEMINI_DEADLINE_MS = int(os.getenv("GEMINI_DEADLINE_MS", "8000"))
+# Hedge to the next candidate once the in-flight call is slower than this
+# percentile of recent successful calls (GEMINI_HEDGE_DELAY_MS until warmed up)
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+GEMINI_HEDGE_DELAY_MS = int(os.getenv("GEMINI_HEDGE_DELAY_MS", "2000"))
+_HEDGE_MIN_SAMPLES = 20
+
+
+class GeminiGenerator:
+    """
+    Long-lived Gemini client built once per (api key, model).
+
+    Configures the SDK once, keeps one model handle per candidate, and splits the
+    prompt template around the examples and the question so a request only
+    retrieves its few-shot examples and concatenates strings.
+    """
+
+    _MAX_PREFIXES = 128
+
+    def __init__(self, api_key: str, model_name: str, genai=None, examples: ExampleStore | None = None):
+        if genai is None:
+            import google.generativeai as genai
+        genai.configure(api_key=api_key) # type: ignore
+        self._genai = genai
+        self._api_key = api_key
+        self.model_name = model_name
+        # preferred model first, then fallbacks (deduplicated, order kept)
+        self.candidates = tuple(dict.fromkeys((model_name, *FALLBACK_MODELS)))
+        self._models: dict = {}
+        self.examples = examples if examples is not None else get_example_store()
+        head, rest = PROMPT_TEMPLATE.split("{examples}")
+        middle, tail = rest.split("{question}")
+        self._head = head
+        self._middle = middle
+        self._tail = tail
+        # schema_hint -> prompt text up to the examples
+        self._prefixes: dict[str, str] = {}
+        # recent successful call latencies (seconds), newest last
+        self._latencies: deque[float] = deque(maxlen=200)
+        self.deadline_s = GEMINI_DEADLINE_MS / 1000
+
+    def matches(self, api_key: str, model_name: str) -> bool:
+        return self._api_key == api_key and self.model_name == model_name
+
+    def model(self, candidate: str):
+        handle = self._models.get(candidate)
+        if handle is None:
+            handle = self._models[candidate] = self._genai.GenerativeModel(candidate) # type: ignore
+        return handle
+
+    def prompt(self, question: str, schema_hint: str = SCHEMA_HINT) -> str:
+        prefix = self._prefixes.get(schema_hint)
+        if prefix is None:
+            if len(self._prefixes) >= self._MAX_PREFIXES:
+                self._prefixes.clear()
+            prefix = self._head.format(schema_hint=schema_hint)
+            self._prefixes[schema_hint] = prefix
+        examples = self.examples.render(question, FEW_SHOT_K)
+        return "".join((prefix, examples, self._middle, question, self._tail))
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait on an in-flight call before hedging to the next model."""
+        samples = sorted(self._latencies)
+        if len(samples) < _HEDGE_MIN_SAMPLES:
+            return GEMINI_HEDGE_DELAY_MS / 1000
+        idx = min(len(samples) - 1, int(len(samples) * GEMINI_HEDGE_PERCENTILE / 100))
+        return samples[idx]
+
+    def _call(self, candidate: str, prompt: str, timeout: float) -> str | None:
+        t0 = time.monotonic()
+        try:
+            sql = _extract_sql(self.model(candidate).generate_content(prompt, request_options={"timeout": timeout}))
+        except Exception:
+            return None
+        if sql:
+            self._latencies.append(time.monotonic() - t0)
+        return sql or None
+
+    async def _call_async(self, candidate: str, prompt: str, timeout: float) -> str | None:
+        t0 = time.monotonic()
+        try:
+            resp = await self.model(candidate).generate_content_async(prompt, request_options={"timeout": timeout})
+            sql = _extract_sql(resp)
+        except Exception:
+            return None
+        if sql:
+            self._latencies.append(time.monotonic() - t0)
+        return sql or None
+
+    def generate(self, question: str, schema_hint: str = SCHEMA_HINT) -> str | None:
+        """
+        Hedged generation within the latency budget.
+
+        Starts the preferred model; if it has not answered after hedge_delay()
+        (or fails), the next candidate is started alongside it. The first
+        non-empty SQL wins and the others are abandoned. Returns None once
+        the budget is spent or every candidate failed.
+        """
+        prompt = self.prompt(question, schema_hint)
+        deadline = time.monotonic() + self.deadline_s
+        hedge = self.hedge_delay()
+        waiting = list(self.candidates)
+        results: "queue.Queue[str | None]" = queue.Queue()
+
+        def launch():
+            candidate = waiting.pop(0)
+            timeout = max(deadline - time.monotonic(), 0.001)
+            # daemon threads: an abandoned loser never blocks shutdown
+            threading.Thread(target=lambda: results.put(self._call(candidate, prompt, timeout)), daemon=True).start()
+
+        launch()
+        in_flight = 1
+        while in_flight:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                sql = results.get(timeout=min(remaining, hedge) if waiting else remaining)
+            except queue.Empty:
+                if not waiting:
+                    return None  # budget spent
+                launch()  # hedge: slow call keeps running alongside
+                in_flight += 1
+                continue
+            in_flight -= 1
+            if sql:
+                return sql
+            if waiting:  # failed fast: move on immediately
+                launch()
+                in_flight += 1
+        return None
+
+    async def generate_async(self, question: str, schema_hint: str = SCHEMA_HINT) -> str | None:
+        """Async twin of generate(): losers are cancelled once a winner is found."""
+        prompt = self.prompt(question, schema_hint)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_s
+        hedge = self.hedge_delay()
+        waiting = list(self.candidates)
+        in_flight: set[asyncio.Task] = set()
+
+        def launch():
+            timeout = max(deadline - loop.time(), 0.001)
+            in_flight.add(asyncio.ensure_future(self._call_async(waiting.pop(0), prompt, timeout)))
+
+        launch()
+        try:
+            while in_flight:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                done, _ = await asyncio.wait(
+                    in_flight,
+                    timeout=min(remaining, hedge) if waiting else remaining,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    if not waiting:
+                        return None  # budget spent
+                    launch()  # hedge
+                    continue
+                for task in done:
+                    in_flight.discard(task)
+                    sql = task.result()
+                    if sql:
+                        return sql
+                if waiting:  # failed fast: move on immediately
+                    launch()
+            return None
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+
+def _extract_sql(resp) -> str:
+    return (resp.text or "").strip().strip("`")
+
+
+_generator: GeminiGenerator | None = None
+_generator_lock = threading.Lock()
+
+
+def get_generator(api_key: str, model_name: str) -> GeminiGenerator:
+    """Return the process-wide generator, rebuilding it only if the key or model changed."""
+    global _generator
+    g = _generator
+    if g is not None and g.matches(api_key, model_name):
+        return g
+    with _generator_lock:
+        g = _generator
+        if g is None or not g.matches(api_key, model_name):
+            g = _generator = GeminiGenerator(api_key, model_name)
+    return g
+
 
 def generate_sql(question: str, schema_hint: Optional[str] = None) -> str:
     """
@@ -70,58 +313,54 @@ def generate_sql(question: str, schema_hint: Optional[str] = None) -> str:
         return _stub_generate(question)
 
     # ---------- REAL GEMINI PATH ----------
-    import google.generativeai as genai
-
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY not set")
-    genai.configure(api_key=api_key) # type: ignore
+    api_key, model_name, schema_hint, cache_key = _real_path_inputs(question, schema_hint)
 
-    # allow override via .env; default to a widely available alias
-    model_name = model_name = os.getenv("GEMINI_MODEL", "models/gemini-1.5-flash-002")
+    # repeat questions skip the LLM round trip entirely
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return cached
 
+    sql = get_generator(api_key, model_name).generate(question, schema_hint)
+    if sql:
+        cache_put(cache_key, sql)
+        return sql
 
-    FEW_SHOTS = [
-        {"q": "Show all product names.", "sql": "SELECT product_name FROM products ORDER BY product_name"},
-        {"q": "Show each customer and their total number of orders.", "sql": "SELECT c.customer_id, COUNT(o.order_id) AS order_count FROM customers c LEFT JOIN orders o ON c.customer_id = o.customer_id GROUP BY c.customer_id"},
-        {"q": "Show total orders by country.", "sql": "SELECT c.country, COUNT(o.order_id) AS order_count FROM customers c LEFT JOIN orders o ON c.customer_id = o.customer_id GROUP BY c.country"},
-        {"q": "What is the average order value per customer?", "sql": "SELECT o.customer_id, AVG(od.unit_price * od.quantity) AS avg_order_value FROM orders o JOIN order_details od ON o.order_id = od.order_id GROUP BY o.customer_id"},
-        {"q": "For each customer, show their company name and the total number of orders they have placed.", "sql": "SELECT c.customer_id, COUNT(o.order_id) AS order_count FROM customers c LEFT JOIN orders o ON c.customer_id = o.customer_id GROUP BY c.customer_id"},
-        {"q": "Show the total number of orders for each country.", "sql": "SELECT c.country, COUNT(o.order_id) AS order_count FROM customers c LEFT JOIN orders o ON c.customer_id = o.customer_id GROUP BY c.country"},
-        {"q": "For each customer, show their company name and the average value of their orders.", "sql": "SELECT o.customer_id, AVG(od.unit_price * od.quantity) AS avg_order_value FROM orders o JOIN order_details od ON o.order_id = od.order_id GROUP BY o.customer_id"},
-    ]
+    # last resort
+    return _stub_generate(question)
 
-    schema_hint = schema_hint or SCHEMA_HINT
-    examples = "\n\n".join([f"Q: {ex['q']}\nSQL: {ex['sql'].strip()}" for ex in FEW_SHOTS])
 
-    prompt = f"""You are a Text-to-SQL assistant for **PostgreSQL**.
+async def generate_sql_async(question: str, schema_hint: Optional[str] = None) -> str:
+    """
+    Async twin of generate_sql for the API: same stub switch, cache and
+    fallbacks, but the Gemini call is awaited.
+    """
+    use_stub = os.getenv("USE_GEMINI_STUB", "1") == "1"
+    if use_stub:
+        return _stub_generate(question)
 
-RULES:
-- Output ONE statement only, SELECT or WITH…SELECT (no extra text).
-- Use only these tables/columns (Postgres names & syntax):
-{schema_hint}
-- Never write DDL/DML; no INSERT/UPDATE/DELETE/ALTER/TRUNCATE; no pg_catalog/information_schema.
-- Prefer explicit JOINs and proper GROUP BY.
+    # catalog introspection, the example corpus and the SQLite question cache block: keep them off the loop
+    api_key, model_name, schema_hint, cache_key = await asyncio.to_thread(_real_path_inputs, question, schema_hint)
+    cached = await asyncio.to_thread(cache_get, cache_key)
+    if cached is not None:
+        return cached
 
-Examples:
-{examples}
+    sql = await get_generator(api_key, model_name).generate_async(question, schema_hint)
+    if sql:
+        await asyncio.to_thread(cache_put, cache_key, sql)
+        return sql
 
-Now answer:
-Q: {question}
-SQL:
-"""
+    return _stub_generate(question)
 
-    # try preferred model, then fallbacks; final fallback to stub
-    for candidate in (model_name, "models/gemini-1.5-flash", "models/gemini-1.5-flash-001"):
 
-        try:
-            model = genai.GenerativeModel(candidate) # type: ignore
-            resp = model.generate_content(prompt)
-            sql = (resp.text or "").strip().strip("`")
-            if sql:
-                return sql
-        except Exception:
-            continue
+def _real_path_inputs(question: str, schema_hint: Optional[str]) -> tuple[str, str, str, str]:
+    """Resolve (api_key, model_name, schema_hint, cache_key) for the Gemini path."""
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY not set")
 
-    # last resort
-    return _stub_generate(question)
+    # allow override via .env; default to a widely available alias
+    model_name = os.getenv("GEMINI_MODEL", "models/gemini-1.5-flash-002")
+    schema_hint = schema_hint or default_schema_hint(question)
+    # examples are a function of the question, so only the corpus version joins the key
+    key = make_key(question, schema_hint, model_name, get_example_store().version)
+    return api_key, model_name, schema_hint, key
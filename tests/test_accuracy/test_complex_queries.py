@@ -14,7 +14,7 @@ def evaluate_query_heuristics(sql, expected_columns, expected_rows):
 	# Execution Accuracy (20%)
 	try:
 		start = time.time()
-		rows = run_readonly(sql, row_limit=100)
+		rows = run_readonly(sql, row_limit=100, columnar=True)
 		exec_time = time.time() - start
 		execution_success = 1
 	except Exception:
@@ -27,7 +27,7 @@ def evaluate_query_heuristics(sql, expected_columns, expected_rows):
 	if rows and execution_success:
 		# Check if expected columns are present
 		if expected_columns:
-			actual_columns = list(rows[0].keys()) if rows else []
+			actual_columns = list(rows.columns) if rows else []
 			columns_match = all(col.lower() in [c.lower() for c in actual_columns] for col in expected_columns)
 			if columns_match:
 				if expected_rows is not None:
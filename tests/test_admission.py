@@ -0,0 +1,99 @@
+"""
+Tests for cost-based admission control.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+import src.admission as admission
+import src.database as database
+from src.admission import AdmissionError, Estimate
+
+CROSS_JOIN = "SELECT count(*) FROM order_details a, order_details b, order_details c"
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    """Fresh gates with one heavy slot and a short queue."""
+    monkeypatch.setattr(admission, "TIERS", [("cheap", 1000.0, 4), ("heavy", float("inf"), 1)])
+    monkeypatch.setattr(admission, "_sync_gates", {})
+    monkeypatch.setattr(admission, "QUEUE_SECONDS", 0.2)
+
+
+def _estimate(sql):
+    """Admission's estimate through the production path (cached EXPLAIN in src/database.py)."""
+    analysis = database.analyze_select(sql)
+    return database._preflight(analysis.sql, None, analysis.canonical)
+
+
+def test_estimate_reads_cost_and_rows():
+    cheap = _estimate("SELECT * FROM customers LIMIT 5")
+    wide = _estimate(CROSS_JOIN)
+    assert cheap.tier == "cheap" and cheap.rows == 5
+    assert wide.cost > cheap.cost
+    assert wide.rows == 1 and wide.max_rows > 1_000_000  # the aggregate hides a huge join
+
+
+def test_expensive_query_rejected_before_running():
+    database.cache_clear()
+    before = admission.admission_stats()["rejected"]
+    with pytest.raises(AdmissionError, match="estimated cost") as err:
+        database.run_readonly(CROSS_JOIN)
+    assert isinstance(err.value, ValueError)
+    assert admission.admission_stats()["rejected"] == before + 1
+
+
+def test_row_ceiling(monkeypatch):
+    monkeypatch.setattr(admission, "MAX_ROWS", 1000)
+    with pytest.raises(AdmissionError, match="intermediate rows"):
+        admission.check(Estimate(10.0, 1, 5000, "cheap"))
+
+
+def test_tier_slots_queue_and_time_out(tiers):
+    heavy = Estimate(5000.0, 10, 10, "heavy")
+    held = threading.Event()
+
+    def hold():
+        with admission.admit(heavy):
+            held.set()
+            time.sleep(0.5)
+
+    t = threading.Thread(target=hold)
+    t.start()
+    held.wait(5)
+    # cheap queries are not blocked by the full heavy tier
+    with admission.admit(Estimate(1.0, 1, 1, "cheap")):
+        pass
+    with pytest.raises(AdmissionError, match="Too many heavy queries"):
+        with admission.admit(heavy):
+            pass
+    t.join()
+    with admission.admit(heavy):
+        pass
+    assert admission.admission_stats()["tiers"]["heavy"]["running"] == 0
+
+
+def test_async_tier_slots(tiers):
+    heavy = Estimate(5000.0, 10, 10, "heavy")
+    order = []
+
+    async def run(name, hold):
+        async with admission.admit_async(heavy):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def main():
+        await asyncio.gather(run("a", 0.1), run("b", 0.0))
+
+    asyncio.run(main())
+    assert order == ["a", "b"]
+
+
+def test_disabled_skips_explain(monkeypatch):
+    monkeypatch.setattr(admission, "ENABLED", False)
+    database.cache_clear()
+    before = admission.admission_stats()["estimates"]
+    assert database.run_readonly("SELECT 1 AS x")[0]["x"] == 1
+    assert admission.admission_stats()["estimates"] == before
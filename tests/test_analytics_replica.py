@@ -0,0 +1,226 @@
+"""
+Tests for the DuckDB analytics replica: same answers as Postgres, incremental refresh, routing.
+"""
+import datetime
+import time
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+pytest.importorskip("duckdb")
+
+import src.database as database
+from src.analytics_replica import DuckDBReplica, make_replica
+from src.query_validator import analyze_select
+
+QUERIES = [
+    "SELECT c.country, COUNT(DISTINCT o.order_id) AS orders, SUM(od.unit_price * od.quantity * (1 - od.discount)) AS revenue "
+    "FROM customers c JOIN orders o ON o.customer_id = c.customer_id JOIN order_details od ON od.order_id = o.order_id "
+    "GROUP BY c.country ORDER BY revenue DESC",
+    "SELECT DATE_TRUNC('month', o.order_date) AS month, ROUND(AVG(o.freight)::numeric, 2) AS freight FROM orders o "
+    "GROUP BY month ORDER BY month",
+    "SELECT cat.category_name, MAX(p.unit_price), COUNT(*) FILTER (WHERE p.discontinued) FROM categories cat "
+    "JOIN products p ON p.category_id = cat.category_id GROUP BY cat.category_name ORDER BY 1",
+    "SELECT EXTRACT(YEAR FROM order_date)::int AS year, COUNT(*) AS n FROM orders GROUP BY 1 HAVING COUNT(*) > 10 ORDER BY 1",
+]
+
+
+def _norm(rows):
+    out = []
+    for r in rows:
+        vals = []
+        for v in r.values():
+            if isinstance(v, (Decimal, float)):
+                v = round(float(v), 6)
+            elif isinstance(v, datetime.datetime):
+                v = v.replace(tzinfo=None)
+            vals.append(v)
+        out.append(tuple(vals))
+    return out
+
+
+def _wait_for_counters(table, before):
+    """pg_stat_user_tables is updated shortly after commit (sooner with pg_stat_force_next_flush)."""
+    sql = text("SELECT n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables WHERE relname = :t")
+    for _ in range(50):
+        with database.ro_engine.connect() as c:
+            if c.execute(sql, {"t": table}).scalar() != before:
+                return
+        time.sleep(0.1)
+
+
+def _counter(table):
+    with database.ro_engine.connect() as c:
+        return c.execute(
+            text("SELECT n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables WHERE relname = :t"), {"t": table}
+        ).scalar()
+
+
+@pytest.fixture
+def replica():
+    r = DuckDBReplica(threads=2, concurrency=2)
+    r.refresh(database.ro_engine)
+    yield r
+    r.stop()
+
+
+def test_make_replica():
+    assert make_replica("") is None
+    assert isinstance(make_replica("duckdb"), DuckDBReplica)
+    with pytest.raises(ValueError):
+        make_replica("clickhouse")
+
+
+@pytest.mark.parametrize("sql", QUERIES)
+def test_same_answers_as_postgres(replica, sql):
+    a = analyze_select(sql, 1000)
+    assert replica.eligible(a)
+    expected = database.run_readonly(sql)
+    assert _norm(replica.run(a, False, 5)) == _norm(expected)
+
+
+def test_refresh_is_incremental(replica):
+    assert set(replica.refresh(database.ro_engine).values()) == {"unchanged"}
+    with database.admin_engine.connect() as c:
+        order_id = c.execute(text("SELECT max(order_id) + 1000 FROM orders")).scalar()
+    before = {t: _counter(t) for t in ("orders", "order_details")}
+    with database.admin_engine.begin() as c:
+        c.execute(text(
+            "INSERT INTO orders (order_id, customer_id, order_date, freight) VALUES (:id, 'ALFKI', DATE '1998-05-20', 1)"
+        ), {"id": order_id})
+        c.execute(text(
+            "INSERT INTO order_details (order_id, product_id, unit_price, quantity, discount) "
+            "VALUES (:id, 11, 21.00, 3, 0.05), (:id, 42, 14.00, 10, 0)"
+        ), {"id": order_id})
+        c.execute(text("SELECT pg_stat_force_next_flush()"))
+    try:
+        for t, n in before.items():
+            _wait_for_counters(t, n)
+        done = replica.refresh(database.ro_engine)
+        assert done["orders"] == "appended" and done["order_details"] == "appended"
+        assert done["customers"] == "unchanged"
+        sql = "SELECT COUNT(*) AS n, SUM(quantity) AS q FROM order_details"
+        assert _norm(replica.run(analyze_select(sql, 10), False, 5)) == _norm(database.run_readonly(sql, row_limit=10))
+
+        before = _counter("orders")
+        with database.admin_engine.begin() as c:
+            c.execute(text("UPDATE orders SET freight = 2 WHERE order_id = :id"), {"id": order_id})
+            c.execute(text("SELECT pg_stat_force_next_flush()"))
+        _wait_for_counters("orders", before)
+        assert replica.refresh(database.ro_engine)["orders"] == "reloaded"
+    finally:
+        with database.admin_engine.begin() as c:
+            c.execute(text("DELETE FROM order_details WHERE order_id = :id"), {"id": order_id})
+            c.execute(text("DELETE FROM orders WHERE order_id = :id"), {"id": order_id})
+
+
+def test_queries_read_the_old_snapshot_during_refresh(replica, monkeypatch):
+    import threading
+
+    sql = analyze_select("SELECT COUNT(*) AS n FROM orders", 10)
+    expected = replica.run(sql, False, 5)
+    # force a reload of orders and hold the refresh inside its DuckDB transaction
+    replica._tables["orders"] = replica._tables["orders"]._replace(changes=-1)
+    copying, release = threading.Event(), threading.Event()
+    copy = replica._copy
+
+    def slow_copy(*args):
+        copying.set()
+        release.wait(5)
+        return copy(*args)
+
+    monkeypatch.setattr(replica, "_copy", slow_copy)
+    refresh = threading.Thread(target=replica.refresh, args=(database.ro_engine,))
+    refresh.start()
+    try:
+        assert copying.wait(5)
+        # orders is already deleted inside the refresh transaction
+        assert replica.run(sql, False, 5) == expected
+    finally:
+        release.set()
+        refresh.join(10)
+    assert replica.run(sql, False, 5) == expected
+
+
+def test_run_readonly_routes_aggregates(replica, monkeypatch):
+    monkeypatch.setattr(database, "analytics", replica)
+    database.cache_clear()
+    routed = replica.stats()["routed"]
+    database.run_readonly(QUERIES[3])
+    database.run_readonly("SELECT order_id FROM orders WHERE freight > 100")  # not an aggregate
+    database.run_readonly("SELECT COUNT(*) AS n FROM orders WHERE freight > :f", {"f": 10})  # bound
+    assert replica.stats()["routed"] == routed + 1
+
+    # DuckDB has no num_nonnulls: Postgres answers, and keeps answering this shape
+    sql = "SELECT COUNT(*) FILTER (WHERE num_nonnulls(shipped_date, shipper_id) = 2) AS n FROM orders"
+    assert database.run_readonly(sql)[0]["n"] > 0
+    assert replica.stats()["fallbacks"] == 1
+    assert not replica.eligible(analyze_select(sql, database.ROW_LIMIT))
+
+    columnar = database.run_readonly(QUERIES[3], columnar=True)
+    assert columnar.columns == ["year", "n"]
+
+
+def test_not_routed_when_stale(replica):
+    a = analyze_select(QUERIES[3], 1000)
+    assert replica.eligible(a) and not replica.eligible(a, max_staleness=-1)
+    assert not replica.eligible(analyze_select("SELECT COUNT(*) FROM orders o, rollups.month m", 1000))
+
+
+def test_standby_source_is_not_routed(replica, monkeypatch):
+    """A standby's pg_stat_user_tables counters never move: "unchanged" would hide an old snapshot."""
+    import src.analytics_replica as analytics_replica
+
+    a = analyze_select(QUERIES[3], 1000)
+    refreshed_at = replica.refreshed_at
+    monkeypatch.setattr(analytics_replica, "_RECOVERY_SQL", "SELECT true")
+    assert replica.refresh(database.ro_engine) == {}
+    assert replica.standby and replica.refreshed_at == refreshed_at and not replica.eligible(a)
+    assert replica.stats()["standby"] is True
+    monkeypatch.setattr(analytics_replica, "_RECOVERY_SQL", "SELECT false")
+    replica.refresh(database.ro_engine)
+    assert not replica.standby and replica.eligible(a)
+
+
+def test_timeout_interrupts(replica):
+    a = analyze_select("SELECT COUNT(*) FROM order_details a, order_details b, order_details c", 10)
+    with pytest.raises(TimeoutError):
+        replica.run(a, False, 0.2)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*), string_agg(content, '') FROM order_details, read_text('/etc/hostname')",
+    "SELECT COUNT(*) FROM order_details, read_csv('/etc/passwd')",
+    "SELECT COUNT(*), MAX(getenv('HOME')) FROM order_details",
+])
+def test_duckdb_only_functions_not_routed(replica, sql):
+    assert not replica.eligible(analyze_select(sql, 1000))
+
+
+def test_no_file_access_after_load(replica):
+    with pytest.raises(Exception, match="disabled by configuration"):
+        replica._db.execute("SELECT content FROM read_text('/etc/hostname')")
+    with pytest.raises(Exception, match="locked"):
+        replica._db.execute("SET enable_external_access = true")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT order_id / 3 AS x, COUNT(*) AS n FROM orders GROUP BY 1 ORDER BY 1",
+    "SELECT SUM(quantity) / COUNT(*), AVG(quantity), AVG(unit_price) FROM order_details",
+    "SELECT DATE_TRUNC('month', order_date) AS month, COUNT(*) FROM orders GROUP BY 1 ORDER BY 1",
+])
+def test_postgres_semantics(replica, sql):
+    a = analyze_select(sql, 1000)
+    assert replica.eligible(a)
+    expected = database.run_readonly(sql)
+    got = replica.run(a, False, 5)
+    assert replica.stats()["routed"] == 1
+    assert [list(r) for r in got] == [list(r) for r in expected]  # same column names
+    for g, e in zip(got, expected):
+        for name in e:
+            assert type(g[name]) is type(e[name]), name
+            if isinstance(e[name], Decimal):
+                assert round(g[name], 6) == round(e[name], 6)
+            else:
+                assert g[name] == e[name]
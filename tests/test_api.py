@@ -157,4 +157,246 @@ def test_explain_endpoint_invalid_sql():
         json={"sql": "INVALID SQL SYNTAX"}
     )
     
-    assert response.status_code == 400
\ No newline at end of file
+    assert response.status_code == 400
+
+
+def test_explain_endpoint_estimate_mode():
+    """Estimate mode plans without running and returns a hotspot summary."""
+    body = {"sql": "SELECT customer_id, company_name FROM customers", "mode": "estimate"}
+    response = client.post("/explain", json=body)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["mode"] == "estimate"
+    assert data["execution_time_ms"] is None
+    assert {"hotspots", "seq_scans", "misestimates", "spills"} <= set(data["summary"])
+    assert client.post("/explain", json=body).json()["cached"] is True
+
+def test_ask_batch_dedupes_and_reports_per_item_errors(monkeypatch):
+    """Normalized duplicates are generated once; a failing question does not fail the batch."""
+    import src.api as api
+
+    calls = []
+
+    async def fake_generate(question):
+        calls.append(question)
+        if "broken" in question:
+            raise ValueError("cannot answer")
+        return "SELECT customer_id FROM customers ORDER BY customer_id"
+
+    monkeypatch.setattr(api, "generate_sql_async", fake_generate)
+    response = client.post(
+        "/ask/batch",
+        json={"questions": ["List customers", "list customers?", "broken one", "  "], "row_limit": 3},
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["unique_questions"] == 3
+    assert len(calls) == 2  # blank question never reaches the generator
+    ok, dup, bad, blank = data["items"]
+    assert ok["question"] == "List customers" and ok["row_count"] == 3 and ok["error"] is None
+    assert dup["question"] == "list customers?" and dup["rows"] == ok["rows"]
+    assert bad["error"] == "cannot answer"
+    assert blank["error"]
+    assert data["error_count"] == 2
+    # failed items have the same shape as answered ones
+    assert all(set(item) == set(ok) for item in (bad, blank))
+    assert bad["sql"] is None and bad["rows"] == [] and bad["row_count"] == 0
+    assert blank["sql"] is None and blank["rows"] == [] and blank["row_count"] == 0
+
+
+def test_ask_batch_keeps_questions_that_differ_by_operator(monkeypatch):
+    import src.api as api
+
+    async def fake_generate(question):
+        op = ">" if ">" in question else "<"
+        return f"SELECT product_id FROM products WHERE unit_price {op} 20 ORDER BY product_id"
+
+    monkeypatch.setattr(api, "generate_sql_async", fake_generate)
+    data = client.post("/ask/batch", json={"questions": ["price > 20", "price < 20"], "row_limit": 100}).json()
+    assert data["unique_questions"] == 2
+    above, below = data["items"]
+    assert above["sql"] != below["sql"] and above["rows"] != below["rows"]
+
+
+def test_ask_batch_bounds_concurrency(monkeypatch):
+    """No more than ASK_BATCH_CONCURRENCY generations run at once."""
+    import asyncio
+    import src.api as api
+
+    active = peak = 0
+
+    async def slow_generate(question):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return "SELECT 1 AS one"
+
+    monkeypatch.setattr(api, "generate_sql_async", slow_generate)
+    monkeypatch.setattr(api, "ASK_BATCH_CONCURRENCY", 2)
+    response = client.post("/ask/batch", json={"questions": [f"question {i}" for i in range(8)]})
+
+    assert response.status_code == 200
+    assert all(item["rows"] == [{"one": 1}] for item in response.json()["items"])
+    assert peak == 2
+
+
+def test_ask_batch_rejects_empty_list():
+    response = client.post("/ask/batch", json={"questions": []})
+    assert response.status_code == 422
+
+
+def test_ask_endpoint_stream_ndjson(monkeypatch):
+    """stream=true returns a header line, one line per row and a trailer."""
+    import json
+
+    monkeypatch.setenv("USE_GEMINI_STUB", "1")
+    response = client.post("/ask", json={"question": "show all products", "row_limit": 7, "stream": True})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    head, rows, trailer = lines[0], lines[1:-1], lines[-1]
+    assert head["question"] == "show all products" and "SELECT" in head["sql"].upper()
+    assert len(rows) == 7 and "product_name" in rows[0]
+    assert trailer["row_count"] == 7 and "execution_time_ms" in trailer
+
+    plain = client.post("/ask", json={"question": "show all products", "row_limit": 7}).json()
+    assert rows == json.loads(json.dumps(plain["rows"]))
+
+
+def test_ask_endpoint_stream_query_error(monkeypatch):
+    """A query that fails before the first row still returns 400."""
+    import src.api as api
+
+    async def bad_generate(question):
+        return "SELECT no_such_column FROM customers"
+
+    monkeypatch.setattr(api, "generate_sql_async", bad_generate)
+    response = client.post("/ask", json={"question": "anything", "stream": True})
+    assert response.status_code == 400
+
+
+def test_ask_endpoint_columnar(monkeypatch):
+    """format=columnar returns a column header and per-column arrays."""
+    monkeypatch.setenv("USE_GEMINI_STUB", "1")
+    rows = client.post("/ask", json={"question": "list customers by name", "row_limit": 5}).json()
+    response = client.post("/ask", json={"question": "list customers by name", "row_limit": 5, "format": "columnar"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["row_count"] == 5
+    table = data["rows"]
+    assert table["columns"] == list(rows["rows"][0].keys())
+    assert [dict(zip(table["columns"], values)) for values in zip(*table["data"])] == rows["rows"]
+
+
+def test_stats_endpoint():
+    response = client.get("/stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert {"hits", "misses", "expirations", "evictions", "bytes", "hit_rate"} <= set(data["query_cache"])
+    assert "chars_sent" in data["schema_pruning"]
+
+
+def test_ask_rejects_expensive_sql(monkeypatch):
+    """Runaway generated SQL gets a 400 explaining the cost, without running."""
+    import src.api as api
+
+    async def cross_join(question):
+        return "SELECT count(*) FROM order_details a, order_details b, order_details c"
+
+    monkeypatch.setattr(api, "generate_sql_async", cross_join)
+    response = client.post("/ask", json={"question": "everything times everything"})
+    assert response.status_code == 400
+    assert "estimated cost" in response.json()["detail"]
+    assert client.get("/stats").json()["admission"]["rejected"] >= 1
+
+
+def test_ask_paginated_with_next(monkeypatch):
+    """page_size returns a page and a token; /ask/next continues without regenerating SQL."""
+    import src.api as api
+
+    calls = []
+
+    async def fake_generate(question):
+        calls.append(question)
+        return "SELECT customer_id, country FROM customers ORDER BY country, customer_id"
+
+    monkeypatch.setattr(api, "generate_sql_async", fake_generate)
+    first = client.post("/ask", json={"question": "customers by country", "page_size": 40}).json()
+    assert first["row_count"] == 40 and first["page"]["has_more"]
+    assert first["page"]["estimated_total_rows"] >= 80
+    second = client.post("/ask/next", json={"token": first["page"]["next_token"], "format": "columnar"}).json()
+    third = client.post("/ask/next", json={"token": second["page"]["next_token"]}).json()
+    assert len(calls) == 1
+    assert second["rows"]["columns"] == ["customer_id", "country"] and second["row_count"] == 40
+    assert not third["page"]["has_more"] and third["page"]["next_token"] is None
+    ids = [r["customer_id"] for r in first["rows"]] + second["rows"]["data"][0] + [r["customer_id"] for r in third["rows"]]
+    everything = client.post("/ask", json={"question": "customers by country", "row_limit": 1000}).json()["rows"]
+    assert ids == [r["customer_id"] for r in everything]
+
+    # row_limit caps all pages together
+    capped = client.post("/ask", json={"question": "customers by country", "page_size": 40, "row_limit": 50}).json()
+    rest = client.post("/ask/next", json={"token": capped["page"]["next_token"]}).json()
+    assert rest["row_count"] == 10 and not rest["page"]["has_more"]
+
+    assert client.post("/ask/next", json={"token": "not-a-token"}).status_code == 400
+
+
+def test_ask_paginated_unpageable(monkeypatch):
+    import src.api as api
+
+    async def windowed(question):
+        return "SELECT customer_id, RANK() OVER (ORDER BY customer_id) AS r FROM customers"
+
+    monkeypatch.setattr(api, "generate_sql_async", windowed)
+    data = client.post("/ask", json={"question": "ranked customers", "page_size": 10}).json()
+    assert data["row_count"] == 10
+    assert data["page"] == {"size": 10, "has_more": True, "next_token": None, "estimated_total_rows": None, "pageable": False}
+
+
+def test_ask_approximate(monkeypatch):
+    import src.api as api
+    from src import approximate
+
+    async def totals(question):
+        return "SELECT COUNT(*) AS lines, SUM(quantity) AS units FROM order_details"
+
+    monkeypatch.setattr(api, "generate_sql_async", totals)
+    monkeypatch.setattr(approximate, "MIN_ROWS", 0)
+    monkeypatch.setattr(approximate, "SAMPLE_PERCENT", 25.0)
+    data = client.post("/ask", json={"question": "how many lines", "approximate": True}).json()
+    assert "TABLESAMPLE" in data["sql"]
+    assert data["approximate"]["applied"] is True
+    assert data["approximate"]["intervals"] == {"lines": ["lines_low", "lines_high"], "units": ["units_low", "units_high"]}
+    row = data["rows"][0]
+    assert row["lines_low"] <= row["lines"] <= row["lines_high"]
+
+    # not approximable: answered exactly, with the reason
+    async def largest(question):
+        return "SELECT MAX(quantity) AS m FROM order_details"
+
+    monkeypatch.setattr(api, "generate_sql_async", largest)
+    data = client.post("/ask", json={"question": "largest line", "approximate": True}).json()
+    assert data["approximate"]["applied"] is False
+    assert "MAX" in data["approximate"]["reason"]
+    assert "TABLESAMPLE" not in data["sql"]
+
+
+def test_ask_approximate_row_limit(monkeypatch):
+    import src.api as api
+    from src import approximate
+
+    async def per_line(question):
+        return "SELECT order_id, product_id, SUM(quantity) AS units FROM order_details GROUP BY order_id, product_id"
+
+    monkeypatch.setattr(api, "generate_sql_async", per_line)
+    monkeypatch.setattr(approximate, "MIN_ROWS", 0)
+    monkeypatch.setattr(approximate, "SAMPLE_PERCENT", 99.0)
+    data = client.post("/ask", json={"question": "units per line", "approximate": True, "row_limit": 5000}).json()
+    assert data["approximate"]["applied"] is True
+    assert data["sql"].endswith("LIMIT 5000")
+    assert data["row_count"] > 1000
@@ -0,0 +1,86 @@
+"""
+Tests for approximate aggregates: sampled estimates must be scaled back up and
+their intervals must cover the exact answer.
+"""
+import pytest
+from sqlalchemy import text
+
+import src.database as database
+from src import approximate, rollups
+from src.query_validator import analyze_select
+
+TOTALS = "SELECT COUNT(*) AS n, SUM(quantity) AS units, ROUND(AVG(unit_price), 2) AS avg_price FROM order_details"
+
+NOT_APPROXIMABLE = [
+    "SELECT MIN(quantity) FROM order_details",
+    "SELECT COUNT(DISTINCT order_id) FROM order_details",
+    "SELECT product_id, SUM(quantity) FROM order_details GROUP BY product_id HAVING SUM(quantity) > 10",
+    "SELECT o.order_id, COUNT(od.product_id) FROM orders o LEFT JOIN order_details od ON o.order_id = od.order_id GROUP BY o.order_id",
+    "SELECT * FROM orders",
+    "SELECT COUNT(*) FROM order_details WHERE order_id IN (SELECT order_id FROM orders WHERE freight > 10)",
+    "SELECT COUNT(*) FROM order_details CROSS JOIN generate_series(1, 3) AS rep",
+]
+
+
+def _rows(sql):
+    with database.ro_engine.connect() as conn:
+        return conn.execute(text(sql)).mappings().all()
+
+
+def test_rewrite_samples_largest_table():
+    approx = approximate.rewrite(
+        "SELECT o.customer_id, SUM(od.quantity) AS units FROM orders o JOIN order_details od "
+        "ON o.order_id = od.order_id GROUP BY o.customer_id",
+        percent=10, min_rows=0,
+    )
+    assert approx.table == "order_details"
+    assert "order_details AS od TABLESAMPLE BERNOULLI (10) REPEATABLE" in approx.sql
+    assert "orders AS o TABLESAMPLE" not in approx.sql
+    assert approx.intervals == {"units": ("units_low", "units_high")}
+
+
+@pytest.mark.parametrize("sql", NOT_APPROXIMABLE)
+def test_not_approximable(sql):
+    with pytest.raises(approximate.NotApproximable):
+        approximate.rewrite(sql, min_rows=0)
+
+
+def test_small_tables_stay_exact():
+    with pytest.raises(approximate.NotApproximable, match="exact is cheap"):
+        approximate.rewrite(TOTALS, row_estimates={"order_details": 2155}, min_rows=100000)
+
+
+def test_intervals_cover_exact(monkeypatch):
+    exact = _rows(TOTALS)[0]
+    covered = {name: 0 for name in ("n", "units", "avg_price")}
+    for seed in range(20):
+        monkeypatch.setattr(approximate, "SEED", seed)
+        approx = approximate.rewrite(TOTALS, percent=30, min_rows=0)
+        row = _rows(approx.sql)[0]
+        for name, (low, high) in approx.intervals.items():
+            assert row[low] <= row[name] <= row[high]
+            covered[name] += row[low] <= exact[name] <= row[high]
+        # scaled back up to the whole table
+        assert abs(row["n"] - exact["n"]) < exact["n"] * 0.2
+    # 95% intervals: a few misses out of 20 at most
+    assert all(hits >= 15 for hits in covered.values()), covered
+
+
+def test_repeatable_seed():
+    approx = approximate.rewrite(TOTALS, percent=20, min_rows=0)
+    assert _rows(approx.sql) == _rows(approx.sql)
+
+
+def test_rollups_skip_sampled_queries():
+    approx = approximate.rewrite(
+        "SELECT o.customer_id, SUM(od.unit_price * od.quantity) AS total_sales FROM orders o JOIN order_details od "
+        "ON o.order_id = od.order_id GROUP BY o.customer_id",
+        percent=10, min_rows=0,
+    )
+    assert rollups.rewrite(approx.sql, analyze_select(approx.sql).tree) is None
+
+
+def test_rewrite_keeps_row_limit():
+    sql = "SELECT order_id, SUM(quantity) AS units FROM order_details GROUP BY order_id"
+    approx = approximate.rewrite(sql, percent=50, min_rows=0, row_limit=5000)
+    assert approx.sql.endswith("LIMIT 5000")
@@ -0,0 +1,180 @@
+"""
+Tests for the shared result-cache backends (SQLite file and Redis protocol).
+"""
+import datetime
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+import pytest
+
+import src.database as database
+from src.cache_backends import RedisBackend, SQLiteBackend, decode_entry, encode_entry, make_backend
+from src.columnar import ColumnarResult
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """Just enough of a Redis server: PING, GET, SET [PX], DEL, KEYS, SELECT, AUTH."""
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        assert line.startswith(b"*")
+        args = []
+        for _ in range(int(line[1:])):
+            n = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(n + 2)[:-2])
+        return args
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            cmd = args[0].upper()
+            self.server.commands.append(cmd)
+            now = time.time()
+            if cmd in (b"PING", b"SELECT", b"AUTH"):
+                out = b"+OK\r\n"
+            elif cmd == b"SET":
+                expires = now + int(args[4]) / 1000 if len(args) > 4 else None
+                store[args[1]] = (args[2], expires)
+                out = b"+OK\r\n"
+            elif cmd == b"GET":
+                value, expires = store.get(args[1], (None, None))
+                if value is None or (expires is not None and expires <= now):
+                    out = b"$-1\r\n"
+                else:
+                    out = b"$%d\r\n%s\r\n" % (len(value), value)
+            elif cmd == b"DEL":
+                out = b":%d\r\n" % sum(store.pop(k, None) is not None for k in args[1:])
+            elif cmd == b"KEYS":
+                prefix = args[1].rstrip(b"*")
+                keys = [k for k in store if k.startswith(prefix)]
+                out = b"*%d\r\n" % len(keys) + b"".join(b"$%d\r\n%s\r\n" % (len(k), k) for k in keys)
+            else:
+                out = b"-ERR unknown command\r\n"
+            self.wfile.write(out)
+
+
+@pytest.fixture
+def resp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _RespHandler)
+    server.daemon_threads = True
+    server.store, server.commands = {}, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_redis_backend_round_trip(resp_server):
+    port = resp_server.server_address[1]
+    cache = RedisBackend(f"redis://:secret@127.0.0.1:{port}/2")
+    assert cache.get("k") is None
+    cache.set("k", b"\x00binary\r\nvalue", ttl=60)
+    assert cache.get("k") == b"\x00binary\r\nvalue"
+    assert resp_server.commands[:2] == [b"AUTH", b"SELECT"]
+    cache.delete("k")
+    assert cache.get("k") is None
+
+
+def test_redis_backend_ttl_and_clear(resp_server):
+    cache = RedisBackend(f"redis://127.0.0.1:{resp_server.server_address[1]}")
+    cache.set("short", b"x", ttl=0.05)
+    cache.set("long", b"y", ttl=60)
+    resp_server.store[b"other:key"] = (b"z", None)
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    cache.clear()
+    assert cache.get("long") is None
+    assert b"other:key" in resp_server.store  # only our namespace is cleared
+
+
+def test_redis_backend_reconnects(resp_server):
+    cache = RedisBackend(f"redis://127.0.0.1:{resp_server.server_address[1]}")
+    cache.set("k", b"v", ttl=60)
+    cache._sock.close()  # simulate a dropped connection
+    assert cache.get("k") == b"v"
+
+
+def test_sqlite_backend_shared_across_processes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SQLiteBackend(path)
+    writer = (
+        "from src.cache_backends import SQLiteBackend; "
+        f"SQLiteBackend({path!r}).set('k', b'from another process', 60)"
+    )
+    subprocess.run([sys.executable, "-c", writer], check=True)
+    assert cache.get("k") == b"from another process"
+    cache.set("gone", b"x", ttl=-1)
+    assert cache.get("gone") is None
+
+
+def test_make_backend_kinds(tmp_path):
+    assert make_backend("memory", "", "") is None
+    assert isinstance(make_backend("sqlite", str(tmp_path / "c.sqlite3"), ""), SQLiteBackend)
+    assert isinstance(make_backend("redis", "", "redis://localhost:6379"), RedisBackend)
+    with pytest.raises(ValueError):
+        make_backend("memcached", "", "")
+
+
+@pytest.fixture
+def shared_tier(monkeypatch, tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "shared.sqlite3"))
+    monkeypatch.setattr(database, "_shared", backend)
+    monkeypatch.setattr(database, "_shared_built", True)
+    monkeypatch.setattr(database, "_shared_down_until", 0.0)
+    database.cache_clear()
+    yield backend
+    database.cache_clear()
+
+
+def test_run_readonly_fills_and_reads_shared_tier(shared_tier):
+    sql = "SELECT 7 AS n"
+    rows = database.run_readonly(sql)
+    database.cache_clear()  # another worker: empty L1, same shared store
+
+    analysis = database.analyze_select(sql, database.ROW_LIMIT)
+    key = database._cache_key(analysis.canonical, None, analysis.limit)
+    assert shared_tier.get(database._shared_key(key)) is not None
+    assert database._cache_get(key) == rows
+    assert key in database._cache  # promoted into L1
+
+
+def test_failing_shared_tier_is_skipped(monkeypatch, shared_tier):
+    def broken(*args, **kwargs):
+        raise OSError("down")
+
+    monkeypatch.setattr(shared_tier, "get", broken)
+    monkeypatch.setattr(shared_tier, "set", broken)
+    assert database.run_readonly("SELECT 8 AS n") == [{"n": 8}]
+    assert database._shared_backend() is None  # backed off
+
+
+def test_entry_encoding_round_trip():
+    rows = [{
+        "n": Decimal("1.50"), "i": 3, "f": 0.5, "s": "x", "b": True, "none": None,
+        "d": datetime.date(1997, 1, 2), "ts": datetime.datetime(1997, 1, 2, 3, 4, tzinfo=datetime.timezone.utc),
+        "t": datetime.time(12, 30), "iv": datetime.timedelta(days=2, seconds=5), "u": uuid.UUID(int=7),
+        "raw": b"\x00\x01", "arr": [1, Decimal("2")], "doc": {"$n": "not a tag"},
+    }]
+    assert decode_entry(encode_entry(rows)) == rows
+    cols = ColumnarResult.from_rows(["a", "b"], [(1, Decimal("2.5")), (2, None)])
+    back = decode_entry(encode_entry(cols))
+    assert back.columns == ["a", "b"] and back.to_json() == cols.to_json()
+    assert back.data[0].dtype == cols.data[0].dtype
+
+
+def test_undecodable_shared_entry_is_a_miss(shared_tier):
+    import pickle
+
+    key = database._cache_key(database.analyze_select("SELECT 9 AS n").canonical, None, 1000)
+    shared_tier.set(database._shared_key(key), pickle.dumps((time.time(), [{"n": 9}], None)), 60)
+    assert database._cache_get(key) is None
@@ -0,0 +1,52 @@
+"""
+Tests for the columnar result shape.
+"""
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+
+from src.columnar import ColumnarResult
+from src.database import run_readonly
+
+
+def test_numeric_columns_packed():
+    res = ColumnarResult.from_rows(
+        ["id", "price", "flag", "name", "parent", "day"],
+        [
+            (1, Decimal("1.50"), True, "a", 7, date(1997, 1, 1)),
+            (2, None, False, "b", None, date(1997, 1, 2)),
+        ],
+    )
+    assert len(res) == 2
+    assert res.column("id").dtype == np.int64
+    assert res.column("price").dtype == np.float64
+    assert res.column("flag").dtype == np.bool_
+    # text, dates and integer columns with NULLs stay plain lists
+    assert res.column("name") == ["a", "b"]
+    assert res.column("parent") == [7, None]
+    assert res.column("day") == [date(1997, 1, 1), date(1997, 1, 2)]
+
+
+def test_round_trip_and_json():
+    res = ColumnarResult.from_rows(["n", "x"], [(1, 0.5), (2, None)])
+    assert res.to_rows() == [{"n": 1, "x": 0.5}, {"n": 2, "x": None}]
+    assert res.to_json() == {"columns": ["n", "x"], "data": [[1, 2], [0.5, None]]}
+    assert type(res.to_json()["data"][0][0]) is int
+
+
+def test_empty_result():
+    res = ColumnarResult.from_rows(["a", "b"], [])
+    assert len(res) == 0 and not res
+    assert res.to_json() == {"columns": ["a", "b"], "data": [[], []]}
+
+
+def test_run_readonly_columnar_matches_rows():
+    sql = "SELECT product_id, product_name, unit_price, discontinued FROM products ORDER BY product_id"
+    rows = run_readonly(sql, row_limit=20)
+    res = run_readonly(sql, row_limit=20, columnar=True)
+    assert isinstance(res, ColumnarResult)
+    assert res.columns == ["product_id", "product_name", "unit_price", "discontinued"]
+    assert res.to_rows() == [{**r, "unit_price": float(r["unit_price"])} for r in rows]
+    # same SQL, different shape: separate cache entries
+    assert run_readonly(sql, row_limit=20) == rows
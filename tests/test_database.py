@@ -1,6 +1,9 @@
 # tests/test_database.py
 from src.database import run_readonly, explain_sql, _cache_key, _cache_get, _cache_put
+from src.query_validator import analyze_select
 import pytest
+from sqlalchemy import text
+import time
 
 def test_ro_simple_select():
     rows = run_readonly("SELECT 1 AS x")
@@ -24,9 +27,9 @@ def test_explain_sql_with_parameters():
 def test_cache_functions():
     """Test cache functionality."""
     # Test cache key generation
-    key1 = _cache_key("SELECT 1", None, 10)
-    key2 = _cache_key("SELECT 1", None, 10)
-    key3 = _cache_key("SELECT 2", None, 10)
+    key1 = _cache_key(analyze_select("SELECT 1").canonical, None, 10)
+    key2 = _cache_key(analyze_select("SELECT 1").canonical, None, 10)
+    key3 = _cache_key(analyze_select("SELECT 2").canonical, None, 10)
     
     assert key1 == key2
     assert key1 != key3
@@ -39,7 +42,7 @@ def test_cache_functions():
     assert cached_data == test_data
     
     # Non-existent key should return None
-    non_existent_key = _cache_key("SELECT 999", None, 1)
+    non_existent_key = _cache_key(analyze_select("SELECT 999").canonical, None, 1)
     assert _cache_get(non_existent_key) is None
 
 def test_run_readonly_with_params():
@@ -72,3 +75,248 @@ def test_run_readonly_cache_behavior():
     
     assert rows1 == rows2
     assert rows1[0]["answer"] == 42
+
+
+def test_run_readonly_async_matches_sync():
+    """Async executor applies the same LIMIT handling as the sync one."""
+    import asyncio
+    from src.database import run_readonly_async
+
+    rows = asyncio.run(run_readonly_async("SELECT generate_series(1, 50) AS n", row_limit=5))
+    assert [r["n"] for r in rows] == [1, 2, 3, 4, 5]
+    assert rows == run_readonly("SELECT generate_series(1, 50) AS n", row_limit=5)
+
+
+def test_run_readonly_async_is_concurrent():
+    """Slow queries overlap on the async pool instead of queueing on threads."""
+    import asyncio
+    from src.database import run_readonly_async
+
+    async def many():
+        return await asyncio.gather(*[
+            run_readonly_async("SELECT CAST(:i AS int) AS i, pg_sleep(0.3) IS NULL AS slept", params={"i": i})
+            for i in range(8)
+        ])
+
+    start = time.time()
+    results = asyncio.run(many())
+    assert sorted(r[0]["i"] for r in results) == list(range(8))
+    assert time.time() - start < 8 * 0.3
+
+
+def test_run_readonly_async_keeps_cache_io_off_the_loop(monkeypatch):
+    """Cache reads/writes (SQLite/Redis tier, change polling) run in worker threads."""
+    import asyncio
+    import threading
+    import src.database as database
+
+    threads = []
+    for name in ("_cache_get", "_cache_put"):
+        real = getattr(database, name)
+        monkeypatch.setattr(database, name, lambda *a, _real=real: threads.append(threading.current_thread()) or _real(*a))
+
+    async def run():
+        loop_thread = threading.current_thread()
+        await database.run_readonly_async("SELECT 41 AS n")
+        return loop_thread
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 2 and loop_thread not in threads
+
+
+def test_explain_sql_async():
+    import asyncio
+    from src.database import explain_sql_async
+
+    result = asyncio.run(explain_sql_async("SELECT customer_id FROM customers", row_limit=5))
+    assert "Plan Rows" in result["plan"]
+    assert result["execution_time_ms"] >= 0
+
+
+def test_stream_readonly_matches_run_readonly():
+    from src.database import stream_readonly
+
+    sql = "SELECT order_id, customer_id FROM orders ORDER BY order_id"
+    stream = stream_readonly(sql, row_limit=250, fetch_size=40)
+    assert not isinstance(stream, list)
+    assert list(stream) == run_readonly(sql, row_limit=250)
+
+
+def test_stream_readonly_memory_stays_flat():
+    """Peak Python memory does not grow with the number of streamed rows."""
+    import tracemalloc
+    from src.database import stream_readonly
+
+    def peak(n):
+        tracemalloc.start()
+        sql = f"SELECT g, repeat('x', 200) AS pad FROM generate_series(1, {n}) g"
+        count = sum(1 for _ in stream_readonly(sql, row_limit=n, fetch_size=200))
+        _, top = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert count == n
+        return top
+
+    assert peak(40000) < 2 * peak(1000)
+
+
+def test_stream_readonly_async():
+    import asyncio
+    from src.database import stream_readonly_async
+
+    async def collect():
+        return [r async for r in stream_readonly_async("SELECT generate_series(1, 50) AS n", row_limit=7, fetch_size=3)]
+
+    assert [r["n"] for r in asyncio.run(collect())] == list(range(1, 8))
+
+
+@pytest.fixture
+def small_cache(monkeypatch):
+    import src.database as database
+
+    monkeypatch.setattr(database, "_CACHE_MAX_BYTES", 20_000)
+    monkeypatch.setattr(database, "_CACHE_MAX_ENTRY_BYTES", 8_000)
+    database.cache_clear()
+    yield database
+    database.cache_clear()
+
+
+def test_cache_evicts_against_byte_budget(small_cache):
+    db = small_cache
+    before = db.cache_stats()
+    for i in range(10):
+        db._cache_put(("k", i), [{"n": i, "pad": "x" * 500}] * 4)
+    stats = db.cache_stats()
+    assert stats["bytes"] <= 20_000
+    assert stats["evictions"] - before["evictions"] > 0
+    assert stats["bytes"] == sum(size for _, _, size, _ in db._cache.values())
+    assert db._cache_get(("k", 9)) is not None and db._cache_get(("k", 0)) is None
+
+
+def test_cache_refuses_oversized_entries(small_cache):
+    db = small_cache
+    before = db.cache_stats()["rejected"]
+    db._cache_put(("big",), [{"pad": "x" * 1000}] * 50)
+    assert db._cache_get(("big",)) is None
+    assert db.cache_stats()["rejected"] == before + 1
+
+
+def test_cache_counters(small_cache, monkeypatch):
+    db = small_cache
+    before = db.cache_stats()
+    db._cache_put(("c",), [{"n": 1}])
+    db._cache_get(("c",))
+    db._cache_get(("missing",))
+    now = time.time()
+    monkeypatch.setattr(db.time, "time", lambda: now + db._CACHE_TTL + 1)
+    db._cache_get(("c",))
+    stats = db.cache_stats()
+    assert stats["hits"] - before["hits"] == 1
+    assert stats["misses"] - before["misses"] == 2
+    assert stats["expirations"] - before["expirations"] == 1
+    assert stats["entries"] == 0 and stats["bytes"] == 0
+
+
+def test_estimate_bytes_scales_with_rows():
+    from src.database import _estimate_bytes
+
+    small = _estimate_bytes([{"a": 1, "b": "x" * 10}] * 10)
+    large = _estimate_bytes([{"a": 1, "b": "x" * 10}] * 1000)
+    assert 80 < large / small < 120
+
+def test_cache_key_is_canonical():
+    """Whitespace, case and alias variants share a key; different literals do not."""
+    a = _cache_key(analyze_select("SELECT c.city FROM customers c WHERE c.country = 'Germany'", 10).canonical, None, 10)
+    b = _cache_key(analyze_select("select x.city\nfrom customers as x where x.country='Germany'", 10).canonical, None, 10)
+    c = _cache_key(analyze_select("SELECT c.city FROM customers c WHERE c.country = 'France'", 10).canonical, None, 10)
+    assert a == b
+    assert a != c
+
+def test_repeated_shape_runs_prepared(monkeypatch):
+    """A shape seen twice is prepared; results match the plain run."""
+    import src.database as database
+
+    monkeypatch.setattr(database, "_PREPARE_AFTER", 2)
+    database.cache_clear()
+    database.ro_engine.dispose()  # one pooled connection, so the check below sees the one that prepared
+    sql = "SELECT customer_id FROM customers WHERE country = '{}' ORDER BY customer_id"
+    plain = run_readonly(sql.format("Germany"))
+    before = dict(database.PREPARED_STATS)
+    database.cache_clear()
+    prepared = run_readonly(sql.format("Germany"))
+    france = run_readonly(sql.format("France"))
+    assert prepared == plain
+    assert france and france != prepared
+    assert database.PREPARED_STATS["executes"] - before["executes"] == 2
+    # background checks may have opened more connections: look at every pooled one
+    conns = [database.ro_engine.connect() for _ in range(max(1, database.ro_engine.pool.checkedin()))]
+    try:
+        names = [n for c in conns for n in c.execute(text("SELECT name FROM pg_prepared_statements")).scalars()]
+    finally:
+        for c in conns:
+            c.close()
+    assert any(n.startswith("t2s_") for n in names)
+
+def test_lost_prepared_statement_falls_back_to_plain(monkeypatch):
+    """If EXECUTE fails (here: the statement was deallocated), the query runs plain and the shape is not prepared again."""
+    import src.database as database
+
+    monkeypatch.setattr(database, "_PREPARE_AFTER", 1)
+    sql = "SELECT count(*) AS n FROM products WHERE unit_price > 10.5 AND category_id <> 3"
+    analysis = analyze_select(sql)
+    canon = analysis.canonical
+    assert len(canon.values) == 3  # two comparisons and the LIMIT
+    with database.ro_pool.connect() as c:
+        first = database._execute(c, analysis.sql, None, canon).scalar()
+        c.execute(text("DEALLOCATE ALL"))
+        before = database.PREPARED_STATS["fallbacks"]
+        assert database._execute(c, analysis.sql, None, canon).scalar() == first
+    assert canon.fingerprint in database._unpreparable
+    assert database.PREPARED_STATS["fallbacks"] == before + 1
+
+def test_explain_estimate_mode_is_cached(monkeypatch):
+    from src import database
+
+    database.plan_cache_clear()
+    sql = "SELECT o.order_id FROM orders o JOIN customers c ON c.customer_id = o.customer_id WHERE o.freight > 20"
+    first = explain_sql(sql, row_limit=5, mode="estimate")
+    assert first["mode"] == "estimate" and first["cached"] is False
+    assert first["execution_time_ms"] is None and "Actual Total Time" not in first["plan"]
+    assert first["summary"]["hotspots"]
+    # same query spelled differently: served from the cache
+    respelled = "select x.order_id from orders x join customers y on y.customer_id = x.customer_id where x.freight > 20"
+    assert explain_sql(respelled, row_limit=5, mode="estimate")["cached"] is True
+
+    # new statistics invalidate cached plans
+    monkeypatch.setattr(database, "_STATS_CHECK_SECONDS", 0)
+    database.stats_version()
+    with database.admin_engine.begin() as admin:
+        admin.execute(text("ANALYZE customers"))
+    assert explain_sql(sql, row_limit=5, mode="estimate")["cached"] is False
+
+
+def test_stats_version_is_read_on_the_primary(monkeypatch):
+    """One source for the plan-cache key, whichever replica a query is routed to."""
+    from src import database
+
+    monkeypatch.setattr(database, "_STATS_CHECK_SECONDS", 0)
+    before = database.stats_version()
+    monkeypatch.setattr(database.replicas, "run", lambda work: pytest.fail("read on a replica"))
+    assert before and database.stats_version() == before
+
+def test_explain_analyze_mode_summary():
+    result = explain_sql("SELECT * FROM order_details ORDER BY quantity", row_limit=5)
+    assert result["mode"] == "analyze" and result["cached"] is False
+    assert result["execution_time_ms"] is not None
+    assert result["summary"]["analyzed"] is True
+
+def test_explain_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        explain_sql("SELECT 1", mode="verbose")
+
+def test_row_limit_lowers_existing_limit():
+    from src import database
+
+    rows = run_readonly("SELECT generate_series(1, 100) AS x LIMIT 50", row_limit=5)
+    assert [r["x"] for r in rows] == [1, 2, 3, 4, 5]
+    key = next(k for k in reversed(database._cache) if "generate_series" in k[0].lower())
+    assert "_t" not in key[0] and key[0].upper().count("LIMIT") == 1
@@ -3,6 +3,7 @@ Additional database tests to improve coverage.
 """
 import pytest
 from src.database import run_readonly, explain_sql, _cache_get, _cache_put, _cache_key
+from src.query_validator import analyze_select
 import time
 
 
@@ -33,10 +34,11 @@ def test_database_caching():
 
 def test_database_cache_key_generation():
     """Test cache key generation for different parameters."""
-    key1 = _cache_key("SELECT 1", None, 100)
-    key2 = _cache_key("SELECT 1", None, 100)
-    key3 = _cache_key("SELECT 1", None, 200)
-    key4 = _cache_key("SELECT 1", {"param": "value"}, 100)
+    shape = analyze_select("SELECT 1").canonical
+    key1 = _cache_key(shape, None, 100)
+    key2 = _cache_key(shape, None, 100)
+    key3 = _cache_key(shape, None, 200)
+    key4 = _cache_key(shape, {"param": "value"}, 100)
     
     # Same parameters should generate same key
     assert key1 == key2
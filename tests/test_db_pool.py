@@ -0,0 +1,78 @@
+"""
+Tests for the read-only connection pool: startup settings, reconnect, stats.
+"""
+import threading
+import time
+
+from sqlalchemy import text
+
+import src.database as database
+from src.db_pool import PoolMonitor, create_ro_engine, run_with_reconnect
+
+
+def test_session_settings_applied_at_connect():
+    engine = create_ro_engine(database.RO_URL, 1234, pool_size=1, max_overflow=0)
+    try:
+        with engine.connect() as c:
+            assert c.execute(text("SHOW statement_timeout")).scalar() == "1234ms"
+            assert c.execute(text("SHOW application_name")).scalar() == "text2sql-readonly"
+    finally:
+        engine.dispose()
+
+
+def test_run_readonly_keeps_timeout_without_set():
+    database.cache_clear()
+    rows = database.run_readonly("SELECT current_setting('statement_timeout') AS t")
+    assert rows[0]["t"] in (f"{database.TIMEOUT_MS}ms", f"{database.TIMEOUT_MS // 1000}s")
+
+
+def test_dead_connection_is_retried_once():
+    engine = create_ro_engine(database.RO_URL, 5000, pool_size=1, max_overflow=0)
+    monitor = PoolMonitor(engine)
+    try:
+        pid = run_with_reconnect(monitor, lambda c: c.execute(text("SELECT pg_backend_pid()")).scalar())
+        with database.admin_engine.connect() as admin:
+            admin.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": pid})
+        time.sleep(0.2)
+        new_pid = run_with_reconnect(monitor, lambda c: c.execute(text("SELECT pg_backend_pid()")).scalar())
+        assert new_pid != pid
+        stats = monitor.stats()
+        assert stats["reconnect_retries"] == 1
+        assert stats["invalidations"] >= 1
+        assert stats["connects"] == 2
+    finally:
+        engine.dispose()
+
+
+def test_stats_report_waiters_and_wait_time():
+    engine = create_ro_engine(database.RO_URL, 5000, pool_size=1, max_overflow=0)
+    monitor = PoolMonitor(engine)
+    held = threading.Event()
+    seen_waiting = []
+
+    def holder():
+        with monitor.connect():
+            held.set()
+            time.sleep(0.3)
+
+    def waiter():
+        with monitor.connect():
+            pass
+
+    try:
+        t = threading.Thread(target=holder)
+        t.start()
+        held.wait(5)
+        w = threading.Thread(target=waiter)
+        w.start()
+        time.sleep(0.1)
+        seen_waiting.append(monitor.stats()["waiting"])
+        t.join()
+        w.join()
+        stats = monitor.stats()
+        assert seen_waiting == [1]
+        assert stats["checkouts"] == 2
+        assert stats["wait_ms_max"] >= 100
+        assert stats["checked_out"] == 0
+    finally:
+        engine.dispose()
@@ -0,0 +1,63 @@
+"""
+Tests for the few-shot example store.
+"""
+import pytest
+
+from src.database import run_readonly
+from src.example_store import FEW_SHOT_K, FEW_SHOT_PATH, ExampleStore, get_example_store, load_examples
+from src.query_validator import sanitize_select
+
+
+@pytest.fixture
+def store():
+    return ExampleStore([
+        {"q": "Show all product names.", "sql": "SELECT product_name FROM products"},
+        {"q": "Show total orders by country.", "sql": "SELECT country, COUNT(*) FROM orders GROUP BY country"},
+        {"q": "Show the total number of orders for each country.", "sql": "select country,  count(*) from orders group by country"},
+        {"q": "Which shipper delivered the most orders?", "sql": "SELECT shipper_id FROM orders GROUP BY shipper_id"},
+        {"q": "List employees and their managers.", "sql": "SELECT employee_name FROM employees"},
+    ])
+
+
+def test_most_similar_first(store):
+    assert store.top_k("How many orders per country?", 1) == [1]
+    assert store.top_k("list the employees", 1) == [4]
+
+
+def test_near_duplicates_sent_once(store):
+    picked = store.top_k("total number of orders for each country", 3)
+    assert 2 in picked and 1 not in picked  # same SQL up to case/whitespace
+    assert len(picked) == 3
+
+
+def test_no_overlap_falls_back_to_corpus_order(store):
+    assert store.top_k("zzz qqq", 2) == [0, 1]
+    assert store.top_k("anything", 0) == []
+
+
+def test_render_is_prompt_ready(store):
+    block = store.render("product names", 1)
+    assert block == "Q: Show all product names.\nSQL: SELECT product_name FROM products"
+
+
+def test_version_tracks_content(store):
+    same = ExampleStore(store.examples)
+    other = ExampleStore(store.examples[:-1])
+    assert store.version == same.version != other.version
+
+
+def test_prompt_uses_retrieved_examples():
+    from src.text2sql_engine import GeminiGenerator
+    from tests.test_text2sql_engine import _FakeGenai
+
+    gen = GeminiGenerator("key", "models/primary", genai=_FakeGenai({}))
+    prompt = gen.prompt("Which shipper delivered the most orders?")
+    assert "Q: Which shipper delivered the most orders?\nSQL: SELECT s.company_name" in prompt
+    assert prompt.count("\nSQL: ") == FEW_SHOT_K
+
+
+def test_corpus_sql_is_valid():
+    examples = load_examples(FEW_SHOT_PATH)
+    assert len(get_example_store()) == len(examples)
+    for ex in examples:
+        run_readonly(sanitize_select(ex["sql"], row_limit=1), row_limit=1)
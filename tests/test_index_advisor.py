@@ -0,0 +1,131 @@
+"""
+Tests for the index advisor, on a 50x copy of orders/order_details in a scratch schema.
+"""
+import asyncio
+import json
+import threading
+
+import pytest
+from sqlalchemy import text
+
+import src.database as database
+from src import index_advisor
+
+SCALE = 50
+COLUMNS = {
+    "orders": ["order_id", "customer_id", "employee_id", "order_date", "shipper_id", "freight"],
+    "order_details": ["order_id", "product_id", "unit_price", "quantity", "discount"],
+}
+WORKLOAD = [
+    # (sql, calls)
+    ("SELECT order_id, customer_id FROM orders WHERE order_date >= '1998-03-01' AND order_date < '1998-03-08'", 40),
+    ("SELECT DATE_TRUNC('month', o.order_date) AS month, SUM(od.quantity) AS qty FROM orders o "
+     "JOIN order_details od ON od.order_id = o.order_id WHERE o.order_date BETWEEN '1997-01-01' AND '1997-01-31' "
+     "GROUP BY month", 10),
+    ("SELECT order_id, freight FROM orders WHERE customer_id = 'ALFKI' ORDER BY order_date DESC", 5),
+]
+
+
+@pytest.fixture(scope="module")
+def scaled():
+    with database.admin_engine.begin() as c:
+        c.execute(text("DROP SCHEMA IF EXISTS advisor_scaled CASCADE"))
+        c.execute(text("CREATE SCHEMA advisor_scaled"))
+        for t in ("orders", "order_details"):
+            c.execute(text(f"CREATE TABLE advisor_scaled.{t} (LIKE public.{t} INCLUDING ALL)"))
+        # copy k keeps the calendar (so date filters stay selective) and shifts the ids
+        c.execute(text(
+            "INSERT INTO advisor_scaled.orders SELECT o.order_id + k * 100000, o.customer_id, o.employee_id, "
+            "o.order_date, o.required_date, o.shipped_date, o.shipper_id, o.freight "
+            "FROM public.orders o CROSS JOIN generate_series(0, :n) k"
+        ), {"n": SCALE - 1})
+        c.execute(text(
+            "INSERT INTO advisor_scaled.order_details SELECT od.order_id + k * 100000, od.product_id, "
+            "od.unit_price, od.quantity, od.discount FROM public.order_details od CROSS JOIN generate_series(0, :n) k"
+        ), {"n": SCALE - 1})
+        c.execute(text("ANALYZE advisor_scaled.orders"))
+        c.execute(text("ANALYZE advisor_scaled.order_details"))
+    yield
+    with database.admin_engine.begin() as c:
+        c.execute(text("DROP SCHEMA advisor_scaled CASCADE"))
+
+
+def _entries():
+    return [index_advisor.WorkloadEntry(str(i), sql, calls, 1.0, None) for i, (sql, calls) in enumerate(WORKLOAD)]
+
+
+def test_candidates_by_role():
+    sql = ("SELECT o.customer_id, o.freight FROM orders o JOIN order_details od ON od.order_id = o.order_id "
+           "WHERE o.employee_id = 5 AND o.order_date > CURRENT_DATE - INTERVAL '1 year' AND LOWER(o.customer_id) = 'alfki'")
+    ddl = [c.ddl() for c in index_advisor.candidates(sql, COLUMNS)]
+    assert "CREATE INDEX idx_orders_employee_id_order_date ON orders (employee_id, order_date)" in ddl
+    assert ("CREATE INDEX idx_orders_employee_id_order_date_incl ON orders (employee_id, order_date) "
+            "INCLUDE (customer_id, freight, order_id)") in ddl
+    assert "CREATE INDEX idx_orders_lower_customer_id ON orders ((LOWER(customer_id)))" in ddl
+    assert "CREATE INDEX idx_order_details_order_id ON order_details (order_id)" in ddl
+    assert index_advisor.candidates("SELECT 1", COLUMNS) == []
+
+
+def test_advisor_recommends_order_date_index(scaled):
+    with database.admin_engine.connect() as c:
+        c.execute(text("SET search_path TO advisor_scaled"))
+        advice = index_advisor.advise(c, _entries())
+        # nothing was left behind
+        indexes = c.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = 'advisor_scaled'")).scalars().all()
+        c.rollback()
+    assert advice.method in ("hypopg", "rollback")
+    top = advice.recommendations[0]
+    assert top.candidate.table == "orders" and top.candidate.keys[0] == "order_date"
+    assert top.gain > 0 and top.size_bytes and "0" in top.helps
+    assert advice.final_cost < advice.baseline_cost
+    assert not any(name.startswith("idx_orders_order_date") for name in indexes)
+    # DATE_TRUNC on a date is not IMMUTABLE: such expression indexes are reported, not recommended
+    assert any("date_trunc" in name for name in advice.rejected)
+
+    script = index_advisor.render_ddl(advice)
+    assert f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {top.candidate.name} ON orders (order_date" in script
+    assert script.startswith("-- Index advisor")
+
+
+def test_existing_indexes_are_not_proposed(scaled):
+    entries = [index_advisor.WorkloadEntry("c", "SELECT * FROM orders WHERE customer_id = 'ALFKI'", 10, 1.0, None)]
+    with database.admin_engine.connect() as c:
+        c.execute(text("SET search_path TO advisor_scaled"))
+        advice = index_advisor.advise(c, entries)
+        c.rollback()
+    assert all(r.candidate.keys != ("customer_id",) for r in advice.recommendations)
+
+
+def test_run_readonly_records_workload(monkeypatch, tmp_path):
+    log = tmp_path / "workload.jsonl"
+    monkeypatch.setattr(index_advisor, "LOG_PATH", str(log))
+    index_advisor.clear_workload()
+    database.cache_clear()
+    database.run_readonly("SELECT order_id FROM orders WHERE freight > 500")
+    database.run_readonly("select order_id from orders where freight > 800")  # same shape
+    database.run_readonly("SELECT order_id FROM orders WHERE freight > :f", {"f": 100})  # bound: not recorded
+    shapes = index_advisor.workload()
+    assert len(shapes) == 1 and shapes[0].calls == 2 and "800" in shapes[0].sql
+
+    index_advisor.flush()
+    lines = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [e["calls"] for e in lines] == [2]
+    assert index_advisor.load_workload([str(log), str(log)])[0].calls == 4
+
+
+def test_async_run_flushes_off_the_event_loop(monkeypatch, tmp_path):
+    log = tmp_path / "workload.jsonl"
+    monkeypatch.setattr(index_advisor, "LOG_PATH", str(log))
+    monkeypatch.setattr(index_advisor, "FLUSH_SECONDS", 0)
+    index_advisor.clear_workload()
+    database.cache_clear()
+    flush, threads = index_advisor.flush, []
+    monkeypatch.setattr(index_advisor, "flush", lambda: threads.append(threading.current_thread()) or flush())
+
+    async def run():
+        await database.run_readonly_async("SELECT order_id FROM orders WHERE freight > 700")
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 1 and loop_thread not in threads
+    assert [json.loads(line)["calls"] for line in log.read_text().splitlines()] == [1]
@@ -0,0 +1,119 @@
+"""
+Tests for keyset pagination: pages concatenate to the full result, in order, without OFFSET.
+"""
+import datetime
+from decimal import Decimal
+
+import pytest
+
+import src.database as database
+from src import pagination
+
+PAGED = [
+    # (sql, the column its ORDER BY sorts on)
+    # nullable sort key with ties, broken by the primary key
+    ("SELECT o.order_id, o.customer_id, o.shipped_date FROM orders o ORDER BY o.shipped_date DESC NULLS LAST",
+     "shipped_date"),
+    # NULLS FIRST, mixed directions
+    ("SELECT order_id, shipped_date, customer_id FROM orders ORDER BY shipped_date NULLS FIRST, customer_id DESC",
+     "shipped_date"),
+    # grouped: ordered by an aggregate, keyed by the group
+    ("SELECT c.country, SUM(od.unit_price * od.quantity) AS revenue FROM customers c "
+     "JOIN orders o ON o.customer_id = c.customer_id JOIN order_details od ON od.order_id = o.order_id "
+     "GROUP BY c.country ORDER BY revenue DESC", "revenue"),
+    # grouped, ordered by group keys: predicate before grouping
+    ("SELECT o.customer_id, COUNT(*) AS n FROM orders o GROUP BY o.customer_id ORDER BY o.customer_id DESC", "customer_id"),
+    ("SELECT DATE_TRUNC('month', order_date) AS month, COUNT(*) AS n FROM orders GROUP BY 1 ORDER BY 1", "month"),
+    # join without ORDER BY: keyed by both primary keys
+    ("SELECT p.product_name, od.quantity FROM products p JOIN order_details od ON od.product_id = p.product_id "
+     "WHERE od.quantity > 50 OR p.product_id = 1", None),
+    # distinct rows, and the query's own LIMIT caps all pages together
+    ("SELECT DISTINCT country, city FROM customers ORDER BY country DESC", "country"),
+    ("SELECT * FROM order_details ORDER BY unit_price DESC, order_id, product_id LIMIT 23", "unit_price"),
+]
+
+
+def _all_pages(sql, size):
+    page = pagination.first_page(sql, size)
+    pages = [page]
+    while page.next_token:
+        page = pagination.next_page(page.next_token)
+        pages.append(page)
+    return pages
+
+
+@pytest.mark.parametrize("sql, column", PAGED)
+def test_pages_concatenate_to_full_result(sql, column):
+    full = database.run_readonly(sql, row_limit=10000)
+    pages = _all_pages(sql, 7)
+    rows = [r for p in pages for r in p.rows]
+    assert all(len(p.rows) == 7 for p in pages[:-1]) and not pages[-1].has_more
+    assert "OFFSET" not in pages[-1].sql.upper()
+    if column:
+        assert [r[column] for r in rows] == [r[column] for r in full]  # ties may come in another order
+    assert sorted(map(repr, rows)) == sorted(map(repr, full))
+
+
+def test_first_page_has_estimate_and_hides_keys():
+    page = pagination.first_page("SELECT order_id, freight FROM orders ORDER BY freight", 5)
+    assert 400 <= page.estimated_total_rows <= 2000
+    assert list(page.rows[0]) == ["order_id", "freight"]
+    assert page.has_more and page.next_token
+    capped = pagination.first_page("SELECT order_id FROM orders ORDER BY order_id LIMIT 8", 5)
+    assert capped.estimated_total_rows == 8
+
+
+def test_grouped_predicate_placement():
+    by_key = pagination.keyset("SELECT customer_id, COUNT(*) FROM orders GROUP BY customer_id ORDER BY customer_id")
+    assert by_key.clause == "where"
+    sql, _ = pagination.page_query(by_key, ["ALFKI"], 5)
+    assert "WHERE" in sql and "HAVING" not in sql
+    by_aggregate = pagination.keyset("SELECT customer_id, COUNT(*) AS n FROM orders GROUP BY customer_id ORDER BY n DESC")
+    assert by_aggregate.clause == "having"
+
+
+def test_row_limit_caps_all_pages():
+    sql = "SELECT order_id FROM orders ORDER BY order_id"
+    page = pagination.first_page(sql, 10, row_limit=25)
+    sizes = [len(page.rows)]
+    while page.next_token:
+        page = pagination.next_page(page.next_token)
+        sizes.append(len(page.rows))
+    assert sizes == [10, 10, 5] and not page.has_more
+    assert pagination.first_page(sql, 10, row_limit=25).estimated_total_rows == 25
+
+
+def test_row_value_comparison_for_not_null_keys():
+    ks = pagination.keyset("SELECT * FROM order_details")
+    sql, params = pagination.page_query(ks, [10248, 11], 5)
+    assert "(order_details.order_id, order_details.product_id) > (:_a0, :_a1)" in sql
+    assert params == {"_a0": 10248, "_a1": 11}
+
+
+def test_unpageable_queries():
+    assert pagination.keyset("SELECT COUNT(*) FROM orders") is None
+    assert pagination.keyset("SELECT order_id FROM orders ORDER BY order_id OFFSET 5") is None
+    assert pagination.keyset("SELECT order_id, RANK() OVER (ORDER BY freight) FROM orders") is None
+    assert pagination.keyset("SELECT x FROM (SELECT order_id AS x FROM orders) s") is None
+    with pytest.raises(ValueError):
+        pagination.keyset("DELETE FROM orders")
+
+
+def test_tokens_are_signed_and_expire(monkeypatch):
+    page = pagination.first_page("SELECT order_id FROM orders ORDER BY order_id", 3)
+    body, sig = page.next_token.split(".")
+    forged = pagination._b64(pagination._unb64(body).replace(b"orders", b"orderz")) + "." + sig
+    for bad in (forged, "garbage", page.next_token + "x"):
+        with pytest.raises(ValueError, match="Invalid continuation token"):
+            pagination.next_page(bad)
+    monkeypatch.setattr(pagination, "TOKEN_TTL", -1)
+    expired = pagination.first_page("SELECT order_id FROM orders ORDER BY order_id", 3).next_token
+    with pytest.raises(ValueError, match="expired"):
+        pagination.next_page(expired)
+
+
+def test_token_values_round_trip():
+    ks = pagination.keyset("SELECT order_id FROM orders ORDER BY order_id")
+    values = [Decimal("12.50"), datetime.date(1997, 1, 2), datetime.datetime(1997, 1, 2, 3, 4, tzinfo=datetime.timezone.utc), None, "x"]
+    token = pagination.encode_token(ks, values, 10, 100)
+    assert pagination.decode_token(token)["after"] == values
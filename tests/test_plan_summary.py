@@ -0,0 +1,66 @@
+# tests/test_plan_summary.py
+from src.plan_summary import label, summarize_plan
+
+ESTIMATE = {
+    "Plan": {
+        "Node Type": "Hash Join", "Join Type": "Inner", "Total Cost": 120.0, "Plan Rows": 830,
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "orders", "Alias": "o", "Total Cost": 20.0, "Plan Rows": 830},
+            {"Node Type": "Hash", "Total Cost": 60.0, "Plan Rows": 50000, "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "order_details", "Alias": "order_details",
+                 "Total Cost": 55.0, "Plan Rows": 50000, "Filter": "(quantity > 10)"},
+            ]},
+        ],
+    },
+}
+
+ANALYZED = {
+    "Plan": {
+        "Node Type": "Sort", "Total Cost": 900.0, "Plan Rows": 100, "Actual Total Time": 50.0, "Actual Rows": 20000,
+        "Actual Loops": 1, "Sort Method": "external merge", "Sort Space Type": "Disk", "Sort Space Used": 208,
+        "Plans": [
+            {"Node Type": "Aggregate", "Strategy": "Hashed", "Total Cost": 700.0, "Plan Rows": 100,
+             "Actual Total Time": 30.0, "Actual Rows": 20000, "Actual Loops": 1, "HashAgg Batches": 5, "Disk Usage": 208,
+             "Plans": [
+                 {"Node Type": "Seq Scan", "Relation Name": "order_details", "Alias": "d", "Total Cost": 40.0,
+                  "Plan Rows": 2155, "Actual Total Time": 2.0, "Actual Rows": 2155, "Actual Loops": 1},
+             ]},
+        ],
+    },
+    "Execution Time": 51.0,
+}
+
+
+def test_label():
+    node = {"Node Type": "Index Scan", "Index Name": "orders_pkey", "Relation Name": "orders", "Alias": "o"}
+    assert label(node) == "Index Scan using orders_pkey on orders o"
+    assert label({"Node Type": "Hash Join", "Join Type": "Left"}) == "Hash Join (Left)"
+    assert label({"Node Type": "Aggregate", "Strategy": "Hashed"}) == "HashAggregate"
+
+
+def test_estimate_hotspots_by_self_cost():
+    s = summarize_plan(ESTIMATE)
+    assert s["analyzed"] is False and s["total_cost"] == 120.0
+    # join itself: 120 - 20 - 60 = 40; the scan under the hash: 55
+    assert [h["node"] for h in s["hotspots"][:2]] == ["Seq Scan on order_details", "Hash Join"]
+    assert s["hotspots"][0]["share"] == round(55 / 120, 3)
+    assert s["misestimates"] == [] and s["spills"] == []
+
+
+def test_seq_scans_sized_by_table_rows():
+    s = summarize_plan(ESTIMATE, table_rows={"orders": 830, "order_details": 2155})
+    assert s["seq_scans"] == []
+    s = summarize_plan(ESTIMATE, table_rows={"orders": 50_000})
+    assert [x["table"] for x in s["seq_scans"]] == ["orders", "order_details"]
+    assert s["seq_scans"][1]["filter"] == "(quantity > 10)"
+
+
+def test_analyzed_flags_misestimates_and_spills():
+    s = summarize_plan(ANALYZED)
+    assert s["analyzed"] is True
+    assert s["hotspots"][0] == {"node": "HashAggregate", "self_cost": 660.0, "self_time_ms": 28.0, "share": 0.56}
+    assert {m["node"] for m in s["misestimates"]} == {"Sort", "HashAggregate"}
+    assert all(m["direction"] == "under" and m["factor"] == 200.0 for m in s["misestimates"])
+    kinds = {x["kind"]: x for x in s["spills"]}
+    assert kinds["sort"]["disk_kb"] == 208 and kinds["sort"]["method"] == "external merge"
+    assert kinds["hash_aggregate"]["batches"] == 5
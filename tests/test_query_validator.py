@@ -33,3 +33,45 @@ def test_block_multi_statements():
 def test_empty_sql():
     with pytest.raises(ValueError):
         sanitize_select("")
+
+def test_existing_limit_is_lowered_not_wrapped():
+    out = sanitize_select("select * from customers limit 5000", row_limit=10)
+    assert out.lower().endswith("limit 10")
+    assert out.upper().count("LIMIT") == 1 and "_t" not in out
+
+def test_fetch_first_is_capped():
+    out = sanitize_select("select * from customers order by 1 fetch first 500 rows only", row_limit=20)
+    assert "FETCH FIRST 20 ROWS ONLY" in out.upper() and "LIMIT" not in out.upper()
+
+def test_block_data_modifying_cte_and_select_into():
+    with pytest.raises(ValueError):
+        sanitize_select("with x as (delete from orders returning *) select * from x")
+    with pytest.raises(ValueError):
+        sanitize_select("select * into copy from customers")
+
+def test_block_unqualified_catalog_view():
+    with pytest.raises(ValueError):
+        sanitize_select("SELECT * FROM pg_roles")
+
+def test_analysis_lists_tables_and_is_reused():
+    from src.query_validator import analyze_select
+
+    a = analyze_select("WITH r AS (SELECT * FROM orders) SELECT * FROM r JOIN customers c USING (customer_id)", 50)
+    assert a.tables == frozenset({"orders", "customers"})
+    assert a.limit == 50
+    # running the sanitized statement again is a lookup, not a re-parse or another LIMIT
+    assert analyze_select(a.sql, 50) is a
+
+@pytest.mark.parametrize("sql, tables", [
+    ("SELECT * FROM orders o JOIN customers AS c ON c.customer_id = o.customer_id", {"orders", "customers"}),
+    ("select category_name from categories, products p where p.product_id = 1", {"categories", "products"}),
+    ("SELECT EXTRACT(YEAR FROM order_date) FROM public.orders", {"orders"}),
+    ("SELECT * FROM (SELECT * FROM employees) AS _t LIMIT 5", {"employees"}),
+    ("SELECT order_id FROM orders UNION SELECT shipper_id FROM shippers", {"orders", "shippers"}),
+    ("SELECT 'from x' FROM products -- join y\nWHERE product_id IS DISTINCT FROM 1", {"products"}),
+    ("SELECT g FROM generate_series(1, 3) g", set()),
+])
+def test_analysis_tables(sql, tables):
+    from src.query_validator import analyze_select
+
+    assert analyze_select(sql).tables == tables
@@ -0,0 +1,71 @@
+"""
+Tests for the normalized question -> SQL cache.
+"""
+import pytest
+
+import src.question_cache as qc
+from src.example_store import get_example_store
+from src.text2sql_engine import generate_sql, default_schema_hint
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(qc, "_TTL", 60)
+    monkeypatch.setattr(qc, "_MAX", 4)
+    monkeypatch.setattr(qc, "_PATH", "")
+    qc.cache_clear()
+    yield
+    qc.cache_clear()
+
+
+def test_normalize_question():
+    assert qc.normalize_question("  List ALL customers,   please! ") == "list all customers please"
+    assert qc.normalize_question("Top 5 products?") != qc.normalize_question("Top 3 products?")
+    # operators, signs and decimal points change the SQL
+    assert qc.normalize_question("Products with price > 20") != qc.normalize_question("Products with price < 20")
+    assert qc.normalize_question("price>20") == qc.normalize_question("price > 20")
+    assert qc.normalize_question("balance below -5") != qc.normalize_question("balance below 5")
+    assert qc.normalize_question("discount over 0.5") != qc.normalize_question("discount over 05")
+
+
+def test_key_depends_on_schema_and_model():
+    k1 = qc.make_key("Show products", "tables: a", "model-a")
+    assert k1 == qc.make_key("show   products?", "tables: a", "model-a")
+    assert k1 != qc.make_key("Show products", "tables: b", "model-a")
+    assert k1 != qc.make_key("Show products", "tables: a", "model-b")
+    assert k1 != qc.make_key("Show products", "tables: a", "model-a", "examples-v2")
+
+
+def test_lru_eviction():
+    for i in range(5):
+        qc.cache_put(f"k{i}", f"SELECT {i}")
+    assert qc.cache_get("k0") is None
+    assert qc.cache_get("k4") == "SELECT 4"
+
+
+def test_ttl_expiry(monkeypatch):
+    qc.cache_put("k", "SELECT 1")
+    now = qc.time.time()
+    monkeypatch.setattr(qc.time, "time", lambda: now + 61)
+    assert qc.cache_get("k") is None
+
+
+def test_persistent_store_survives_restart(monkeypatch, tmp_path):
+    monkeypatch.setattr(qc, "_PATH", str(tmp_path / "sql_cache.sqlite3"))
+    qc.cache_put("k", "SELECT 42")
+    qc.cache_clear()  # simulate a restart: memory gone, disk kept
+    assert qc.cache_get("k") == "SELECT 42"
+    qc.cache_clear(persistent=True)
+    assert qc.cache_get("k") is None
+
+
+def test_generate_sql_served_from_cache(monkeypatch):
+    monkeypatch.setenv("USE_GEMINI_STUB", "0")
+    monkeypatch.setenv("GEMINI_API_KEY", "fake_test_api_key_for_testing")
+    monkeypatch.setenv("GEMINI_MODEL", "models/test-model")
+    question = "How many customers are there?"
+    key = qc.make_key(question, default_schema_hint(question), "models/test-model", get_example_store().version)
+    qc.cache_put(key, "SELECT COUNT(*) FROM customers")
+
+    # normalized variant hits the same entry without calling Gemini
+    assert generate_sql("how many customers are there") == "SELECT COUNT(*) FROM customers"
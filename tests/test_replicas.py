@@ -0,0 +1,125 @@
+"""
+Tests for read-replica routing. "Replicas" are separate pools on the local
+database, plus a DSN on a closed port standing in for a dead node.
+"""
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import ProgrammingError
+
+import src.database as database
+import src.replicas as replicas_mod
+from src.replicas import ReplicaSet
+
+DEAD = make_url(database.RO_URL).set(port=1).render_as_string(hide_password=False)
+
+
+def _select(value):
+    return lambda c: c.execute(text("SELECT :v"), {"v": value}).scalar()
+
+
+@pytest.fixture
+def make_set():
+    made = []
+
+    def make(urls, **kw):
+        kw.setdefault("check_seconds", 0)
+        rs = ReplicaSet(urls, 5000, pool_size=2, max_overflow=0, **kw)
+        made.append(rs)
+        return rs
+
+    yield make
+    for rs in made:
+        for r in rs.replicas:
+            r.engine.dispose()
+
+
+def test_load_spreads_across_replicas(make_set):
+    rs = make_set([database.RO_URL, database.RO_URL])
+    barrier = threading.Barrier(4)
+
+    def worker():
+        barrier.wait()
+        for _ in range(3):
+            rs.run(lambda c: c.execute(text("SELECT pg_sleep(0.05)")).all())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    counts = [r.queries for r in rs.replicas]
+    assert sum(counts) == 12 and min(counts) > 0
+    assert all(r.inflight == 0 for r in rs.replicas)
+
+
+def test_pick_prefers_less_loaded(make_set):
+    rs = make_set([database.RO_URL, database.RO_URL])
+    busy, idle = rs.replicas
+    busy.inflight = 3
+    assert rs.pick() is idle
+    idle.inflight -= 1
+    busy.latency_ms, idle.latency_ms = 1.0, 50.0
+    busy.inflight = 0
+    assert rs.pick() is busy
+
+
+def test_health_check_ejects_dead_replica(make_set):
+    rs = make_set([DEAD, database.RO_URL], check_seconds=60)
+    assert rs.run(_select(7)) == 7
+    dead, good = rs.replicas
+    assert not dead.healthy and dead.ejections == 1
+    assert good.healthy and good.queries == 1 and dead.queries == 0
+
+
+def test_connection_failure_retries_on_other_replica(make_set):
+    rs = make_set([DEAD, database.RO_URL])
+    dead, good = rs.replicas
+    good.latency_ms = 1000.0  # make the dead one look best
+    assert rs.run(_select(1)) == 1
+    assert rs.retries == 1
+    assert not dead.healthy and dead.failures == 1
+    assert good.queries == 1
+
+
+def test_sql_errors_are_not_retried(make_set):
+    rs = make_set([database.RO_URL, database.RO_URL])
+    with pytest.raises(ProgrammingError):
+        rs.run(lambda c: c.execute(text("SELECT * FROM no_such_table")).all())
+    assert rs.retries == 0
+    assert all(r.healthy for r in rs.replicas)
+
+
+def test_lagging_replicas_are_ejected_and_rejoin(make_set, monkeypatch):
+    rs = make_set([database.RO_URL, database.RO_URL], max_lag_seconds=30)
+    monkeypatch.setattr(replicas_mod, "_LAG_SQL", "SELECT 120")
+    rs.check()
+    assert [r.healthy for r in rs.replicas] == [False, False]
+    assert rs.replicas[0].lag_seconds == 120
+    # nothing healthy: still answer from some replica
+    assert rs.run(_select(3)) == 3
+    monkeypatch.setattr(replicas_mod, "_LAG_SQL", "SELECT 0")
+    rs.check()
+    assert [r.healthy for r in rs.replicas] == [True, True]
+
+
+def test_async_retry_on_other_replica(make_set):
+    rs = make_set([DEAD, database.RO_URL])
+    dead, good = rs.replicas
+    good.latency_ms = 1000.0
+
+    async def main():
+        async def work(c):
+            return (await c.execute(text("SELECT 5"))).scalar()
+        try:
+            return await rs.run_async(work)
+        finally:
+            for r in rs.replicas:
+                for m in list(r._async.values()):
+                    await m.engine.dispose()
+
+    assert asyncio.run(main()) == 5
+    assert rs.retries == 1 and not dead.healthy
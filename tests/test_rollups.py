@@ -0,0 +1,126 @@
+"""
+Tests for sales rollups: rewritten queries must return exactly what the base tables return.
+"""
+import pytest
+from sqlalchemy import text
+
+import src.database as database
+from src import rollups
+from src.query_validator import analyze_select
+
+REWRITTEN = [
+    # stub templates
+    "SELECT o.customer_id, SUM(od.unit_price * od.quantity) AS total_sales FROM orders o JOIN order_details od "
+    "ON o.order_id = od.order_id GROUP BY o.customer_id ORDER BY total_sales DESC LIMIT 5",
+    "SELECT DATE_TRUNC('month', o.order_date) AS month, SUM(od.unit_price * od.quantity) AS sales FROM orders o "
+    "JOIN order_details od ON o.order_id = od.order_id GROUP BY month ORDER BY month",
+    "SELECT c.customer_id, c.company_name, AVG(od.unit_price * od.quantity) AS avg_order_value FROM customers c "
+    "JOIN orders o ON c.customer_id = o.customer_id JOIN order_details od ON o.order_id = od.order_id "
+    "GROUP BY c.customer_id, c.company_name",
+    "SELECT cat.category_name, SUM(od.unit_price * od.quantity * (1 - od.discount)) AS revenue FROM categories cat "
+    "JOIN products p ON p.category_id = cat.category_id JOIN order_details od ON od.product_id = p.product_id "
+    "GROUP BY cat.category_name ORDER BY revenue DESC",
+    "SELECT p.product_name, SUM(od.quantity) AS total_quantity FROM products p JOIN order_details od "
+    "ON od.product_id = p.product_id GROUP BY p.product_name ORDER BY total_quantity DESC LIMIT 10",
+    # country grain through customer_month + customers
+    "SELECT c.country, SUM(od.quantity * od.unit_price) AS sales, COUNT(DISTINCT o.order_id) AS orders "
+    "FROM orders o JOIN order_details od ON od.order_id = o.order_id JOIN customers c ON c.customer_id = o.customer_id "
+    "WHERE c.country <> 'USA' GROUP BY c.country HAVING COUNT(*) > 10 ORDER BY sales DESC",
+    # whole-table aggregates, month-aligned filter, empty input
+    "SELECT COUNT(*), AVG(od.quantity), SUM(od.quantity) FROM orders o JOIN order_details od ON o.order_id = od.order_id "
+    "WHERE DATE_TRUNC('month', o.order_date) >= '1997-01-01'",
+    "SELECT COUNT(*) AS n, SUM(od.unit_price * od.quantity) AS s FROM orders o JOIN order_details od "
+    "ON o.order_id = od.order_id WHERE false",
+]
+
+NOT_REWRITTEN = [
+    # day-level date filter
+    "SELECT SUM(od.quantity) FROM orders o JOIN order_details od ON o.order_id = od.order_id WHERE o.order_date >= '1997-01-15'",
+    # customer and product grain together
+    "SELECT c.country, p.product_name, SUM(od.quantity) FROM customers c JOIN orders o ON c.customer_id = o.customer_id "
+    "JOIN order_details od ON o.order_id = od.order_id JOIN products p ON od.product_id = p.product_id GROUP BY 1, 2",
+    # distinct orders are not additive across products
+    "SELECT p.category_id, COUNT(DISTINCT o.order_id) FROM orders o JOIN order_details od ON o.order_id = od.order_id "
+    "JOIN products p ON p.product_id = od.product_id GROUP BY p.category_id",
+    # outer join, row listing, unknown measure
+    "SELECT c.country, COUNT(o.order_id) FROM customers c LEFT JOIN orders o ON c.customer_id = o.customer_id GROUP BY c.country",
+    "SELECT o.customer_id, od.quantity FROM orders o JOIN order_details od ON o.order_id = od.order_id",
+    "SELECT MAX(od.unit_price) FROM orders o JOIN order_details od ON o.order_id = od.order_id",
+    # an unqualified name means the input column outside a bare GROUP BY / ORDER BY item, even if an alias shares it
+    "SELECT o.customer_id, SUM(od.quantity) AS quantity FROM orders o JOIN order_details od ON o.order_id = od.order_id "
+    "WHERE quantity > 20 GROUP BY o.customer_id ORDER BY quantity DESC LIMIT 3",
+    "SELECT o.customer_id, SUM(od.quantity) AS quantity FROM orders o JOIN order_details od ON o.order_id = od.order_id "
+    "GROUP BY o.customer_id HAVING MAX(quantity) > 100",
+    "SELECT o.customer_id, SUM(od.quantity) AS quantity FROM orders o JOIN order_details od ON o.order_id = od.order_id "
+    "GROUP BY o.customer_id ORDER BY quantity + 0",
+]
+
+
+def _rows(conn, sql):
+    return sorted(tuple(repr(v) for v in row) for row in conn.execute(text(sql)).all())
+
+
+@pytest.fixture(scope="module")
+def installed():
+    with database.admin_engine.begin() as c:
+        rollups.install(c)
+        rollups.refresh(c, full=True)
+    yield
+    with database.admin_engine.begin() as c:
+        rollups.drop(c)
+
+
+@pytest.mark.parametrize("sql", REWRITTEN)
+def test_rewrite_matches_base_tables(installed, sql):
+    a = analyze_select(sql, 1000)
+    rewritten = rollups.rewrite(a.sql, a.tree)
+    assert rewritten is not None and "rollups." in rewritten
+    with database.admin_engine.connect() as c:
+        assert _rows(c, rewritten) == _rows(c, a.sql)
+        # months are rebuilt as timestamptz in the session's time zone, like DATE_TRUNC
+        c.execute(text("SET TIME ZONE 'America/Los_Angeles'"))
+        assert _rows(c, rewritten) == _rows(c, a.sql)
+
+
+@pytest.mark.parametrize("sql", NOT_REWRITTEN)
+def test_rewrite_leaves_other_queries_alone(sql):
+    a = analyze_select(sql, 1000)
+    assert rollups.rewrite(a.sql, a.tree) is None
+
+
+def test_new_orders_refresh_incrementally(installed, monkeypatch):
+    monkeypatch.setattr(rollups, "CHECK_SECONDS", 0)
+    sql = REWRITTEN[1]
+    with database.admin_engine.begin() as c:
+        order_id = c.execute(text("SELECT max(order_id) + 1000 FROM orders")).scalar()
+        c.execute(text(
+            "INSERT INTO orders (order_id, customer_id, order_date, freight) VALUES (:id, 'ALFKI', DATE '1998-05-20', 1)"
+        ), {"id": order_id})
+        c.execute(text(
+            "INSERT INTO order_details (order_id, product_id, unit_price, quantity, discount) "
+            "VALUES (:id, 11, 21.00, 3, 0.05), (:id, 42, 14.00, 10, 0)"
+        ), {"id": order_id})
+    try:
+        # behind the new order: queries run on the base tables
+        assert rollups.fresh(database.replicas.run) is False
+        database.cache_clear()
+        base = database.run_readonly(sql)
+        with database.admin_engine.begin() as c:
+            assert rollups.refresh(c)["mode"] == "incremental"
+        assert rollups.fresh(database.replicas.run) is True
+        database.cache_clear()
+        before = rollups.rollup_stats()["rewrites"]
+        assert database.run_readonly(sql) == base
+        assert rollups.rollup_stats()["rewrites"] == before + 1
+        # a rollup answer is cached without table dependencies: short TTL, since it changes on refresh
+        assert [deps for _, _, _, deps in database._cache.values()] == [None]
+    finally:
+        with database.admin_engine.begin() as c:
+            c.execute(text("DELETE FROM orders WHERE order_id = :id"), {"id": order_id})
+    # deleting an order marks the rollups dirty; the next refresh rebuilds
+    assert rollups.fresh(database.replicas.run) is False
+    with database.admin_engine.begin() as c:
+        assert rollups.refresh(c)["mode"] == "full"
+    a = analyze_select(sql, 1000)
+    with database.admin_engine.connect() as c:
+        assert _rows(c, rollups.rewrite(a.sql, a.tree)) == _rows(c, a.sql)
@@ -0,0 +1,85 @@
+"""
+Tests for the schema catalog introspected from Postgres.
+"""
+import pytest
+
+import src.schema_catalog as sc
+from src.database import ro_engine
+
+
+@pytest.fixture
+def isolated_catalog(monkeypatch, tmp_path):
+    """Fresh process-level catalog state backed by a temp disk cache."""
+    monkeypatch.setattr(sc, "CATALOG_PATH", str(tmp_path / "catalog.json"))
+    monkeypatch.setattr(sc, "_catalog", None)
+    monkeypatch.setattr(sc, "_checked_at", 0.0)
+    yield sc
+
+
+def test_introspect_matches_schema_sql():
+    with ro_engine.connect() as c:
+        cat = sc.introspect(c)
+
+    employees = cat.tables["employees"]
+    assert "employee_name" in employees.column_names()
+    assert "first_name" not in employees.column_names()
+    assert employees.primary_key == ["employee_id"]
+
+    assert cat.tables["order_details"].primary_key == ["order_id", "product_id"]
+    fks = {(tuple(fk.columns), fk.ref_table) for fk in cat.tables["orders"].foreign_keys}
+    assert (("customer_id",), "customers") in fks
+    assert cat.tables["customers"].row_estimate >= 0
+    assert cat.version
+
+
+def test_hint_lists_tables_and_foreign_keys():
+    with ro_engine.connect() as c:
+        cat = sc.introspect(c)
+    hint = cat.to_hint()
+    assert "employees(employee_id, employee_name" in hint
+    assert "customer_id -> customers.customer_id" in hint
+    subset = cat.to_hint(["shippers"])
+    assert "shippers(" in subset and "orders(" not in subset
+
+
+def test_disk_roundtrip(tmp_path):
+    with ro_engine.connect() as c:
+        cat = sc.introspect(c)
+    path = str(tmp_path / "catalog.json")
+    sc.save_catalog(cat, path)
+    assert sc.load_catalog(path) == cat
+    assert sc.load_catalog(str(tmp_path / "missing.json")) is None
+
+
+def test_refresh_only_reintrospects_on_version_change(isolated_catalog, monkeypatch):
+    calls = []
+    real = sc.introspect
+    monkeypatch.setattr(sc, "introspect", lambda c: calls.append(1) or real(c))
+
+    first = sc.refresh_catalog()
+    assert len(calls) == 1
+    assert sc.refresh_catalog() is first  # version unchanged: no re-read
+    assert len(calls) == 1
+
+    monkeypatch.setattr(sc, "fetch_version", lambda c: "changed")
+    sc.refresh_catalog()
+    assert len(calls) == 2
+
+
+def test_get_catalog_served_from_memory_and_disk(isolated_catalog, monkeypatch):
+    cat = sc.get_catalog()  # cold start: introspects and persists
+    assert sc.load_catalog(sc.CATALOG_PATH) == cat
+
+    monkeypatch.setattr(sc, "_checked_at", sc.time.time())
+    monkeypatch.setattr(sc, "_engine", lambda: pytest.fail("no database access expected"))
+    assert sc.get_catalog() is cat
+
+    # a new process starts from the disk copy
+    monkeypatch.setattr(sc, "_catalog", None)
+    assert sc.get_catalog() == cat
+
+
+def test_engine_hint_comes_from_catalog():
+    from src.text2sql_engine import default_schema_hint
+
+    assert "employee_name" in default_schema_hint()
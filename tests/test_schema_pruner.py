@@ -0,0 +1,60 @@
+"""
+Tests for question-relevant schema pruning.
+"""
+from src.schema_catalog import Catalog, Column, ForeignKey, Table
+import src.schema_pruner as sp
+
+
+def _catalog() -> Catalog:
+    def table(name, cols, fks=()):
+        return Table(name=name, columns=[Column(c, "text") for c in cols],
+                     foreign_keys=[ForeignKey([c], ref, [rc]) for c, ref, rc in fks])
+
+    tables = [
+        table("customers", ["customer_id", "company_name", "country"]),
+        table("orders", ["order_id", "customer_id", "order_date"], [("customer_id", "customers", "customer_id")]),
+        table("order_details", ["order_id", "product_id", "unit_price", "quantity"],
+              [("order_id", "orders", "order_id"), ("product_id", "products", "product_id")]),
+        table("products", ["product_id", "product_name", "category_id"], [("category_id", "categories", "category_id")]),
+        table("categories", ["category_id", "category_name"]),
+        table("shippers", ["shipper_id", "phone"]),
+    ]
+    return Catalog(version="test-v1", tables={t.name: t for t in tables})
+
+
+def test_fk_path_keeps_join_tables():
+    """customers and order_details only connect through orders."""
+    tables = sp.select_tables(_catalog(), "top 5 customers by total sales amount")
+    assert tables == ["customers", "orders", "order_details"]
+
+
+def test_single_table_question():
+    assert sp.select_tables(_catalog(), "List all customers from Germany") == ["customers"]
+    assert sp.select_tables(_catalog(), "Show the order date of every order") == ["orders"]
+
+
+def test_column_phrase_matches():
+    assert "categories" in sp.select_tables(_catalog(), "products per category name")
+
+
+def test_no_match_or_disabled_keeps_everything():
+    cat = _catalog()
+    assert sp.select_tables(cat, "hello world") == cat.table_names()
+    assert sp.select_tables(cat, "list customers", top_k=0) == cat.table_names()
+
+
+def test_pruned_hint_reports_reduction(monkeypatch):
+    monkeypatch.setattr(sp, "PRUNING_STATS", {"requests": 0, "pruned": 0, "chars_full": 0, "chars_sent": 0})
+    cat = _catalog()
+    hint = sp.pruned_hint(cat, "List all customers from Germany")
+    assert "customers(" in hint and "orders(" not in hint
+    assert sp.PRUNING_STATS["requests"] == 1 and sp.PRUNING_STATS["pruned"] == 1
+    assert sp.PRUNING_STATS["chars_sent"] < sp.PRUNING_STATS["chars_full"]
+
+
+def test_engine_prunes_live_catalog():
+    from src.text2sql_engine import default_schema_hint
+
+    hint = default_schema_hint("Which employee has the job title 'Sales Representative'?")
+    assert "employees(" in hint
+    assert "order_details(" not in hint
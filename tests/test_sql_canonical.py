@@ -0,0 +1,64 @@
+"""
+Tests for SQL canonicalization (cache keys and prepared statement shapes).
+"""
+from decimal import Decimal
+
+import sqlglot
+
+from src.query_validator import analyze_select
+from src.sql_canonical import canonicalize, canonicalize_sql
+
+
+def _canon(sql):
+    return canonicalize(sqlglot.parse_one(sql, read="postgres"))
+
+
+def test_whitespace_case_and_aliases_share_a_shape():
+    a = _canon("SELECT  c.company_name FROM Customers c WHERE c.country = 'Germany' LIMIT 10")
+    b = _canon("select x.company_name\nfrom customers AS x -- note\nwhere x.country='France' limit 5;")
+    assert a.sql == b.sql == "SELECT t1.company_name FROM customers AS t1 WHERE t1.country = $1 LIMIT CAST($2 AS INT)"
+    assert a.fingerprint == b.fingerprint
+    assert a.values == ("Germany", 10) and b.values == ("France", 5)
+
+
+def test_literal_contexts():
+    c = _canon(
+        "SELECT o.order_id FROM orders o WHERE o.order_date BETWEEN '1997-01-01' AND '1997-12-31' "
+        "AND o.freight > 1.5 AND o.shipper_id IN (1, 2) ORDER BY 1"
+    )
+    assert c.values == ("1997-01-01", "1997-12-31", Decimal("1.5"), 1, 2)
+    assert "IN (CAST($4 AS INT), CAST($5 AS INT)) ORDER BY 1" in c.sql
+    assert c.bind_params() == {"_p1": "1997-01-01", "_p2": "1997-12-31", "_p3": Decimal("1.5"), "_p4": 1, "_p5": 2}
+    assert ":_p3" in c.bind_sql
+
+
+def test_literals_that_stay_inline():
+    c = _canon(
+        "SELECT 1, 'x' FROM orders WHERE order_date > DATE '1997-01-01' - INTERVAL '1 day' "
+        "AND freight >= 5 + 1 AND x = -5 AND y = '1'::int GROUP BY 2"
+    )
+    assert c.values == ()
+    assert "CAST('1997-01-01' AS DATE) - INTERVAL '1 DAY'" in c.sql
+
+
+def test_aliases_used_bare_are_kept():
+    c = _canon("SELECT row_to_json(o) FROM orders o WHERE o.order_id = 1")
+    assert "FROM orders AS o WHERE o.order_id" in c.sql
+
+
+def test_statements_with_binds_are_not_lifted():
+    c = _canon("SELECT * FROM customers WHERE country = :Country LIMIT 5")
+    assert c.values == () and not c.preparable
+    assert ":Country" in c.sql
+
+
+def test_analysis_carries_the_shape_of_its_tree():
+    """The cache key / prepared shape comes from the validator's parse, not a second lexer."""
+    analysis = analyze_select("SELECT c.city FROM customers c WHERE c.country = 'Germany'", 10)
+    assert analysis.canonical == canonicalize(analysis.tree)
+    assert analysis.canonical.values == ("Germany", 10)
+
+
+def test_unparseable_sql_is_left_alone():
+    c = canonicalize_sql("SELECT 'unterminated")
+    assert c.sql == "SELECT 'unterminated" and c.values == () and not c.preparable
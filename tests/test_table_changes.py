@@ -0,0 +1,100 @@
+"""
+Tests for table-dependency cache invalidation.
+"""
+import os
+import time
+
+import pytest
+from sqlalchemy import text
+
+import src.database as database
+import src.table_changes as tc
+
+PROBE = f"cache_probe_{os.getpid()}"
+
+
+def test_snapshot_tracks_counters_and_notifications(monkeypatch):
+    monkeypatch.setattr(tc, "_counters", {"orders": 5, "customers": 1})
+    monkeypatch.setattr(tc, "_notified", {})
+    assert tc.covers(frozenset({"orders"})) and not tc.covers(frozenset({"orders", "nope"}))
+    snap = tc.snapshot(frozenset({"orders", "customers"}))
+    assert tc.is_current(snap)
+    tc._counters["customers"] = 2
+    assert not tc.is_current(snap)
+    snap = tc.snapshot(frozenset({"orders"}))
+    tc.notify("orders")
+    assert not tc.is_current(snap)
+
+
+def test_standby_counters_do_not_cover(monkeypatch):
+    monkeypatch.setattr(tc, "_RECOVERY_SQL", "SELECT true")
+    monkeypatch.setattr(tc, "_standby", False)
+    tc.poll()
+    assert tc._counters and not tc.covers(frozenset({"orders"}))
+    monkeypatch.setattr(tc, "_RECOVERY_SQL", "SELECT false")
+    tc.poll()
+    assert tc.covers(frozenset({"orders"}))
+
+
+@pytest.fixture
+def probe_table():
+    with database.admin_engine.begin() as c:
+        c.execute(text(f'CREATE TABLE "{PROBE}" (id int)'))
+        c.execute(text(f'GRANT SELECT ON "{PROBE}" TO readonly'))
+    database.cache_clear()
+    yield PROBE
+    tc.stop_listener()
+    with database.admin_engine.begin() as c:
+        c.execute(text(f'DROP TABLE IF EXISTS "{PROBE}"'))
+    database.cache_clear()
+
+
+def _insert(table):
+    with database.admin_engine.begin() as c:
+        c.execute(text(f'INSERT INTO "{table}" VALUES (1)'))
+        c.execute(text("SELECT pg_stat_force_next_flush()"))
+
+
+def test_polled_counters_invalidate_cached_results(probe_table):
+    sql = f'SELECT count(*) AS n FROM "{probe_table}"'
+    tc.poll()
+    assert database.run_readonly(sql) == [{"n": 0}]
+    entry = next(v for k, v in database._cache.items() if probe_table in k[0])
+    assert entry[3] is not None  # tagged with table versions -> long TTL
+
+    _insert(probe_table)
+    assert database.run_readonly(sql) == [{"n": 0}]  # change not observed yet
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        tc.poll()
+        if database.run_readonly(sql) == [{"n": 1}]:
+            break
+        time.sleep(0.2)
+    assert database.run_readonly(sql) == [{"n": 1}]
+    assert database.cache_stats()["invalidations"] >= 1
+
+
+def test_notify_listener_invalidates(probe_table):
+    from scripts.install_change_triggers import install
+
+    with database.admin_engine.begin() as c:
+        install(c, [probe_table])
+    tc.start_listener()
+    time.sleep(0.3)  # let LISTEN register
+
+    # only the table with the trigger is covered by the listener, with polling off too
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr(tc, "POLL_SECONDS", 0)
+        assert tc.covers(frozenset({probe_table}))
+        assert not tc.covers(frozenset({"orders"})) and not tc.covers(frozenset({probe_table, "orders"}))
+
+    sql = f'SELECT count(*) AS n FROM "{probe_table}"'
+    assert database.run_readonly(sql) == [{"n": 0}]
+    with database.admin_engine.begin() as c:
+        c.execute(text(f'INSERT INTO "{probe_table}" VALUES (1)'))
+
+    deadline = time.time() + 5
+    while tc._notified.get(probe_table, 0) == 0 and time.time() < deadline:
+        time.sleep(0.05)
+    assert database.run_readonly(sql) == [{"n": 1}]
@@ -0,0 +1,52 @@
+"""
+Tests for the compiled stub template matcher.
+"""
+import pytest
+
+from src.template_matcher import TemplateMatcher
+from src.text2sql_engine import _stub_generate
+
+
+def test_substrings_found_with_overlaps():
+    m = TemplateMatcher([
+        {"match": [["he"]], "sql": "a"},
+        {"match": [["she", "hers"]], "sql": "b"},
+        {"match": [["ushers"]], "sql": "c"},
+    ])
+    assert m._scan("ushers") == {0, 1, 2, 3}
+    assert m.match("USHERS") == "a"  # every template matches; first one wins
+
+
+def test_first_match_priority():
+    m = TemplateMatcher([
+        {"match": [["customers", "list"]], "sql": "first"},
+        {"match": [["customers"]], "sql": "second"},
+    ])
+    assert m.match("list customers") == "first"
+    assert m.match("show customers") == "second"
+    assert m.match("show products") is None
+
+
+def test_clause_requires_all_parts():
+    m = TemplateMatcher([{"match": [["orders", "date"], ["order dates for all orders"]], "sql": "x"}])
+    assert m.match("orders") is None
+    assert m.match("what date were orders placed") == "x"
+
+
+def test_empty_clause_rejected():
+    with pytest.raises(ValueError):
+        TemplateMatcher([{"match": [[]], "sql": "x"}])
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("List customers by name", "SELECT customer_id, company_name FROM customers"),
+    ("Top 5 customers by the total sales amount", "SELECT o.customer_id, SUM("),
+    ("show monthly sales trends", "SELECT DATE_TRUNC('month'"),
+    ("orders by country", "SELECT c.country, COUNT(o.order_id)"),
+    ("show all customers", "SELECT company_name FROM customers"),
+    ("show all products", "SELECT product_name FROM products"),
+    ("find orders from this date", "SELECT order_date FROM orders"),
+    ("how many widgets?", "SELECT 1"),
+])
+def test_stub_templates_keep_if_chain_answers(question, expected):
+    assert _stub_generate(question).startswith(expected)
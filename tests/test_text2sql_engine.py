@@ -1,4 +1,6 @@
+import asyncio
 import os
+import time
 from src.text2sql_engine import generate_sql
 from src.query_validator import sanitize_select
 from src.database import run_readonly
@@ -144,3 +146,169 @@ def test_generate_sql_environment_variables(monkeypatch):
     monkeypatch.delenv("GEMINI_API_KEY", raising=False)
     with pytest.raises(RuntimeError, match="GEMINI_API_KEY not set"):
         generate_sql("test question")
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeGenai:
+    """Stand-in for google.generativeai that records SDK usage."""
+
+    def __init__(self, answers):
+        self.answers = answers  # model name -> SQL text or Exception
+        self.configured = 0
+        self.built = []
+
+    def configure(self, api_key):
+        self.configured += 1
+
+    def GenerativeModel(self, name):
+        self.built.append(name)
+        answer = self.answers.get(name, Exception("unavailable"))
+        delay = 0.0
+        if isinstance(answer, tuple):  # (seconds, answer) simulates a slow model
+            delay, answer = answer
+
+        class _Model:
+            def generate_content(self, prompt, **kwargs):
+                time.sleep(delay)
+                if isinstance(answer, Exception):
+                    raise answer
+                return _FakeResponse(answer)
+
+            async def generate_content_async(self, prompt, **kwargs):
+                await asyncio.sleep(delay)
+                if isinstance(answer, Exception):
+                    raise answer
+                return _FakeResponse(answer)
+
+        return _Model()
+
+
+def test_gemini_generator_reuses_client_and_handles():
+    """Generator configures once and builds one handle per model."""
+    from src.text2sql_engine import GeminiGenerator
+
+    genai = _FakeGenai({"models/primary": "```SELECT 1```"})
+    gen = GeminiGenerator("key", "models/primary", genai=genai)
+    assert gen.generate("q1") == "SELECT 1"
+    assert gen.generate("q2") == "SELECT 1"
+    assert genai.configured == 1
+    assert genai.built == ["models/primary"]
+
+
+def test_gemini_generator_prompt_interpolates_question():
+    from src.text2sql_engine import GeminiGenerator, SCHEMA_HINT
+
+    gen = GeminiGenerator("key", "models/primary", genai=_FakeGenai({}))
+    prompt = gen.prompt("How many orders?")
+    assert SCHEMA_HINT in prompt
+    assert prompt.endswith("Q: How many orders?\nSQL:\n")
+    assert gen.prompt("other", schema_hint="t(a)").count("t(a)") == 1
+
+
+def test_gemini_generator_falls_back_across_models():
+    from src.text2sql_engine import GeminiGenerator, FALLBACK_MODELS
+
+    genai = _FakeGenai({FALLBACK_MODELS[-1]: "SELECT 2"})
+    gen = GeminiGenerator("key", "models/primary", genai=genai)
+    assert gen.generate("q") == "SELECT 2"
+    assert genai.built == ["models/primary", *FALLBACK_MODELS]
+
+    assert GeminiGenerator("key", "models/primary", genai=_FakeGenai({})).generate("q") is None
+
+
+def test_generate_sql_uses_shared_generator(monkeypatch):
+    """Real path goes through the long-lived generator and falls back to the stub."""
+    import src.text2sql_engine as engine
+    import src.question_cache as qc
+
+    monkeypatch.setenv("USE_GEMINI_STUB", "0")
+    monkeypatch.setenv("GEMINI_API_KEY", "fake")
+    monkeypatch.setenv("GEMINI_MODEL", "models/primary")
+    monkeypatch.setattr(qc, "_TTL", 0)  # no cache for this test
+    gen = engine.GeminiGenerator("fake", "models/primary", genai=_FakeGenai({}))
+    monkeypatch.setattr(engine, "_generator", gen)
+
+    assert engine.get_generator("fake", "models/primary") is gen
+    # every model fails -> stub answer
+    assert generate_sql("list customers by name") == engine._stub_generate("list customers by name")
+
+
+def test_generate_sql_async_stub(monkeypatch):
+    import asyncio
+    from src.text2sql_engine import generate_sql_async
+
+    monkeypatch.setenv("USE_GEMINI_STUB", "1")
+    assert asyncio.run(generate_sql_async("list customers by name")) == generate_sql("list customers by name")
+
+
+def test_gemini_generator_generate_async():
+    from src.text2sql_engine import GeminiGenerator
+
+    gen = GeminiGenerator("key", "models/primary", genai=_FakeGenai({"models/primary": "SELECT 3"}))
+    assert asyncio.run(gen.generate_async("q")) == "SELECT 3"
+
+
+def test_gemini_generator_hedges_slow_model(monkeypatch):
+    """A slow preferred model is hedged; the first valid answer wins."""
+    import src.text2sql_engine as engine
+
+    monkeypatch.setattr(engine, "GEMINI_HEDGE_DELAY_MS", 50)
+    genai = _FakeGenai({"models/primary": (2.0, "SELECT 'slow'"), engine.FALLBACK_MODELS[0]: "SELECT 'fast'"})
+    gen = engine.GeminiGenerator("key", "models/primary", genai=genai)
+
+    start = time.monotonic()
+    assert gen.generate("q") == "SELECT 'fast'"
+    assert time.monotonic() - start < 1.0
+
+    start = time.monotonic()
+    assert asyncio.run(gen.generate_async("q")) == "SELECT 'fast'"
+    assert time.monotonic() - start < 1.0
+
+
+def test_gemini_generator_respects_deadline(monkeypatch):
+    """When every model is slower than the budget, give up at the deadline."""
+    import src.text2sql_engine as engine
+
+    monkeypatch.setattr(engine, "GEMINI_HEDGE_DELAY_MS", 20)
+    slow = {name: (2.0, "SELECT 1") for name in ("models/primary", *engine.FALLBACK_MODELS)}
+    gen = engine.GeminiGenerator("key", "models/primary", genai=_FakeGenai(slow))
+    gen.deadline_s = 0.2
+
+    start = time.monotonic()
+    assert gen.generate("q") is None
+    assert asyncio.run(gen.generate_async("q")) is None
+    assert time.monotonic() - start < 1.0
+
+
+def test_gemini_generator_hedge_delay_tracks_percentile(monkeypatch):
+    import src.text2sql_engine as engine
+
+    monkeypatch.setattr(engine, "GEMINI_HEDGE_PERCENTILE", 90)
+    gen = engine.GeminiGenerator("key", "models/primary", genai=_FakeGenai({}))
+    assert gen.hedge_delay() == engine.GEMINI_HEDGE_DELAY_MS / 1000  # not warmed up
+    gen._latencies.extend(i / 100 for i in range(1, 101))
+    assert gen.hedge_delay() == 0.91
+
+
+def test_generate_sql_async_blocking_inputs_off_the_loop(monkeypatch):
+    """Schema hint (catalog introspection) and the question cache are resolved in worker threads."""
+    import threading
+    import src.text2sql_engine as engine
+
+    monkeypatch.setenv("USE_GEMINI_STUB", "0")
+    monkeypatch.setenv("GEMINI_API_KEY", "fake")
+    monkeypatch.setenv("GEMINI_MODEL", "models/primary")
+    threads = []
+    monkeypatch.setattr(engine, "default_schema_hint", lambda q=None: threads.append(threading.current_thread()) or "hint")
+    monkeypatch.setattr(engine, "cache_get", lambda key: threads.append(threading.current_thread()) or "SELECT 1")
+
+    async def run():
+        return threading.current_thread(), await engine.generate_sql_async("list customers by name")
+
+    loop_thread, sql = asyncio.run(run())
+    assert sql == "SELECT 1"
+    assert len(threads) == 2 and loop_thread not in threads